@@ -0,0 +1,106 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from array_utils import rows_for_ids
+from ann_index import IVFIndex
+
+
+def _solve_rows(fixed: np.ndarray, gram: np.ndarray, confidence: sparse.csr_matrix,
+                regularization: float) -> np.ndarray:
+    """Least-squares factors for every row of ``confidence`` against the fixed side.
+
+    Per row: (YᵀY + Yᵀ(Cᵤ - I)Y + λI) xᵤ = YᵀCᵤpᵤ, with pᵤ = 1 on observed items.
+    ``confidence`` holds Cᵤ - 1, so rows without interactions get zero vectors.
+    """
+    factors = fixed.shape[1]
+    solved = np.zeros((confidence.shape[0], factors), dtype=np.float32)
+    ridge = gram + regularization * np.eye(factors)
+    for row in range(confidence.shape[0]):
+        start, end = confidence.indptr[row], confidence.indptr[row + 1]
+        if start == end:
+            continue
+        observed = fixed[confidence.indices[start:end]]
+        extra = confidence.data[start:end]
+        lhs = ridge + (observed.T * extra) @ observed
+        rhs = observed.T @ (1.0 + extra)
+        solved[row] = np.linalg.solve(lhs, rhs)
+    return solved
+
+
+class ImplicitALS:
+    """Implicit-feedback matrix factorization (Hu, Koren & Volinsky) trained with NumPy ALS.
+
+    Confidence in a user-product pair is ``1 + alpha * weight``, where weight is
+    the summed interaction weight (PURCHASE/LIKE/VIEW scaled by rating). Only
+    item factors and their Gram matrix are kept: a user's vector is solved at
+    request time from their current interactions, so scoring is one f x f
+    solve plus one item-matrix product, whatever the user's history length.
+    With an ``ann`` index over the item factors, only the products in its
+    probed lists are scored instead of the whole item matrix.
+    """
+
+    def __init__(self, product_ids: np.ndarray, item_factors: np.ndarray, gram: Optional[np.ndarray] = None,
+                 regularization: float = 0.1, alpha: float = 10.0, ann: Optional[IVFIndex] = None):
+        self.product_ids = product_ids
+        self.item_factors = item_factors
+        self.gram = gram if gram is not None else item_factors.T @ item_factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.ann = ann
+
+    @classmethod
+    def train(cls, product_ids: np.ndarray, weights: sparse.csr_matrix, factors: int = 32,
+              regularization: float = 0.1, alpha: float = 10.0, iterations: int = 10,
+              seed: int = 0) -> 'ImplicitALS':
+        """Fit item factors to a users x products weight matrix"""
+        rng = np.random.default_rng(seed)
+        n_users, n_items = weights.shape
+        confidence = weights.astype(np.float32).tocsr()
+        confidence.data = alpha * confidence.data
+        confidence_t = confidence.T.tocsr()
+
+        user_factors = np.zeros((n_users, factors), dtype=np.float32)
+        item_factors = (rng.standard_normal((n_items, factors)) * 0.01).astype(np.float32)
+        for _ in range(iterations):
+            user_factors = _solve_rows(item_factors, item_factors.T @ item_factors, confidence, regularization)
+            item_factors = _solve_rows(user_factors, user_factors.T @ user_factors, confidence_t, regularization)
+        return cls(product_ids, item_factors, regularization=regularization, alpha=alpha)
+
+    def user_vector(self, product_weights: Dict[int, float]) -> Optional[np.ndarray]:
+        """Fold a user's (product_id -> weight) interactions into a factor vector"""
+        rows = rows_for_ids(self.product_ids, product_weights)
+        weights = np.fromiter(product_weights.values(), dtype=np.float32, count=len(product_weights))
+        known = rows >= 0
+        if not known.any():
+            return None
+        confidence = sparse.csr_matrix(
+            (self.alpha * weights[known], (np.zeros(known.sum(), dtype=np.int64), rows[known])),
+            shape=(1, len(self.product_ids))
+        )
+        return _solve_rows(self.item_factors, self.gram, confidence, self.regularization)[0]
+
+    def recommend(self, product_weights: Dict[int, float], exclude_products: Set[int],
+                  limit: int) -> List[Tuple[int, float]]:
+        """Top (product_id, predicted preference) pairs with a positive score"""
+        vector = self.user_vector(product_weights)
+        if vector is None or limit <= 0:
+            return []
+
+        if self.ann is not None:
+            return [
+                (product_id, score)
+                for product_id, score in self.ann.search(vector, limit, exclude=exclude_products)
+                if score > 0
+            ]
+
+        scores = self.item_factors @ vector
+        excluded = rows_for_ids(self.product_ids, exclude_products)
+        scores[excluded[excluded >= 0]] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(self.product_ids[col]), float(scores[col])) for col in candidates]
@@ -0,0 +1,220 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+PARAMS_NAME = 'params.json'
+
+
+def dense(matrix) -> np.ndarray:
+    """A dense float32 copy of a dense or sparse matrix"""
+    if sparse.issparse(matrix):
+        matrix = matrix.toarray()
+    return np.asarray(matrix, dtype=np.float32)
+
+
+def _normalize(rows: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    return rows / np.where(norms > 0, norms, 1.0)
+
+
+def _stack(top, bottom):
+    if sparse.issparse(top) or sparse.issparse(bottom):
+        return sparse.vstack([top, bottom], format='csr', dtype=np.float32)
+    return np.vstack([top, bottom])
+
+
+def _nearest_lists(vectors, centroids: np.ndarray, chunk_rows: int = 4096) -> np.ndarray:
+    """Index of the best-scoring centroid for every row, a block of rows at a time"""
+    lists = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], chunk_rows):
+        end = min(start + chunk_rows, vectors.shape[0])
+        lists[start:end] = np.argmax(dense(vectors[start:end] @ centroids.T), axis=1)
+    return lists
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbor index over product vectors.
+
+    Vectors are grouped into ``n_lists`` lists by spherical k-means, and stored
+    contiguously per list. A search scores exactly only the vectors in the
+    ``nprobe`` lists whose centroids score highest against the query, so
+    ``nprobe`` trades recall for latency (``nprobe == n_lists`` is exact).
+    Scores are inner products, i.e. cosine similarity for L2-normalized
+    vectors. Works with dense arrays or sparse CSR rows (e.g. TF-IDF).
+
+    ``add`` assigns new vectors to the existing lists and keeps them in a
+    small side buffer, without re-clustering; ``build`` again to re-balance.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, ids: np.ndarray, vectors,
+                 nprobe: int = 8, extra_ids: Optional[np.ndarray] = None,
+                 extra_lists: Optional[np.ndarray] = None, extra_vectors=None):
+        self.centroids = centroids
+        # ids[list_offsets[l]:list_offsets[l + 1]] are the members of list l
+        self.list_offsets = list_offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.nprobe = nprobe
+        self.extra_ids = extra_ids if extra_ids is not None else np.empty(0, dtype=np.int64)
+        self.extra_lists = extra_lists if extra_lists is not None else np.empty(0, dtype=np.int32)
+        self.extra_vectors = extra_vectors
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.extra_ids)
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, ids: Iterable[int], vectors, n_lists: Optional[int] = None, nprobe: int = 8,
+              iterations: int = 10, sample_size: int = 100000, seed: int = 0) -> 'IVFIndex':
+        """Cluster vectors (one row per id) and lay them out by list; ``n_lists`` defaults to sqrt(N)"""
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype=np.int64)
+        if sparse.issparse(vectors):
+            vectors = sparse.csr_matrix(vectors, dtype=np.float32)
+        else:
+            vectors = np.asarray(vectors, dtype=np.float32)
+        n = vectors.shape[0]
+        if n == 0:
+            raise ValueError("Cannot build an index without vectors")
+        n_lists = min(n_lists or max(1, int(np.sqrt(n))), n)
+
+        # Spherical k-means on a sample
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(n, min(n, sample_size), replace=False))]
+        centroids = _normalize(dense(sample[np.sort(rng.choice(sample.shape[0], n_lists, replace=False))]))
+        for _ in range(iterations):
+            assignment = _nearest_lists(sample, centroids)
+            members = sparse.csr_matrix(
+                (np.ones(len(assignment), dtype=np.float32), (assignment, np.arange(len(assignment)))),
+                shape=(n_lists, len(assignment))
+            )
+            sums = dense(members @ sample)
+            empty = np.asarray(members.sum(axis=1)).ravel() == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        lists = _nearest_lists(vectors, centroids)
+        order = np.argsort(lists, kind='stable')
+        offsets = np.searchsorted(lists[order], np.arange(n_lists + 1)).astype(np.int64)
+        return cls(centroids, offsets, ids[order], vectors[order], nprobe=nprobe)
+
+    def add(self, ids: Iterable[int], vectors):
+        """Add vectors for new ids to their nearest existing lists"""
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype=np.int64)
+        if not len(ids):
+            return
+        if sparse.issparse(vectors):
+            vectors = sparse.csr_matrix(vectors, dtype=np.float32)
+        else:
+            vectors = np.asarray(vectors, dtype=np.float32)
+        lists = _nearest_lists(vectors, self.centroids)
+        self.extra_ids = np.concatenate([self.extra_ids, ids])
+        self.extra_lists = np.concatenate([self.extra_lists, lists])
+        self.extra_vectors = vectors if self.extra_vectors is None else _stack(self.extra_vectors, vectors)
+
+    def probe(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Lists whose centroids score highest against a dense query vector"""
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        scores = self.centroids @ query
+        if nprobe >= self.n_lists:
+            return np.arange(self.n_lists)
+        return np.argpartition(-scores, nprobe - 1)[:nprobe]
+
+    def search(self, query, k: int, nprobe: Optional[int] = None,
+               exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Approximate top-k (id, score) pairs for one query vector, best first"""
+        query = dense(query).ravel()
+        lists = self.probe(query, nprobe)
+
+        candidate_ids, candidate_scores = [], []
+        for list_index in lists:
+            start, end = self.list_offsets[list_index], self.list_offsets[list_index + 1]
+            if start < end:
+                candidate_ids.append(self.ids[start:end])
+                candidate_scores.append(np.asarray(self.vectors[start:end] @ query).ravel())
+        if len(self.extra_ids):
+            extra = np.flatnonzero(np.isin(self.extra_lists, lists))
+            if len(extra):
+                candidate_ids.append(self.extra_ids[extra])
+                candidate_scores.append(np.asarray(self.extra_vectors[extra] @ query).ravel())
+        if not candidate_ids or k <= 0:
+            return []
+
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        exclude = np.fromiter(exclude, dtype=np.int64)
+        if len(exclude):
+            keep = ~np.isin(ids, exclude)
+            ids, scores = ids[keep], scores[keep]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return list(zip(ids[order].tolist(), scores[order].tolist()))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Flatten the index into named arrays (sparse vectors as CSR parts)"""
+        arrays = {
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'ids': self.ids,
+            'extra_ids': self.extra_ids,
+            'extra_lists': self.extra_lists,
+        }
+        vectors = self.vectors
+        if len(self.extra_ids):
+            vectors = _stack(vectors, self.extra_vectors)
+        if sparse.issparse(vectors):
+            arrays.update({
+                'vectors_data': vectors.data,
+                'vectors_indices': vectors.indices,
+                'vectors_indptr': vectors.indptr,
+            })
+        else:
+            arrays['vectors'] = vectors
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], nprobe: int = 8) -> 'IVFIndex':
+        """Rebuild an index from ``to_arrays`` output; arrays may be memory-mapped"""
+        n_main = len(arrays['ids'])
+        n_total = n_main + len(arrays['extra_ids'])
+        if 'vectors' in arrays:
+            vectors = arrays['vectors']
+        else:
+            vectors = sparse.csr_matrix(
+                (arrays['vectors_data'], arrays['vectors_indices'], arrays['vectors_indptr']),
+                shape=(n_total, arrays['centroids'].shape[1])
+            )
+        extra_vectors = vectors[n_main:] if n_total > n_main else None
+        return cls(
+            arrays['centroids'], arrays['list_offsets'], arrays['ids'], vectors[:n_main],
+            nprobe=nprobe,
+            extra_ids=arrays['extra_ids'],
+            extra_lists=arrays['extra_lists'],
+            extra_vectors=extra_vectors,
+        )
+
+    def save(self, directory: str):
+        """Write the index as one ``.npy`` file per array plus its parameters"""
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self.to_arrays().items():
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(directory, PARAMS_NAME), 'w', encoding='utf-8') as file:
+            json.dump({'nprobe': self.nprobe}, file)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'IVFIndex':
+        """Load an index written by ``save``, memory-mapped unless ``mmap`` is False"""
+        with open(os.path.join(directory, PARAMS_NAME), encoding='utf-8') as file:
+            params = json.load(file)
+        arrays = {
+            name[:-len('.npy')]: np.load(os.path.join(directory, name), mmap_mode='r' if mmap else None)
+            for name in os.listdir(directory) if name.endswith('.npy')
+        }
+        return cls.from_arrays(arrays, **params)
@@ -0,0 +1,17 @@
+from typing import Iterable
+
+import numpy as np
+
+
+def rows_for_ids(sorted_ids: np.ndarray, ids: Iterable[int]) -> np.ndarray:
+    """Positions of ``ids`` in the ascending ``sorted_ids`` array, -1 where absent.
+
+    Lets id -> row lookups run directly on (possibly memory-mapped) id arrays
+    instead of per-process dicts.
+    """
+    ids = np.fromiter(ids, dtype=np.int64)
+    if len(sorted_ids) == 0 or len(ids) == 0:
+        return np.full(len(ids), -1, dtype=np.int64)
+    rows = np.searchsorted(sorted_ids, ids)
+    rows[rows >= len(sorted_ids)] = 0
+    return np.where(sorted_ids[rows] == ids, rows, -1)
@@ -0,0 +1,171 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from auth import verify_token
+from catalog import CatalogVersionCache, catalog_headers, not_modified, set_next_cursor
+from product_cache import CatalogCache
+from serialization import JSONBytesResponse, products_json, recommendations_json
+from database import get_async_db, get_db
+from models import User
+from recommendation_cache import RecommendationCache
+from recommendation_engine import RecommendationEngine
+from schemas import ProductResponse, RecommendationResponse, UserResponse
+from user_cache import AuthenticatedUserCache
+
+security = HTTPBearer()
+
+
+def current_user_dependency(user_cache: Optional[AuthenticatedUserCache] = None):
+    """Async dependency resolving the bearer token's user, through ``user_cache`` when given"""
+    async def get_current_user_async(credentials: HTTPAuthorizationCredentials = Depends(security),
+                                     db: AsyncSession = Depends(get_async_db)) -> UserResponse:
+        """Get current authenticated user without blocking a threadpool worker"""
+        token = credentials.credentials
+        if user_cache is not None:
+            cached = user_cache.get(token)
+            if cached is not None:
+                return cached
+
+        payload = verify_token(token)
+        if payload is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials"
+            )
+
+        user = await db.get(User, int(payload["sub"]))
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
+        identity = UserResponse.from_orm(user)
+        if user_cache is not None:
+            user_cache.put(token, identity, payload.get("exp"))
+        return identity
+
+    return get_current_user_async
+
+
+def create_async_router(recommendation_engine: RecommendationEngine,
+                        recommendation_cache: RecommendationCache,
+                        user_cache: Optional[AuthenticatedUserCache] = None,
+                        catalog_cache: Optional[CatalogCache] = None) -> APIRouter:
+    """Async versions of the read endpoints, served on the event loop with AsyncSession.
+
+    Include it before the sync routes so it takes their paths. Recommendation
+    cache hits are read asynchronously; misses run the (CPU-bound) engine on
+    the threadpool with an ordinary session, which its background model
+    rebuilds also need. Catalog reads are served from ``catalog_cache``,
+    which only reaches the database on a miss.
+
+    Only code that never holds a ``threading`` lock across a query may run
+    under ``run_sync``: it runs on the event-loop thread, so a second
+    coroutine waiting on the lock would stall the query holding it.
+    """
+    router = APIRouter()
+    get_current_user_async = current_user_dependency(user_cache)
+    catalog_cache = catalog_cache or CatalogCache(CatalogVersionCache())
+
+    @router.get("/products", response_model=List[ProductResponse])
+    async def get_products(
+        request: Request,
+        category: Optional[str] = None,
+        cursor: Optional[int] = None,
+        skip: int = 0,
+        limit: int = 50,
+        db: AsyncSession = Depends(get_async_db)
+    ):
+        """Get products with optional category filtering, keyset-paginated by id"""
+        state = await db.run_sync(catalog_cache.state)
+        unchanged = not_modified(request, state)
+        if unchanged is not None:
+            return unchanged
+
+        body, next_cursor = await db.run_sync(
+            lambda session: catalog_cache.page_json(session, category, cursor, skip, limit)
+        )
+        response = Response(body, media_type="application/json", headers=catalog_headers(state))
+        if next_cursor is not None:
+            set_next_cursor(request, response, next_cursor)
+        return response
+
+    @router.get("/products/popular", response_model=List[ProductResponse])
+    async def get_popular_products(
+        category: Optional[str] = None,
+        limit: int = 10,
+        sync_db: Session = Depends(get_db)
+    ):
+        """Get trending products, overall or within a category"""
+        # The first call loads popularity counts under a threading lock, so it stays off the loop
+        def popular():
+            products = recommendation_engine.get_popular_products(sync_db, limit, category)
+            return products_json(products, catalog_cache.get_many_json((p.id for p in products), sync_db))
+
+        return JSONBytesResponse(await run_in_threadpool(popular))
+
+    @router.get("/products/{product_id}", response_model=ProductResponse)
+    async def get_product(product_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+        """Get specific product by ID"""
+        state = await db.run_sync(catalog_cache.state)
+        unchanged = not_modified(request, state)
+        if unchanged is not None:
+            return unchanged
+
+        product = await db.run_sync(lambda session: catalog_cache.product_json(product_id, session))
+        if product is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
+        return Response(product, media_type="application/json", headers=catalog_headers(state))
+
+    @router.get("/recommendations", response_model=List[RecommendationResponse])
+    async def get_recommendations(
+        current_user: UserResponse = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db),
+        sync_db: Session = Depends(get_db),
+        limit: int = 10
+    ):
+        """Get AI-powered product recommendations for user"""
+        user_id = current_user.id
+        def serialize(recommendations, session):
+            product_json = catalog_cache.get_many_json((rec.product.id for rec in recommendations), session)
+            return recommendations_json(recommendations, product_json)
+
+        def cached(session):
+            recommendations = recommendation_cache.get(user_id, limit, session)
+            return serialize(recommendations, session) if recommendations is not None else None
+
+        body = await db.run_sync(cached)
+        if body is not None:
+            return JSONBytesResponse(body)
+
+        def compute():
+            depth = max(limit, recommendation_cache.depth)
+            # Fallback results from before the first model build are not cached
+            models_ready = recommendation_engine.snapshot is not None
+            recommendations = recommendation_engine.get_recommendations(user_id=user_id, db=sync_db, limit=depth)
+            if models_ready:
+                recommendation_cache.put(user_id, recommendations, depth, sync_db)
+            return serialize(recommendations[:limit], sync_db)
+
+        return JSONBytesResponse(await run_in_threadpool(compute))
+
+    @router.get("/categories")
+    async def get_categories(request: Request, db: AsyncSession = Depends(get_async_db)):
+        """Get all product categories"""
+        state = await db.run_sync(catalog_cache.state)
+        unchanged = not_modified(request, state)
+        if unchanged is not None:
+            return unchanged
+
+        return Response(await db.run_sync(catalog_cache.categories_json), media_type="application/json",
+                        headers=catalog_headers(state))
+
+    return router
@@ -1,8 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Dict, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,8 +12,10 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# bcrypt cost factor: each step doubles the work per hash (lower it in test environments)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -21,6 +25,59 @@ def get_password_hash(password: str) -> str:
     """Generate password hash"""
     return pwd_context.hash(password)
 
+class PasswordHashingBusy(Exception):
+    """Raised when the password hashing pool is saturated"""
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool with a bounded backlog.
+
+    bcrypt releases the GIL, so threads give real parallelism without the
+    pickling of a process pool. At most ``workers + max_pending`` calls are
+    admitted at once; the rest fail fast with PasswordHashingBusy, so a login
+    burst cannot tie up the request threads serving the catalog.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 8):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def run(self, function: Callable, *args):
+        """Run ``function`` on the pool and wait for its result, or raise PasswordHashingBusy"""
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_pending:
+                self._rejected += 1
+                raise PasswordHashingBusy()
+            self._in_flight += 1
+            self._admitted += 1
+        try:
+            return self._executor.submit(function, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def hash(self, password: str) -> str:
+        """Generate password hash on the pool"""
+        return self.run(get_password_hash, password)
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash on the pool"""
+        return self.run(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> Dict[str, int]:
+        """Calls currently admitted, and totals admitted and rejected"""
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'capacity': self.workers + self.max_pending,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+            }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
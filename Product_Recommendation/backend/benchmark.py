@@ -0,0 +1,320 @@
+"""Latency, SQL and memory benchmark for get_recommendations on synthetic data.
+
+Generates a synthetic SQLite database (see synthetic_data.py) unless it
+already has data, then measures every engine stage, response serialization (the
+``response_model`` path against pre-serialized bytes) and the HTTP endpoint for
+a sample of users: p50/p95/p99 latency, SQL statements per call and peak
+allocated memory, plus process peak RSS. Results are written as JSON;
+``--baseline`` compares p95 latencies with an earlier run and exits non-zero on
+regressions beyond ``--tolerance``.
+
+    python benchmark.py --users 2000 --products 20000 --interactions 200000 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from auth import create_access_token
+from database import Base, configure_engine, get_db
+from models import User, UserInteraction
+from recommendation_engine import RecommendationEngine, COLLABORATIVE_MODES
+from synthetic_data import generate_synthetic_data
+
+
+class _StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _summarize(latencies: List[float], statements: List[int], peak_alloc: int) -> Dict:
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return {
+        'calls': len(latencies),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'mean_ms': float(latencies_ms.mean()),
+        'sql_per_call': float(np.mean(statements)),
+        'peak_alloc_bytes': peak_alloc,
+    }
+
+
+def measure(call: Callable[[object], object], arguments: List, bind, memory_samples: int = 5,
+            setup: Optional[Callable[[object], object]] = None) -> Dict:
+    """Time ``call`` once per argument, counting SQL statements; then trace memory on a few.
+
+    ``setup`` runs before each call, outside the measurement. One untimed call
+    first absorbs one-off loading (e.g. popularity counts).
+    """
+    if not arguments:
+        return {'calls': 0}
+    if setup is not None:
+        setup(arguments[0])
+    call(arguments[0])
+    latencies, statements = [], []
+    counter = _StatementCounter()
+    event.listen(bind, "before_cursor_execute", counter)
+    try:
+        for argument in arguments:
+            if setup is not None:
+                setup(argument)
+            counter.count = 0
+            started = time.perf_counter()
+            call(argument)
+            latencies.append(time.perf_counter() - started)
+            statements.append(counter.count)
+    finally:
+        event.remove(bind, "before_cursor_execute", counter)
+
+    # A separate pass, since tracing allocations slows the timed calls down
+    peak_alloc = 0
+    for argument in arguments[:memory_samples]:
+        if setup is not None:
+            setup(argument)
+        tracemalloc.start()
+        try:
+            call(argument)
+            peak_alloc = max(peak_alloc, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    summary = _summarize(latencies, statements, peak_alloc)
+    # Process-wide high-water mark once this stage has run
+    summary['peak_rss_bytes'] = _peak_rss_bytes()
+    return summary
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(database_url: str, users: int = 1000, products: int = 5000, interactions: int = 100000,
+                  samples: int = 200, collaborative_mode: str = 'sparse', als_weight: float = 0.0,
+                  include_http: bool = True, seed: int = 0) -> Dict:
+    """Generate data if needed, then benchmark model build, engine stages and the endpoint"""
+    bind = configure_engine(create_engine(database_url))
+    sessions = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+    Base.metadata.create_all(bind=bind)
+
+    db = sessions()
+    try:
+        if db.query(User.id).first() is None:
+            generate_synthetic_data(db, users, products, interactions, seed=seed)
+        counts = {
+            'users': db.query(User).count(),
+            'interactions': db.query(UserInteraction).count(),
+        }
+        rng = np.random.default_rng(seed)
+        user_ids = [user_id for user_id, in db.query(User.id)]
+        sample = [int(user_id) for user_id in rng.choice(user_ids, min(samples, len(user_ids)), replace=False)]
+
+        engine = RecommendationEngine(collaborative_mode=collaborative_mode, als_weight=als_weight)
+        started = time.perf_counter()
+        snapshot = engine.rebuild(db)
+        results = {'build_seconds': time.perf_counter() - started}
+
+        histories = {
+            user_id: db.query(UserInteraction).filter(UserInteraction.user_id == user_id).all()
+            for user_id in sample
+        }
+        limit = 10
+        stages = {
+            'user_interactions': lambda user_id: db.query(UserInteraction).filter(
+                UserInteraction.user_id == user_id).all(),
+            'collaborative': lambda user_id: engine._get_collaborative_recommendations(
+                user_id, db, limit // 2, histories[user_id], snapshot),
+            'content_based': lambda user_id: engine._get_content_based_recommendations(
+                user_id, db, limit // 2, histories[user_id], snapshot),
+            'popular': lambda user_id: engine._get_popular_products(db, limit // 2),
+            'get_recommendations': lambda user_id: engine.get_recommendations(user_id, db, limit),
+        }
+        if als_weight > 0:
+            stages['matrix_factorization'] = lambda user_id: engine._get_als_recommendations(
+                user_id, db, limit // 2, histories[user_id], snapshot)
+        results['stages'] = {name: measure(call, sample, bind) for name, call in stages.items()}
+        results['serialization'] = _benchmark_serialization(engine, db, bind, sample)
+    finally:
+        db.close()
+
+    if include_http:
+        results['http'] = _benchmark_http(sessions, bind, sample, collaborative_mode, als_weight)
+
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'database': bind.dialect.name,
+            'collaborative_mode': collaborative_mode,
+            'als_weight': als_weight,
+            'samples': len(sample),
+            **counts,
+        },
+        'results': results,
+        'peak_rss_bytes': _peak_rss_bytes(),
+    }
+
+
+def _benchmark_serialization(engine: RecommendationEngine, db, bind, user_ids: List[int],
+                             limit: int = 50) -> Dict:
+    """The response_model path against the pre-serialized bytes path, on each user's recommendations"""
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from schemas import ProductResponse, RecommendationResponse
+    from serialization import products_json, recommendations_json
+
+    recommendations = {user_id: engine.get_recommendations(user_id, db, limit) for user_id in user_ids}
+    products = {user_id: [rec.product for rec in recs] for user_id, recs in recommendations.items()}
+    recommendation_list = TypeAdapter(List[RecommendationResponse])
+    product_list = TypeAdapter(List[ProductResponse])
+
+    # What FastAPI does with a returned list: validate against response_model, encode, dump
+    def response_model(adapter, items):
+        return json.dumps(jsonable_encoder(adapter.validate_python(items))).encode()
+
+    def cached_json(items):
+        return engine.product_cache.get_many_json((product.id for product in items), db)
+
+    return {
+        'recommendations_response_model': measure(
+            lambda user_id: response_model(recommendation_list, recommendations[user_id]), user_ids, bind),
+        'recommendations_fast': measure(
+            lambda user_id: recommendations_json(recommendations[user_id],
+                                                 cached_json(rec.product for rec in recommendations[user_id])),
+            user_ids, bind),
+        'products_response_model': measure(
+            lambda user_id: response_model(product_list, products[user_id]), user_ids, bind),
+        'products_fast': measure(
+            lambda user_id: products_json(products[user_id], cached_json(products[user_id])), user_ids, bind),
+    }
+
+
+def _benchmark_http(sessions, bind, user_ids: List[int], collaborative_mode: str, als_weight: float) -> Dict:
+    """GET /recommendations through the ASGI app, computed (cache cleared) and cached"""
+    from fastapi.testclient import TestClient
+    import main
+
+    def override_get_db():
+        db = sessions()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    previous_engine = main.recommendation_engine
+    previous_override = main.app.dependency_overrides.get(get_db)
+    main.app.dependency_overrides[get_db] = override_get_db
+    main.recommendation_engine = RecommendationEngine(collaborative_mode=collaborative_mode, als_weight=als_weight)
+    db = sessions()
+    try:
+        main.recommendation_engine.rebuild(db)
+    finally:
+        db.close()
+
+    headers = {user_id: {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+               for user_id in user_ids}
+    try:
+        with TestClient(main.app) as client:
+            def forget(user_id):
+                db = sessions()
+                try:
+                    main.recommendation_cache.invalidate(user_id, db)
+                    db.commit()
+                finally:
+                    db.close()
+
+            def get(user_id):
+                response = client.get("/recommendations", headers=headers[user_id])
+                response.raise_for_status()
+
+            return {
+                'recommendations_computed': measure(get, user_ids, bind, setup=forget),
+                'recommendations_cached': measure(get, user_ids, bind),
+            }
+    finally:
+        if previous_override is None:
+            main.app.dependency_overrides.pop(get_db, None)
+        else:
+            main.app.dependency_overrides[get_db] = previous_override
+        main.recommendation_engine = previous_engine
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """p95 latencies that grew by more than ``tolerance`` (a fraction) over the baseline"""
+    regressions = []
+    for section in ('stages', 'serialization', 'http'):
+        for name, stats in current['results'].get(section, {}).items():
+            before = baseline['results'].get(section, {}).get(name)
+            if not before or 'p95_ms' not in before or 'p95_ms' not in stats:
+                continue
+            if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{section}.{name}: p95 {before['p95_ms']:.2f}ms -> {stats['p95_ms']:.2f}ms")
+    return regressions
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark recommendations on synthetic data")
+    parser.add_argument("--database-url", default="sqlite:///./benchmark.db")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--interactions", type=int, default=100000)
+    parser.add_argument("--samples", type=int, default=200, help="users measured per stage")
+    parser.add_argument("--collaborative-mode", choices=COLLABORATIVE_MODES, default="sparse")
+    parser.add_argument("--als-weight", type=float, default=0.0)
+    parser.add_argument("--no-http", action="store_true", help="skip the endpoint benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare p95 latencies with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        args.database_url, args.users, args.products, args.interactions,
+        samples=args.samples,
+        collaborative_mode=args.collaborative_mode,
+        als_weight=args.als_weight,
+        include_http=not args.no_http,
+        seed=args.seed
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
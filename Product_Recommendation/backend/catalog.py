@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, NamedTuple, Optional, Union
+
+from fastapi import Request, Response, status
+from sqlalchemy import event, insert, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import CatalogVersion
+
+CATALOG_VERSION_ID = 1
+
+
+class CatalogState(NamedTuple):
+    """Catalog version counter and when it last changed"""
+    version: int
+    updated_at: Optional[datetime]
+
+    @property
+    def etag(self) -> str:
+        return f'"catalog-{self.version}"'
+
+
+def bump_catalog_version(db: Union[Session, Connection]):
+    """Record a catalog change in the current transaction (caller commits).
+
+    Called automatically for ORM writes to watched models; bulk ``insert`` /
+    ``update`` statements on products must call it themselves.
+    """
+    now = datetime.utcnow()
+    result = db.execute(
+        update(CatalogVersion)
+        .where(CatalogVersion.id == CATALOG_VERSION_ID)
+        .values(version=CatalogVersion.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        db.execute(insert(CatalogVersion).values(id=CATALOG_VERSION_ID, version=1, updated_at=now))
+    if isinstance(db, Session):
+        # Lets CatalogVersionCache.watch re-read the version once this commits
+        db.info['catalog_changed'] = True
+
+
+class CatalogVersionCache:
+    """Per-process view of the catalog version, re-read at most once per ``ttl`` seconds.
+
+    The counter lives in the database, so every worker agrees on it; a write
+    in this process is visible here as soon as it commits, and writes in
+    other processes within ``ttl``.
+    """
+
+    def __init__(self, ttl: float = 1.0):
+        self.ttl = ttl
+        self._state: Optional[CatalogState] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self, db: Session) -> CatalogState:
+        """The catalog version, from memory unless older than the TTL"""
+        now = time.time()
+        with self._lock:
+            if self._state is not None and now - self._loaded_at <= self.ttl:
+                return self._state
+        row = db.get(CatalogVersion, CATALOG_VERSION_ID, populate_existing=True)
+        state = CatalogState(row.version, row.updated_at) if row is not None else CatalogState(0, None)
+        with self._lock:
+            self._state, self._loaded_at = state, now
+        return state
+
+    def invalidate(self):
+        """Re-read on next use"""
+        with self._lock:
+            self._state = None
+
+    def watch(self, model):
+        """Bump the version on every flush that writes ``model`` rows, and re-read after commit"""
+        def after_flush(session, flush_context):
+            changed = session.new | session.dirty | session.deleted
+            if any(isinstance(instance, model) for instance in changed):
+                bump_catalog_version(session.connection())
+                session.info['catalog_changed'] = True
+
+        def after_commit(session):
+            if session.info.pop('catalog_changed', False):
+                self.invalidate()
+
+        def after_rollback(session):
+            session.info.pop('catalog_changed', None)
+
+        event.listen(Session, 'after_flush', after_flush)
+        event.listen(Session, 'after_commit', after_commit)
+        event.listen(Session, 'after_rollback', after_rollback)
+
+
+def catalog_headers(state: CatalogState) -> Dict[str, str]:
+    """Validators for responses derived from the catalog"""
+    headers = {'ETag': state.etag, 'Cache-Control': 'no-cache'}
+    if state.updated_at is not None:
+        headers['Last-Modified'] = format_datetime(state.updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified(request: Request, state: CatalogState) -> Optional[Response]:
+    """A 304 response if the client's validators still match the catalog, else None"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        matched = '*' in tags or state.etag in tags
+    else:
+        if_modified_since = request.headers.get('if-modified-since')
+        if if_modified_since is None or state.updated_at is None:
+            return None
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        # HTTP dates have whole-second resolution
+        modified = state.updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+        matched = since.tzinfo is not None and modified <= since
+    if not matched:
+        return None
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=catalog_headers(state))
+
+
+def set_next_cursor(request: Request, response: Response, last_id: int):
+    """Point the client at the keyset page after the one ending with ``last_id``"""
+    next_url = request.url.remove_query_params('skip').include_query_params(cursor=last_id)
+    response.headers['X-Next-Cursor'] = str(last_id)
+    response.headers['Link'] = f'<{next_url}>; rel="next"'
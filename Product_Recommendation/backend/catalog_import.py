@@ -0,0 +1,174 @@
+"""Streaming bulk import of a product catalog from JSON, JSONL or CSV.
+
+Records are read a chunk at a time and upserted by product name: names
+already in the catalog are updated in bulk (only when a field changed), new
+names are bulk-inserted. Memory stays flat whatever the file size, and
+re-running an import only writes what changed.
+
+    python catalog_import.py catalog.jsonl --chunk-size 5000
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from itertools import islice
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from catalog import bump_catalog_version
+from data_utils import iter_json_records
+from models import Product
+
+FORMATS = ('json', 'jsonl', 'csv')
+# Imported fields, in the order rows are compared
+FIELDS = ('name', 'category', 'price', 'description', 'rating', 'rating_count', 'image_url')
+
+
+def iter_jsonl_records(file: IO[str]) -> Iterator[Dict]:
+    """One JSON object per non-empty line"""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_csv_records(file: IO[str]) -> Iterator[Dict]:
+    """Rows of a CSV file with a header line; empty cells become None"""
+    for row in csv.DictReader(file):
+        yield {field: value if value != '' else None for field, value in row.items()}
+
+
+def detect_format(path: str) -> str:
+    """Catalog format from the file extension"""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension == 'ndjson':
+        return 'jsonl'
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown catalog format: {path}")
+    return extension
+
+
+def iter_catalog(file: IO[str], format: str) -> Iterator[Dict]:
+    """Records of an open catalog file in the given format"""
+    if format == 'json':
+        return iter_json_records(file)
+    if format == 'jsonl':
+        return iter_jsonl_records(file)
+    if format == 'csv':
+        return iter_csv_records(file)
+    raise ValueError(f"Unknown catalog format: {format}")
+
+
+def product_row(record: Dict) -> Dict:
+    """A products row from one record; raises ValueError or TypeError for unusable records"""
+    name, category, price = record.get('name'), record.get('category'), record.get('price')
+    if not name or not category or price is None:
+        raise ValueError("name, category and price are required")
+    rating, rating_count = record.get('rating'), record.get('rating_count')
+    return {
+        'name': str(name),
+        'category': str(category),
+        'price': float(price),
+        'description': record.get('description'),
+        'rating': float(rating) if rating is not None else 0.0,
+        'rating_count': int(float(rating_count)) if rating_count is not None else 0,
+        'image_url': record.get('image_url'),
+    }
+
+
+def _chunks(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_catalog(db: Session, records: Iterable[Dict], chunk_size: int = 5000,
+                   progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Upsert products by name, a chunk per transaction; returns counts and rows per second"""
+    stats = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+    started = time.perf_counter()
+
+    for chunk in _chunks(records, chunk_size):
+        stats['read'] += len(chunk)
+        # The last record of a name within a chunk wins
+        rows: Dict[str, Dict] = {}
+        for record in chunk:
+            try:
+                row = product_row(record)
+            except (ValueError, TypeError):
+                stats['rejected'] += 1
+                continue
+            rows[row['name']] = row
+
+        existing = db.query(Product.id, *(getattr(Product, field) for field in FIELDS)).filter(
+            Product.name.in_(list(rows))
+        ).all() if rows else []
+        updates, seen = [], set()
+        for product_id, *values in existing:
+            row = rows[values[0]]
+            seen.add(values[0])
+            if tuple(values) == tuple(row[field] for field in FIELDS):
+                stats['unchanged'] += 1
+            else:
+                updates.append({'id': product_id, **row})
+        inserts = [row for name, row in rows.items() if name not in seen]
+
+        if updates:
+            db.execute(update(Product), updates)
+        if inserts:
+            db.execute(insert(Product), inserts)
+        if updates or inserts:
+            # Bulk statements bypass the session hook that versions the catalog
+            bump_catalog_version(db)
+        db.commit()
+        stats['updated'] += len(updates)
+        stats['inserted'] += len(inserts)
+        if progress is not None:
+            progress(dict(stats, seconds=time.perf_counter() - started))
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_second'] = stats['read'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return stats
+
+
+def import_catalog_file(db: Session, path: str, format: Optional[str] = None, chunk_size: int = 5000,
+                        progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Stream a catalog file into the products table"""
+    format = format or detect_format(path)
+    # CSV needs newline='' so quoted fields may contain line breaks
+    with open(path, encoding='utf-8', newline='' if format == 'csv' else None) as file:
+        return import_catalog(db, iter_catalog(file, format), chunk_size, progress)
+
+
+def main(argv: Optional[list] = None):
+    from database import SessionLocal, create_tables
+
+    parser = argparse.ArgumentParser(description="Stream a product catalog into the database")
+    parser.add_argument("path", help="catalog file (.json, .jsonl/.ndjson or .csv)")
+    parser.add_argument("--format", choices=FORMATS, help="override the format implied by the extension")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="records per bulk statement and transaction")
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        rate = stats['read'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        print(f"{stats['read']} read, {stats['inserted']} inserted, {stats['updated']} updated "
+              f"({rate:.0f} rows/s)", flush=True)
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        stats = import_catalog_file(db, args.path, args.format, args.chunk_size, progress=report)
+    finally:
+        db.close()
+    print(f"Imported {stats['read']} records in {stats['seconds']:.1f}s ({stats['rows_per_second']:.0f} rows/s): "
+          f"{stats['inserted']} inserted, {stats['updated']} updated, {stats['unchanged']} unchanged, "
+          f"{stats['rejected']} rejected")
+
+
+if __name__ == "__main__":
+    main()
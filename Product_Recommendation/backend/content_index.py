@@ -0,0 +1,154 @@
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from array_utils import rows_for_ids
+from ann_index import IVFIndex, dense
+
+
+def _top_k_columns(block: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per row, the columns of the k highest positive scores (-1 padded) and their scores, best first"""
+    k_block = min(k, block.shape[1])
+    top = np.argpartition(-block, k_block - 1, axis=1)[:, :k_block]
+    top_sims = np.take_along_axis(block, top, axis=1)
+    order = np.argsort(-top_sims, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_sims = np.take_along_axis(top_sims, order, axis=1)
+
+    positive = top_sims > 0
+    columns = np.full((block.shape[0], k), -1, dtype=np.int64)
+    scores = np.zeros((block.shape[0], k), dtype=np.float32)
+    columns[:, :k_block] = np.where(positive, top, -1)
+    scores[:, :k_block] = np.where(positive, top_sims, 0.0)
+    return columns, scores
+
+
+class ContentSimilarityIndex:
+    """Top-K most similar products per product, stored in compact arrays.
+
+    ``neighbors[row]`` holds the row numbers of the K most similar products
+    (int32, -1 where there are fewer than K with positive similarity) and
+    ``similarities[row]`` the matching cosine similarities (float32), sorted
+    in descending order. Rows follow ``product_ids``, which are ascending.
+    """
+
+    def __init__(self, product_ids: np.ndarray, neighbors: np.ndarray, similarities: np.ndarray):
+        self.product_ids = product_ids
+        self.neighbors = neighbors
+        self.similarities = similarities
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    @classmethod
+    def build(cls, product_ids: Sequence[int], vectors: sparse.spmatrix,
+              k: int = 100, max_chunk_bytes: int = 64 * 1024 * 1024) -> 'ContentSimilarityIndex':
+        """Build from L2-normalized product vectors (one row per product, ids ascending).
+
+        Similarities are computed a block of rows at a time, so the dense
+        intermediate never exceeds ``max_chunk_bytes``.
+        """
+        vectors = sparse.csr_matrix(vectors, dtype=np.float32)
+        n_products = vectors.shape[0]
+        k = max(0, min(k, n_products - 1))
+
+        neighbors = np.full((n_products, k), -1, dtype=np.int32)
+        similarities = np.zeros((n_products, k), dtype=np.float32)
+        if k == 0:
+            return cls(np.asarray(product_ids, dtype=np.int64), neighbors, similarities)
+
+        vectors_t = vectors.T.tocsc()
+        chunk_rows = max(1, max_chunk_bytes // (4 * n_products))
+
+        for start in range(0, n_products, chunk_rows):
+            end = min(start + chunk_rows, n_products)
+            block = (vectors[start:end] @ vectors_t).toarray()
+            rows = np.arange(end - start)
+            # A product is never its own neighbor
+            block[rows, rows + start] = -1.0
+
+            neighbors[start:end], similarities[start:end] = _top_k_columns(block, k)
+
+        return cls(np.asarray(product_ids, dtype=np.int64), neighbors, similarities)
+
+    @classmethod
+    def build_approximate(cls, product_ids: Sequence[int], vectors: sparse.spmatrix, k: int = 100,
+                          n_lists: Optional[int] = None, nprobe: int = 8,
+                          max_chunk_bytes: int = 64 * 1024 * 1024) -> 'ContentSimilarityIndex':
+        """Like ``build``, but each product is only compared with the products of nearby IVF lists.
+
+        Products are clustered with an IVFIndex; the members of each list are
+        scored exactly against the members of the ``nprobe`` lists nearest to
+        it, which replaces the all-pairs scan with roughly N * N * nprobe / n_lists work.
+        """
+        vectors = sparse.csr_matrix(vectors, dtype=np.float32)
+        n_products = vectors.shape[0]
+        k = max(0, min(k, n_products - 1))
+        neighbors = np.full((n_products, k), -1, dtype=np.int32)
+        similarities = np.zeros((n_products, k), dtype=np.float32)
+        if k == 0:
+            return cls(np.asarray(product_ids, dtype=np.int64), neighbors, similarities)
+
+        # Index rows by row number, so candidates come back as rows
+        ivf = IVFIndex.build(np.arange(n_products), vectors, n_lists=n_lists, nprobe=nprobe)
+        offsets = ivf.list_offsets
+        for list_index in range(ivf.n_lists):
+            members = ivf.ids[offsets[list_index]:offsets[list_index + 1]]
+            if not len(members):
+                continue
+            probed = ivf.probe(ivf.centroids[list_index], nprobe)
+            candidates = np.concatenate([ivf.ids[offsets[p]:offsets[p + 1]] for p in probed])
+            candidates_t = vectors[candidates].T.tocsc()
+            chunk_rows = max(1, max_chunk_bytes // (4 * len(candidates)))
+
+            for start in range(0, len(members), chunk_rows):
+                rows = members[start:start + chunk_rows]
+                block = dense(vectors[rows] @ candidates_t)
+                # A product is never its own neighbor
+                block[rows[:, None] == candidates[None, :]] = -1.0
+                columns, scores = _top_k_columns(block, k)
+                neighbors[rows] = np.where(columns >= 0, candidates[columns], -1)
+                similarities[rows] = scores
+
+        return cls(np.asarray(product_ids, dtype=np.int64), neighbors, similarities)
+
+    def neighbors_of(self, product_id: int) -> List[Tuple[int, float]]:
+        """(product_id, similarity) pairs for a product's neighbors"""
+        row = rows_for_ids(self.product_ids, [product_id])[0]
+        if row < 0:
+            return []
+        valid = self.neighbors[row] >= 0
+        return list(zip(
+            self.product_ids[self.neighbors[row][valid]].tolist(),
+            self.similarities[row][valid].tolist()
+        ))
+
+    def top_similar(self, liked_product_ids: Iterable[int], exclude_product_ids: Iterable[int],
+                    limit: int, min_similarity: float = 0.1) -> List[Tuple[int, float]]:
+        """Products most similar to any liked product, best first.
+
+        Each candidate scores its maximum similarity to the liked products;
+        excluded products and scores at or below ``min_similarity`` are dropped.
+        """
+        liked_rows = rows_for_ids(self.product_ids, liked_product_ids)
+        liked_rows = liked_rows[liked_rows >= 0]
+        if not len(liked_rows) or limit <= 0:
+            return []
+
+        excluded = np.zeros(len(self.product_ids), dtype=bool)
+        excluded_rows = rows_for_ids(self.product_ids, exclude_product_ids)
+        excluded[excluded_rows[excluded_rows >= 0]] = True
+
+        neighbors = self.neighbors[liked_rows].ravel()
+        similarities = self.similarities[liked_rows].ravel()
+        valid = neighbors >= 0
+        scores = np.zeros(len(self.product_ids), dtype=np.float32)
+        np.maximum.at(scores, neighbors[valid], similarities[valid])
+        scores[excluded] = 0.0
+
+        candidates = np.flatnonzero(scores > min_similarity)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return list(zip(self.product_ids[candidates].tolist(), scores[candidates].tolist()))
@@ -1,26 +1,149 @@
 import json
 import os
-from typing import Dict, List, Optional
+import threading
+from typing import IO, Dict, Iterator, List, Optional
 
-def load_mock_data() -> Optional[Dict]:
+MOCK_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_data.json')
+
+# Parsed mock data and its indexes, keyed by the file's mtime and size
+_cache: Dict[str, object] = {}
+_cache_lock = threading.Lock()
+
+def iter_json_records(file: IO[str], key: str = 'products', read_size: int = 1 << 16) -> Iterator[Dict]:
+    """Objects of a top-level JSON array, or of the array under ``key``, decoded one at a time"""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+
+    def fill() -> bool:
+        nonlocal buffer, position, eof
+        chunk = file.read(read_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def skip_whitespace() -> Optional[str]:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not fill():
+                return None
+
+    def decode():
+        nonlocal position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Most likely cut off at the end of the buffer
+                if eof or not fill():
+                    raise
+                continue
+            if end == len(buffer) and not eof and fill():
+                # A number may continue in the next read
+                continue
+            position = end
+            return value
+
+    first = skip_whitespace()
+    if first == '{':
+        # Walk the object's members until ``key``; other members are decoded and dropped
+        position += 1
+        while True:
+            if skip_whitespace() == '}':
+                return
+            name = decode()
+            if skip_whitespace() != ':':
+                raise ValueError("Malformed JSON object")
+            position += 1
+            skip_whitespace()
+            if name == key:
+                break
+            decode()
+            if skip_whitespace() == ',':
+                position += 1
+        first = skip_whitespace()
+    if first != '[':
+        raise ValueError(f"Expected a JSON array of products{f' under {key!r}' if key else ''}")
+    position += 1
+
+    while True:
+        if skip_whitespace() == ']':
+            return
+        yield decode()
+        separator = skip_whitespace()
+        if separator == ',':
+            position += 1
+        elif separator != ']':
+            raise ValueError("Malformed JSON array")
+
+def iter_products(path: Optional[str] = None) -> Iterator[Dict]:
     """
-    Load mock data from JSON file.
+    Stream products from a JSON catalog one at a time, without loading the file.
     
+    Args:
+        path: Catalog file, mock_data.json by default; either a JSON array or
+            an object with a "products" array
+        
     Returns:
-        Dict containing categories and products, or None if file not found
+        Iterator over product dictionaries
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    json_path = os.path.join(script_dir, 'mock_data.json')
+    with open(path or MOCK_DATA_PATH, 'r', encoding='utf-8') as file:
+        yield from iter_json_records(file)
+
+def _indexed_mock_data() -> Optional[Dict]:
+    """Parsed mock data plus name and category indexes, re-parsed only when the file changes"""
+    json_path = MOCK_DATA_PATH
+    try:
+        stat = os.stat(json_path)
+    except FileNotFoundError:
+        print(f"Error: mock_data.json not found at {json_path}")
+        return None
+    key = (json_path, stat.st_mtime_ns, stat.st_size)
+    
+    with _cache_lock:
+        if _cache.get('key') == key:
+            return _cache['value']
     
     try:
         with open(json_path, 'r', encoding='utf-8') as file:
-            return json.load(file)
+            data = json.load(file)
     except FileNotFoundError:
         print(f"Error: mock_data.json not found at {json_path}")
         return None
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
         return None
+    
+    by_name: Dict[str, Dict] = {}
+    by_category: Dict[str, List[Dict]] = {}
+    for product in data.get('products', []):
+        # The first product of a name wins, as with the former linear scan
+        by_name.setdefault(product.get('name'), product)
+        by_category.setdefault(product.get('category'), []).append(product)
+    value = {'data': data, 'by_name': by_name, 'by_category': by_category}
+    with _cache_lock:
+        _cache['key'], _cache['value'] = key, value
+    return value
+
+def load_mock_data() -> Optional[Dict]:
+    """
+    Load mock data from JSON file.
+    
+    The file is parsed once and re-parsed only when its modification time
+    or size changes. The returned data is shared between callers, so treat
+    it as read-only.
+    
+    Returns:
+        Dict containing categories and products, or None if file not found
+    """
+    indexed = _indexed_mock_data()
+    return indexed['data'] if indexed else None
 
 def get_products_data() -> List[Dict]:
     """
@@ -31,7 +154,7 @@ def get_products_data() -> List[Dict]:
     """
     mock_data = load_mock_data()
     if mock_data:
-        return mock_data.get('products', [])
+        return list(mock_data.get('products', []))
     return []
 
 def get_categories_data() -> List[str]:
@@ -43,7 +166,7 @@ def get_categories_data() -> List[str]:
     """
     mock_data = load_mock_data()
     if mock_data:
-        return mock_data.get('categories', [])
+        return list(mock_data.get('categories', []))
     return []
 
 def get_products_by_category(category: str) -> List[Dict]:
@@ -56,8 +179,8 @@ def get_products_by_category(category: str) -> List[Dict]:
     Returns:
         List of product dictionaries matching the category
     """
-    products = get_products_data()
-    return [product for product in products if product.get('category') == category]
+    indexed = _indexed_mock_data()
+    return list(indexed['by_category'].get(category, [])) if indexed else []
 
 def get_product_by_name(name: str) -> Optional[Dict]:
     """
@@ -69,8 +192,5 @@ def get_product_by_name(name: str) -> Optional[Dict]:
     Returns:
         Product dictionary if found, None otherwise
     """
-    products = get_products_data()
-    for product in products:
-        if product.get('name') == name:
-            return product
-    return None 
\ No newline at end of file
+    indexed = _indexed_mock_data()
+    return indexed['by_name'].get(name) if indexed else None
@@ -1,6 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn
 import os
 from dotenv import load_dotenv
 
@@ -12,7 +16,70 @@ DATABASE_URL = os.getenv(
     "sqlite:///./recommendation.db"
 )
 
-engine = create_engine(DATABASE_URL)
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+# Serve the read endpoints on an async engine (aiosqlite / asyncpg) instead of the threadpool
+USE_ASYNC_DB = _env_flag("USE_ASYNC_DB", "false")
+
+# Connection pool settings (not used for in-memory SQLite, which keeps one connection per thread)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", "true")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# interaction writer, and NORMAL sync is safe under WAL.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+}
+
+# Async driver used for each sync database URL scheme
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    """The async-driver equivalent of a database URL"""
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+def engine_options(url: str) -> dict:
+    """Pool keyword arguments for create_engine / create_async_engine with this URL"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    options = {
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    # Only queue pools take a size; e.g. aiosqlite on a file uses NullPool, which rejects it
+    if issubclass(parsed.get_dialect().get_pool_class(parsed), QueuePool):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    return options
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Set SQLITE_PRAGMAS on a new connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def configure_engine(sync_engine):
+    """Hook SQLite pragmas onto an engine; other backends are left alone"""
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", apply_sqlite_pragmas)
+    return sync_engine
+
+engine = configure_engine(create_engine(DATABASE_URL, **engine_options(DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -25,6 +92,60 @@ def get_db():
     finally:
         db.close()
 
+_async_sessions = None
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    """Async session factory, created on first use so the driver is only needed when enabled"""
+    global _async_sessions
+    if _async_sessions is None:
+        url = async_database_url(DATABASE_URL)
+        async_engine = create_async_engine(url, **engine_options(url))
+        configure_engine(async_engine.sync_engine)
+        _async_sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessions
+
+async def get_async_db():
+    """Async database dependency"""
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+def ensure_indexes(bind=None) -> list:
+    """Create indexes declared on the models that an existing database lacks; returns their names"""
+    bind = bind or engine
+    created = []
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=bind)
+                created.append(index.name)
+    return created
+
+def ensure_columns(bind=None) -> list:
+    """Add columns declared on the models that existing tables lack; returns them as "table.column".
+
+    New columns must be nullable or have a server default, as ALTER TABLE fills existing rows.
+    """
+    bind = bind or engine
+    added = []
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                definition = CreateColumn(column).compile(dialect=bind.dialect)
+                with bind.begin() as connection:
+                    connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {definition}")
+                added.append(f"{table.name}.{column.name}")
+    return added
+
 def create_tables():
-    """Create all database tables"""
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    """Create all database tables and any missing columns and indexes"""
+    Base.metadata.create_all(bind=engine)
+    ensure_columns()
+    ensure_indexes() 
\ No newline at end of file
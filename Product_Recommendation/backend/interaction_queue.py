@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import UserInteraction, InteractionType
+
+logger = logging.getLogger(__name__)
+
+# (interaction_id, user_id, product_id, interaction_type, rating), as RecommendationEngine records them
+FlushedInteraction = Tuple[int, int, int, InteractionType, Optional[float]]
+
+
+class QueueFull(Exception):
+    """The write-behind queue has no room for a batch"""
+
+
+class BatchTooLarge(ValueError):
+    """A batch is larger than the whole queue, so it can never be accepted"""
+
+
+class InteractionWriteQueue:
+    """Bounded in-process write-behind queue for tracked interactions.
+
+    Interactions are stamped when they are submitted and written by one
+    background thread with a bulk insert, once ``batch_size`` are waiting or
+    the oldest has waited ``flush_interval`` seconds. ``on_flush(db,
+    interactions)`` runs after each committed batch with the new ids. A batch
+    that does not fit in ``max_size`` right now is rejected whole with
+    QueueFull, one larger than ``max_size`` with BatchTooLarge, and
+    interactions still queued when the process dies are lost.
+    """
+
+    def __init__(self, max_size: int = 10000, batch_size: int = 500, flush_interval: float = 1.0,
+                 on_flush: Optional[Callable[[Session, List[FlushedInteraction]], None]] = None):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+
+        # (enqueued_at, row) in submission order
+        self._pending: deque = deque()
+        self._in_flight = 0
+        self._bind = None
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+        self._force = False
+        self._cond = threading.Condition()
+
+        self._submitted = 0
+        self._rejected = 0
+        self._flushed = 0
+        self._failed = 0
+        self._flushes = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+    def submit(self, user_id: int, interactions: Iterable[Tuple[int, InteractionType, Optional[float]]],
+               db: Session) -> int:
+        """Queue a user's (product_id, interaction_type, rating) interactions; returns how many"""
+        now = time.time()
+        created_at = datetime.utcnow()
+        rows = [
+            {
+                'user_id': user_id,
+                'product_id': product_id,
+                'interaction_type': interaction_type,
+                'rating': rating,
+                'created_at': created_at,
+            }
+            for product_id, interaction_type, rating in interactions
+        ]
+        if len(rows) > self.max_size:
+            raise BatchTooLarge(f"A batch holds at most {self.max_size} interactions, got {len(rows)}")
+        with self._cond:
+            if len(self._pending) + len(rows) > self.max_size:
+                self._rejected += len(rows)
+                raise QueueFull(f"Interaction queue is full ({len(self._pending)} waiting)")
+            self._pending.extend((now, row) for row in rows)
+            self._submitted += len(rows)
+            # Flush on the same database the requests use
+            self._bind = db.get_bind()
+            self._closing = False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='interaction-writer', daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return len(rows)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything queued so far; False if that took longer than ``timeout``"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._force = True
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                if self._thread is None or not self._thread.is_alive():
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._force = False
+            return not self._pending
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush what is queued and stop the writer thread"""
+        self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> Dict:
+        """Queue depth, throughput counters and flush latency"""
+        with self._cond:
+            oldest = self._pending[0][0] if self._pending else None
+            return {
+                'depth': len(self._pending),
+                'max_size': self.max_size,
+                'in_flight': self._in_flight,
+                'oldest_wait_seconds': time.time() - oldest if oldest is not None else 0.0,
+                'submitted': self._submitted,
+                'rejected': self._rejected,
+                'flushed': self._flushed,
+                'failed': self._failed,
+                'flushes': self._flushes,
+                'last_flush_seconds': self._last_flush_seconds,
+                'max_flush_seconds': self._max_flush_seconds,
+            }
+
+    def _seconds_until_due(self) -> Optional[float]:
+        """Time until the oldest queued interaction must be written, None if nothing is queued"""
+        if not self._pending:
+            return None
+        if self._force or len(self._pending) >= self.batch_size:
+            return 0.0
+        return max(0.0, self._pending[0][0] + self.flush_interval - time.time())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    due = self._seconds_until_due()
+                    if due == 0.0 or (due is None and self._closing):
+                        break
+                    self._cond.wait(due)
+                if not self._pending:
+                    return
+                count = min(self.batch_size, len(self._pending))
+                batch = [self._pending.popleft()[1] for _ in range(count)]
+                self._in_flight = count
+                bind = self._bind
+
+            started = time.time()
+            flushed = self._write(batch, bind)
+            elapsed = time.time() - started
+
+            with self._cond:
+                self._in_flight = 0
+                self._flushes += 1
+                if flushed:
+                    self._flushed += len(batch)
+                else:
+                    self._failed += len(batch)
+                self._last_flush_seconds = elapsed
+                self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+                self._cond.notify_all()
+
+    def _write(self, batch: List[Dict], bind) -> bool:
+        """Bulk insert one batch and run the flush hook; False if the insert failed"""
+        db = Session(bind=bind)
+        try:
+            ids = db.scalars(
+                insert(UserInteraction).returning(UserInteraction.id, sort_by_parameter_order=True),
+                batch
+            ).all()
+            db.commit()
+        except Exception:
+            logger.exception("Dropping %d interactions that could not be written", len(batch))
+            db.rollback()
+            db.close()
+            return False
+
+        try:
+            if self.on_flush is not None:
+                self.on_flush(db, [
+                    (interaction_id, row['user_id'], row['product_id'], row['interaction_type'], row['rating'])
+                    for interaction_id, row in zip(ids, batch)
+                ])
+        except Exception:
+            logger.exception("Interaction flush hook failed")
+        finally:
+            db.close()
+        return True
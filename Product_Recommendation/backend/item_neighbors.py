@@ -0,0 +1,230 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy.orm import Session
+
+from models import UserInteraction, InteractionType
+from user_item_matrix import interaction_weight
+from array_utils import rows_for_ids
+
+
+class ItemNeighborIndex:
+    """Top-K item-item co-occurrence neighbors per product.
+
+    Co-occurrence of two products is the sum over users of the product of the
+    user's interaction weights on each (PURCHASE/LIKE/VIEW weights scaled by
+    rating). Only each user's ``max_user_history`` most recent products take
+    part, which bounds the work done per tracked interaction. Scores only grow
+    with new interactions, so the top-K lists are maintained in place; items
+    evicted from a user's history are reconciled by the next full rebuild.
+    """
+
+    def __init__(self, neighbors_per_item: int = 50, max_user_history: int = 100):
+        self.neighbors_per_item = neighbors_per_item
+        self.max_user_history = max_user_history
+
+        # product_id -> [(neighbor_id, weight)] sorted by weight, descending
+        self.neighbors: Dict[int, List[Tuple[int, float]]] = {}
+        # user_id -> product_id -> summed weight, least recent first
+        self.user_histories: Dict[int, OrderedDict] = {}
+
+        # Co-occurrence from the last build plus increments since then
+        self._base = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._base_product_ids = np.empty(0, dtype=np.int64)
+        self._delta: Dict[int, Dict[int, float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_database(cls, db: Session, max_interaction_id: Optional[int] = None,
+                      batch_size: int = 50000, **kwargs) -> 'ItemNeighborIndex':
+        """Build the index from the interactions table"""
+        index = cls(**kwargs)
+        index._build(db, max_interaction_id, batch_size)
+        return index
+
+    def add_interaction(self, user_id: int, product_id: int,
+                        interaction_type: InteractionType, rating: Optional[float] = None):
+        """Update co-occurrence and neighbor lists for a newly tracked interaction"""
+        weight = interaction_weight(interaction_type, rating)
+        with self._lock:
+            history = self.user_histories.setdefault(user_id, OrderedDict())
+            for other_id, other_weight in history.items():
+                if other_id == product_id:
+                    continue
+                increment = weight * other_weight
+                self._increment(product_id, other_id, increment)
+                self._increment(other_id, product_id, increment)
+            self._touch_history(history, product_id, weight)
+
+    def recommend(self, recent_items: Iterable[Tuple[int, float]],
+                  exclude_products: Set[int]) -> Dict[int, float]:
+        """Merge the neighbor lists of a user's recent (product_id, weight) items"""
+        scores: Dict[int, float] = {}
+        with self._lock:
+            for product_id, weight in recent_items:
+                for neighbor_id, neighbor_weight in self.neighbors.get(product_id, ()):
+                    if neighbor_id in exclude_products:
+                        continue
+                    scores[neighbor_id] = scores.get(neighbor_id, 0.0) + weight * neighbor_weight
+        return scores
+
+    def _touch_history(self, history: OrderedDict, product_id: int, weight: float):
+        """Add weight to a product and mark it most recent, evicting the oldest"""
+        history[product_id] = history.get(product_id, 0.0) + weight
+        history.move_to_end(product_id)
+        while len(history) > self.max_user_history:
+            history.popitem(last=False)
+
+    def _cooccurrence(self, product_id: int, other_id: int) -> float:
+        """Current co-occurrence weight of a product pair"""
+        value = self._delta.get(product_id, {}).get(other_id, 0.0)
+        row, col = rows_for_ids(self._base_product_ids, (product_id, other_id))
+        if row >= 0 and col >= 0:
+            start, end = self._base.indptr[row], self._base.indptr[row + 1]
+            indices = self._base.indices[start:end]
+            pos = np.searchsorted(indices, col)
+            if pos < len(indices) and indices[pos] == col:
+                value += float(self._base.data[start + pos])
+        return value
+
+    def _increment(self, product_id: int, other_id: int, increment: float):
+        """Add to a pair's co-occurrence and keep the product's top-K list in order"""
+        deltas = self._delta.setdefault(product_id, {})
+        deltas[other_id] = deltas.get(other_id, 0.0) + increment
+        value = self._cooccurrence(product_id, other_id)
+
+        neighbors = self.neighbors.setdefault(product_id, [])
+        for pos, (neighbor_id, _) in enumerate(neighbors):
+            if neighbor_id == other_id:
+                del neighbors[pos]
+                break
+        else:
+            if len(neighbors) >= self.neighbors_per_item and value <= neighbors[-1][1]:
+                return
+
+        pos = len(neighbors)
+        while pos > 0 and neighbors[pos - 1][1] < value:
+            pos -= 1
+        neighbors.insert(pos, (other_id, value))
+        del neighbors[self.neighbors_per_item:]
+
+    def _build(self, db: Session, max_interaction_id: Optional[int], batch_size: int):
+        """Replay interactions into per-user histories and compute top-K co-occurrence"""
+        histories: Dict[int, OrderedDict] = {}
+        query = db.query(
+            UserInteraction.user_id,
+            UserInteraction.product_id,
+            UserInteraction.interaction_type,
+            UserInteraction.rating
+        )
+        if max_interaction_id is not None:
+            query = query.filter(UserInteraction.id <= max_interaction_id)
+
+        for user_id, product_id, interaction_type, rating in query.order_by(UserInteraction.id).yield_per(batch_size):
+            history = histories.setdefault(user_id, OrderedDict())
+            self._touch_history(history, product_id, interaction_weight(interaction_type, rating))
+
+        product_ids = sorted({pid for history in histories.values() for pid in history})
+        product_index = {pid: idx for idx, pid in enumerate(product_ids)}
+
+        rows, cols, weights = [], [], []
+        for row, history in enumerate(histories.values()):
+            for product_id, weight in history.items():
+                rows.append(row)
+                cols.append(product_index[product_id])
+                weights.append(weight)
+        user_items = sparse.csr_matrix(
+            (np.asarray(weights, dtype=np.float32), (rows, cols)),
+            shape=(len(histories), len(product_ids))
+        )
+
+        cooccurrence = (user_items.T @ user_items).tocsr()
+        cooccurrence.setdiag(0)
+        cooccurrence.eliminate_zeros()
+        cooccurrence.sort_indices()
+
+        k = self.neighbors_per_item
+        neighbors = {}
+        for row, product_id in enumerate(product_ids):
+            start, end = cooccurrence.indptr[row], cooccurrence.indptr[row + 1]
+            if start == end:
+                continue
+            data = cooccurrence.data[start:end]
+            indices = cooccurrence.indices[start:end]
+            if len(data) > k:
+                top = np.argpartition(-data, k - 1)[:k]
+                data, indices = data[top], indices[top]
+            order = np.argsort(-data, kind='stable')
+            neighbors[product_id] = [
+                (product_ids[indices[i]], float(data[i])) for i in order
+            ]
+
+        self.user_histories = histories
+        self.neighbors = neighbors
+        self._base = cooccurrence
+        self._base_product_ids = np.asarray(product_ids, dtype=np.int64)
+        self._delta = {}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Flatten the index into named arrays for persistence"""
+        with self._lock:
+            neighbor_lists = list(self.neighbors.items())
+            histories = list(self.user_histories.items())
+            deltas = [(pid, other, value) for pid, row in self._delta.items() for other, value in row.items()]
+            return {
+                'neighbor_product_ids': np.asarray([pid for pid, _ in neighbor_lists], dtype=np.int64),
+                'neighbor_indptr': np.cumsum([0] + [len(n) for _, n in neighbor_lists], dtype=np.int64),
+                'neighbor_ids': np.asarray([nid for _, n in neighbor_lists for nid, _ in n], dtype=np.int64),
+                'neighbor_weights': np.asarray([w for _, n in neighbor_lists for _, w in n], dtype=np.float64),
+                'history_user_ids': np.asarray([uid for uid, _ in histories], dtype=np.int64),
+                'history_indptr': np.cumsum([0] + [len(h) for _, h in histories], dtype=np.int64),
+                'history_product_ids': np.asarray([pid for _, h in histories for pid in h], dtype=np.int64),
+                'history_weights': np.asarray([w for _, h in histories for w in h.values()], dtype=np.float64),
+                'base_product_ids': self._base_product_ids,
+                'base_data': self._base.data,
+                'base_indices': self._base.indices,
+                'base_indptr': self._base.indptr,
+                'delta_product_ids': np.asarray([d[0] for d in deltas], dtype=np.int64),
+                'delta_other_ids': np.asarray([d[1] for d in deltas], dtype=np.int64),
+                'delta_values': np.asarray([d[2] for d in deltas], dtype=np.float64),
+            }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], **kwargs) -> 'ItemNeighborIndex':
+        """Rebuild an index from ``to_arrays`` output.
+
+        The base co-occurrence matrix stays on the given (possibly memory-mapped)
+        arrays; neighbor lists and histories become ordinary Python structures
+        because tracked interactions update them in place.
+        """
+        index = cls(**kwargs)
+
+        def grouped(keys, indptr, *columns):
+            for i, key in enumerate(keys.tolist()):
+                start, end = indptr[i], indptr[i + 1]
+                yield key, zip(*(column[start:end].tolist() for column in columns))
+
+        index.neighbors = {
+            pid: list(pairs) for pid, pairs in grouped(
+                arrays['neighbor_product_ids'], arrays['neighbor_indptr'],
+                arrays['neighbor_ids'], arrays['neighbor_weights'])
+        }
+        index.user_histories = {
+            uid: OrderedDict(pairs) for uid, pairs in grouped(
+                arrays['history_user_ids'], arrays['history_indptr'],
+                arrays['history_product_ids'], arrays['history_weights'])
+        }
+        n_products = len(arrays['base_product_ids'])
+        index._base = sparse.csr_matrix(
+            (arrays['base_data'], arrays['base_indices'], arrays['base_indptr']),
+            shape=(n_products, n_products)
+        )
+        index._base_product_ids = arrays['base_product_ids']
+        for pid, other, value in zip(arrays['delta_product_ids'].tolist(),
+                                     arrays['delta_other_ids'].tolist(),
+                                     arrays['delta_values'].tolist()):
+            index._delta.setdefault(pid, {})[other] = value
+        return index
@@ -1,18 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import logging
+import os
+import time
 import uvicorn
 
-from database import get_db
+from database import get_db, USE_ASYNC_DB
 from models import User, Product, UserInteraction, Recommendation
 from schemas import (
     UserCreate, UserLogin, UserResponse, Token,
-    ProductResponse, InteractionCreate, RecommendationResponse
+    ProductResponse, InteractionCreate, InteractionBatch, RecommendationResponse
 )
-from auth import create_access_token, verify_token, get_password_hash, verify_password
+from auth import create_access_token, verify_token, PasswordHasher, PasswordHashingBusy
 from recommendation_engine import RecommendationEngine
+from model_store import ModelStore
+from shared_model_store import SharedModelStore
+from recommendation_cache import RecommendationCache
+from product_cache import CatalogCache, ProductIdSet
+from interaction_queue import BatchTooLarge, InteractionWriteQueue, QueueFull
+from async_routes import create_async_router
+from user_cache import AuthenticatedUserCache
+from serialization import JSONBytesResponse, products_json, recommendations_json
+from catalog import CatalogVersionCache, catalog_headers, not_modified, set_next_cursor
+import metrics
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="AI Product Recommendation System")
 
@@ -25,12 +41,120 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+metrics.install_query_hooks()
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latency, SQL statement count and database time per route"""
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.current_request.reset(token)
+    # The route template, not the raw path, keeps label cardinality bounded
+    matched = request.scope.get("route")
+    route = getattr(matched, "path", "unmatched")
+    metrics.REQUEST_SECONDS.observe(
+        time.perf_counter() - started, method=request.method, route=route, status=str(response.status_code)
+    )
+    metrics.REQUEST_DB_QUERIES.observe(stats.queries, route=route)
+    metrics.REQUEST_DB_SECONDS.observe(stats.db_seconds, route=route)
+    return response
+
 security = HTTPBearer()
-recommendation_engine = RecommendationEngine()
+# Directory of persisted model snapshots shared by all workers (disabled if unset)
+MODEL_DIR = os.getenv("MODEL_DIR")
+# Shared memory name published by ``shared_model_store.py``; when set, workers only attach to its models
+SHARED_MODEL_NAME = os.getenv("SHARED_MODEL_NAME")
+if SHARED_MODEL_NAME:
+    model_store = SharedModelStore(SHARED_MODEL_NAME)
+else:
+    model_store = ModelStore(MODEL_DIR) if MODEL_DIR else None
+# Catalog version behind ETag / Last-Modified, bumped with every ORM write to products
+catalog_version = CatalogVersionCache(ttl=float(os.getenv("CATALOG_VERSION_TTL", "1.0")))
+catalog_version.watch(Product)
+# Products, category lists and their JSON, shared by the catalog routes and recommendation hydration
+catalog_cache = CatalogCache(catalog_version, max_size=int(os.getenv("CATALOG_CACHE_SIZE", "10000")))
+# ALS is trained offline by shared_model_store.py or precompute_recommendations.py; API workers
+# only load its factors, so with ALS enabled they follow the model store instead of rebuilding
+ALS_WEIGHT = float(os.getenv("ALS_WEIGHT", "0"))
+if ALS_WEIGHT > 0 and model_store is None:
+    logger.warning("ALS_WEIGHT is set without MODEL_DIR or SHARED_MODEL_NAME; the ALS signal stays off")
+elif ALS_WEIGHT > 0 and not SHARED_MODEL_NAME:
+    logger.warning("With ALS_WEIGHT and MODEL_DIR the API workers never rebuild models; run "
+                   "precompute_recommendations.py at least every MODEL_REFRESH_INTERVAL to refresh them")
+recommendation_engine = RecommendationEngine(
+    collaborative_mode=os.getenv("COLLABORATIVE_MODE", "jaccard"),
+    model_store=model_store,
+    popularity_half_life=float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "7")) * 24 * 3600,
+    als_weight=ALS_WEIGHT,
+    als_factors=int(os.getenv("ALS_FACTORS", "32")),
+    ann_min_items=int(os.getenv("ANN_MIN_ITEMS", "50000")),
+    ann_nprobe=int(os.getenv("ANN_NPROBE", "8")),
+    product_cache=catalog_cache,
+    rebuild_locally=not SHARED_MODEL_NAME and not (ALS_WEIGHT > 0 and model_store is not None),
+    train_als=False
+)
+recommendation_cache = RecommendationCache(
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL", "900")),
+    # Rows written by precompute_recommendations.py; cover the interval between runs
+    precomputed_ttl=float(os.getenv("PRECOMPUTED_RECOMMENDATION_TTL", str(26 * 3600)))
+)
+product_ids = ProductIdSet()
+# Verified bearer token -> user, so authenticated requests skip the JWT decode and user lookup
+user_cache = AuthenticatedUserCache(ttl=float(os.getenv("USER_CACHE_TTL", "300")))
+user_cache.watch(User)
+# bcrypt runs on its own bounded pool so login bursts cannot starve the request threadpool
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    max_pending=int(os.getenv("PASSWORD_HASH_QUEUE", "8"))
+)
+
+def run_password_hasher(call, *args):
+    """Hash or verify on the bcrypt pool, rejecting with 503 when it is saturated"""
+    try:
+        return call(*args)
+    except PasswordHashingBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is busy, retry later",
+            headers={"Retry-After": "1"}
+        )
+
+def interactions_flushed(db: Session, interactions):
+    """Feed bulk-written interactions to the engine and drop affected users' cached results"""
+    for interaction_id, user_id, product_id, interaction_type, rating in interactions:
+        recommendation_engine.record_interaction(
+            user_id, product_id, interaction_type, rating, interaction_id=interaction_id
+        )
+    recommendation_cache.invalidate_many({interaction[1] for interaction in interactions}, db)
+    db.commit()
+
+interaction_queue = InteractionWriteQueue(
+    max_size=int(os.getenv("INTERACTION_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("INTERACTION_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("INTERACTION_FLUSH_INTERVAL", "1.0")),
+    on_flush=interactions_flushed
+)
+
+@app.on_event("shutdown")
+def flush_interactions():
+    """Write queued interactions before the process exits"""
+    interaction_queue.close(timeout=10)
+
+if USE_ASYNC_DB:
+    # Registered first, so these async handlers take the read paths defined below
+    app.include_router(create_async_router(recommendation_engine, recommendation_cache, user_cache, catalog_cache))
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
     """Get current authenticated user"""
     token = credentials.credentials
+    cached = user_cache.get(token)
+    if cached is not None:
+        return cached
+    
     payload = verify_token(token)
     if payload is None:
         raise HTTPException(
@@ -44,7 +168,9 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
-    return user
+    identity = UserResponse.from_orm(user)
+    user_cache.put(token, identity, payload.get("exp"))
+    return identity
 
 @app.post("/auth/register", response_model=UserResponse)
 def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
@@ -58,7 +184,7 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = run_password_hasher(password_hasher.hash, user_data.password)
     db_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -79,7 +205,7 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
 def login_user(user_data: UserLogin, db: Session = Depends(get_db)):
     """Login user and return JWT token"""
     user = db.query(User).filter(User.email == user_data.email).first()
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    if not user or not run_password_hasher(password_hasher.verify, user_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
@@ -90,34 +216,61 @@ def login_user(user_data: UserLogin, db: Session = Depends(get_db)):
 
 @app.get("/products", response_model=List[ProductResponse])
 def get_products(
+    request: Request,
     category: Optional[str] = None,
+    cursor: Optional[int] = None,
     skip: int = 0,
     limit: int = 50,
     db: Session = Depends(get_db)
 ):
-    """Get products with optional category filtering"""
-    query = db.query(Product)
-    if category:
-        query = query.filter(Product.category == category)
+    """Get products with optional category filtering.
+    
+    Pages are ordered by id; pass the ``X-Next-Cursor`` header of a page as
+    ``cursor`` to fetch the next one at constant cost. ``skip`` still works
+    but scans every skipped row.
+    """
+    state = catalog_cache.state(db)
+    unchanged = not_modified(request, state)
+    if unchanged is not None:
+        return unchanged
     
-    products = query.offset(skip).limit(limit).all()
-    return products
+    # One indexed keyset query for the ids; product JSON comes from the catalog cache
+    body, next_cursor = catalog_cache.page_json(db, category, cursor, skip, limit)
+    response = Response(body, media_type="application/json", headers=catalog_headers(state))
+    if next_cursor is not None:
+        set_next_cursor(request, response, next_cursor)
+    return response
+
+@app.get("/products/popular", response_model=List[ProductResponse])
+def get_popular_products(
+    category: Optional[str] = None,
+    limit: int = 10,
+    db: Session = Depends(get_db)
+):
+    """Get trending products, overall or within a category"""
+    products = recommendation_engine.get_popular_products(db, limit, category)
+    return JSONBytesResponse(products_json(products, catalog_cache.get_many_json((p.id for p in products), db)))
 
 @app.get("/products/{product_id}", response_model=ProductResponse)
-def get_product(product_id: int, db: Session = Depends(get_db)):
+def get_product(product_id: int, request: Request, db: Session = Depends(get_db)):
     """Get specific product by ID"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    state = catalog_cache.state(db)
+    unchanged = not_modified(request, state)
+    if unchanged is not None:
+        return unchanged
+    
+    product = catalog_cache.product_json(product_id, db)
+    if product is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
-    return product
+    return Response(product, media_type="application/json", headers=catalog_headers(state))
 
 @app.post("/interactions")
 def track_interaction(
     interaction: InteractionCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Track user interaction with products"""
@@ -137,29 +290,153 @@ def track_interaction(
         rating=interaction.rating
     )
     db.add(db_interaction)
+    db.flush()
+    interaction_id = db_interaction.id
+    recommendation_cache.invalidate(current_user.id, db)
     db.commit()
+    recommendation_engine.record_interaction(
+        current_user.id,
+        interaction.product_id,
+        interaction.interaction_type,
+        interaction.rating,
+        interaction_id=interaction_id,
+        category=product.category
+    )
     
     return {"message": "Interaction tracked successfully"}
 
+@app.post("/interactions/batch", status_code=status.HTTP_202_ACCEPTED)
+def track_interactions_batch(
+    batch: InteractionBatch,
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue many interactions; they are written in bulk shortly afterwards"""
+    missing = product_ids.missing((interaction.product_id for interaction in batch.interactions), db)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Products not found: {sorted(missing)}"
+        )
+    
+    try:
+        accepted = interaction_queue.submit(
+            current_user.id,
+            ((i.product_id, i.interaction_type, i.rating) for i in batch.interactions),
+            db
+        )
+    except BatchTooLarge as e:
+        # Retrying cannot help, unlike a temporarily full queue
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except QueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many pending interactions, retry later"
+        )
+    
+    return {"message": "Interactions queued", "accepted": accepted}
+
+@app.get("/interactions/stats")
+def get_interaction_queue_stats():
+    """Write-behind queue depth and flush latency"""
+    return interaction_queue.stats()
+
 @app.get("/recommendations", response_model=List[RecommendationResponse])
 def get_recommendations(
-    current_user: User = Depends(get_current_user),
+    current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db),
     limit: int = 10
 ):
     """Get AI-powered product recommendations for user"""
+    cached = recommendation_cache.get(current_user.id, limit, db)
+    if cached is not None:
+        return _serialize_recommendations(cached, db)
+
+    # Compute at least the cache depth so smaller limits are served from the same entry
+    depth = max(limit, recommendation_cache.depth)
+    # Until the first model build, results are fallbacks that every worker would serve for a whole TTL
+    models_ready = recommendation_engine.snapshot is not None
     recommendations = recommendation_engine.get_recommendations(
         user_id=current_user.id,
         db=db,
-        limit=limit
+        limit=depth
     )
-    return recommendations
+    if models_ready:
+        recommendation_cache.put(current_user.id, recommendations, depth, db)
+    return _serialize_recommendations(recommendations[:limit], db)
+
+def _serialize_recommendations(recommendations: List[RecommendationResponse], db: Session) -> JSONBytesResponse:
+    """Splice cached product JSON into the body instead of re-validating through response_model"""
+    with metrics.stage_timer('serialization'):
+        product_json = catalog_cache.get_many_json((rec.product.id for rec in recommendations), db)
+        return JSONBytesResponse(recommendations_json(recommendations, product_json))
 
 @app.get("/categories")
-def get_categories(db: Session = Depends(get_db)):
+def get_categories(request: Request, db: Session = Depends(get_db)):
     """Get all product categories"""
-    categories = db.query(Product.category).distinct().all()
-    return [cat[0] for cat in categories if cat[0]]
+    state = catalog_cache.state(db)
+    unchanged = not_modified(request, state)
+    if unchanged is not None:
+        return unchanged
+    
+    return Response(catalog_cache.categories_json(db), media_type="application/json",
+                    headers=catalog_headers(state))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition of request, stage, SQL, cache and queue metrics"""
+    product_cache_stats = recommendation_engine.product_cache.stats()
+    user_cache_stats = user_cache.stats()
+    cache_stats = recommendation_cache.stats()
+    queue_stats = interaction_queue.stats()
+    hasher_stats = password_hasher.stats()
+    snapshot = recommendation_engine.snapshot
+    collected = [
+        metrics.counter('product_cache_lookups_total', 'Product cache lookups by result', [
+            ({'result': 'hit'}, product_cache_stats['hits']),
+            ({'result': 'miss'}, product_cache_stats['misses']),
+        ]),
+        metrics.counter('recommendation_cache_lookups_total', 'Recommendation cache lookups by result', [
+            ({'result': 'memory_hit'}, cache_stats['memory_hits']),
+            ({'result': 'table_hit'}, cache_stats['table_hits']),
+            ({'result': 'miss'}, cache_stats['misses']),
+        ]),
+        metrics.counter('user_cache_lookups_total', 'Authenticated user cache lookups by result', [
+            ({'result': 'hit'}, user_cache_stats['hits']),
+            ({'result': 'miss'}, user_cache_stats['misses']),
+        ]),
+        metrics.gauge('cache_entries', 'Entries held in memory per cache', [
+            ({'cache': 'product'}, product_cache_stats['size']),
+            ({'cache': 'recommendation'}, cache_stats['size']),
+            ({'cache': 'user'}, user_cache_stats['size']),
+        ]),
+        metrics.gauge('interaction_queue_depth', 'Interactions waiting to be written', [
+            ({}, queue_stats['depth']),
+        ]),
+        metrics.gauge('interaction_queue_oldest_wait_seconds', 'Age of the oldest queued interaction', [
+            ({}, queue_stats['oldest_wait_seconds']),
+        ]),
+        metrics.counter('interaction_queue_events_total', 'Write-behind queue event totals', [
+            ({'event': name}, queue_stats[name]) for name in ('submitted', 'rejected', 'flushed', 'failed')
+        ]),
+        metrics.gauge('password_hash_in_flight', 'bcrypt calls running or waiting on the hashing pool', [
+            ({}, hasher_stats['in_flight']),
+        ]),
+        metrics.counter('password_hash_rejected_total', 'bcrypt calls rejected because the pool was full', [
+            ({}, hasher_stats['rejected']),
+        ]),
+    ]
+    if snapshot is not None:
+        collected.append(metrics.gauge('model_snapshot_version', 'Version of the served model snapshot', [
+            ({}, snapshot.version),
+        ]))
+        collected.append(metrics.gauge('model_snapshot_age_seconds', 'Age of the served model snapshot', [
+            ({}, time.time() - snapshot.built_at),
+        ]))
+    return PlainTextResponse(metrics.render(collected), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
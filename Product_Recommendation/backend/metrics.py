@@ -0,0 +1,200 @@
+"""Lightweight in-process metrics in the Prometheus text format.
+
+Histograms and counters are plain Python objects guarded by a lock, cheap
+enough to sit around every recommendation stage. A SQLAlchemy hook counts
+statements and database time globally and for the current HTTP request,
+which the request middleware in main.py publishes per route.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{str(value)}"'.replace('\n', ' ') for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.label_names), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(labels[name] for name in self.label_names))
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    labels = _format_labels(self.label_names, key, f'le="{le}"')
+                    lines.append(f'{self.name}_bucket{labels} {_format_value(cumulative)}')
+                labels = _format_labels(self.label_names, key)
+                lines.append(f'{self.name}_sum{labels} {repr(float(series[-1]))}')
+                lines.append(f'{self.name}_count{labels} {_format_value(cumulative)}')
+        return lines
+
+
+def _samples(name: str, documentation: str, metric_type: str,
+             samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}')
+    return lines
+
+
+def gauge(name: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Render a gauge from (labels, value) samples read at scrape time"""
+    return _samples(name, documentation, 'gauge', samples)
+
+
+def counter(name: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Render a counter kept elsewhere (e.g. a cache's hit count) from (labels, value) samples"""
+    return _samples(name, documentation, 'counter', samples)
+
+
+STAGE_SECONDS = Histogram(
+    'recommendation_stage_seconds', 'Time spent in each recommendation engine stage', ['stage']
+)
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ['method', 'route', 'status']
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements executed per HTTP request', ['route'], buckets=COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL statements per HTTP request', ['route']
+)
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed')
+DB_SECONDS = Counter('db_query_seconds_total', 'Time spent executing SQL statements')
+
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, DB_QUERIES, DB_SECONDS]
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Record the duration of a block under ``recommendation_stage_seconds{stage=...}``"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+class RequestStats:
+    """SQL statements and database time of one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar('current_request', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own execution context, which is dropped whether or not it succeeds
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    DB_QUERIES.inc()
+    DB_SECONDS.inc(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+_hooks_installed = False
+
+
+def install_query_hooks():
+    """Count statements and time on every engine, including ones created later"""
+    global _hooks_installed
+    if not _hooks_installed:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _hooks_installed = True
+
+
+def render(extra: Iterable[List[str]] = ()) -> str:
+    """Every registered metric plus samples collected at scrape time, in the Prometheus text format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for block in extra:
+        lines.extend(block)
+    return '\n'.join(lines) + '\n'
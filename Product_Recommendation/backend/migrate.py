@@ -0,0 +1,27 @@
+"""Bring an existing database up to the current schema.
+
+create_all only creates missing tables, so columns and indexes added to
+existing tables are created here, followed by ANALYZE so the query planner
+uses the indexes.
+
+    python migrate.py
+"""
+from database import Base, engine, ensure_columns, ensure_indexes
+import models  # noqa: F401  (registers the tables on Base.metadata)
+
+
+def migrate():
+    """Create missing tables, columns and indexes, then refresh planner statistics"""
+    Base.metadata.create_all(bind=engine)
+    created = ensure_columns(engine) + ensure_indexes(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    return created
+
+
+if __name__ == "__main__":
+    created = migrate()
+    if created:
+        print(f"Created columns and indexes: {', '.join(created)}")
+    else:
+        print("Schema is up to date.")
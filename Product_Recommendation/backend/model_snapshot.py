@@ -0,0 +1,85 @@
+import time
+from typing import NamedTuple, Optional, Union
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from models import Product, UserInteraction
+from content_index import ContentSimilarityIndex
+from user_item_matrix import DeltaUserItemMatrix, UserItemMatrix
+from item_neighbors import ItemNeighborIndex
+from als import ImplicitALS
+from ann_index import IVFIndex
+
+
+class ModelSnapshot(NamedTuple):
+    """One consistent version of every model the recommendation engine serves from.
+
+    Snapshots are built off the request path and swapped in whole, so a
+    request reads all of its models from the same version.
+    """
+    version: int
+    built_at: float
+    # Interactions with an id up to this one are reflected in the models
+    max_interaction_id: int
+    content_index: Optional[ContentSimilarityIndex]
+    # A DeltaUserItemMatrix once a store-loaded snapshot has tracked interactions folded in
+    user_item_matrix: Optional[Union[UserItemMatrix, DeltaUserItemMatrix]]
+    item_neighbors: Optional[ItemNeighborIndex]
+    als: Optional[ImplicitALS] = None
+
+
+def build_content_index(db: Session, content_neighbors: int, ann_min_items: Optional[int] = None,
+                        ann_nprobe: int = 8) -> Optional[ContentSimilarityIndex]:
+    """Fit TF-IDF on category + description and keep the top-K neighbors per product.
+
+    Catalogs of at least ``ann_min_items`` products find neighbors through an
+    IVF index instead of comparing every pair.
+    """
+    products = db.query(Product.id, Product.category, Product.description).order_by(Product.id).all()
+    if not products:
+        return None
+
+    content_features = [f"{category} {description or ''}" for _, category, description in products]
+    # A fresh vectorizer per build, so serving never sees a half-refit one
+    vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
+    tfidf_matrix = vectorizer.fit_transform(content_features)
+    product_ids = [product_id for product_id, _, _ in products]
+    if ann_min_items is not None and len(products) >= ann_min_items:
+        return ContentSimilarityIndex.build_approximate(product_ids, tfidf_matrix, k=content_neighbors,
+                                                        nprobe=ann_nprobe)
+    return ContentSimilarityIndex.build(product_ids, tfidf_matrix, k=content_neighbors)
+
+
+def build_snapshot(db: Session, version: int, collaborative_mode: str,
+                   content_neighbors: int = 100, als_factors: int = 0,
+                   ann_min_items: Optional[int] = None, ann_nprobe: int = 8) -> ModelSnapshot:
+    """Build every model for the given collaborative mode from the database (ALS if ``als_factors``)"""
+    max_interaction_id = db.query(func.max(UserInteraction.id)).scalar() or 0
+
+    user_item_matrix = None
+    item_neighbors = None
+    if collaborative_mode == 'sparse':
+        user_item_matrix = UserItemMatrix.from_database(db, max_interaction_id)
+    elif collaborative_mode == 'item_item':
+        item_neighbors = ItemNeighborIndex.from_database(db, max_interaction_id)
+
+    als = None
+    if als_factors:
+        matrix = user_item_matrix if user_item_matrix is not None else \
+            UserItemMatrix.from_database(db, max_interaction_id)
+        if matrix.weights.nnz:
+            als = ImplicitALS.train(matrix.product_ids, matrix.weights, factors=als_factors)
+            if ann_min_items is not None and len(als.product_ids) >= ann_min_items:
+                als.ann = IVFIndex.build(als.product_ids, als.item_factors, nprobe=ann_nprobe)
+
+    return ModelSnapshot(
+        version=version,
+        built_at=time.time(),
+        max_interaction_id=max_interaction_id,
+        content_index=build_content_index(db, content_neighbors, ann_min_items, ann_nprobe),
+        user_item_matrix=user_item_matrix,
+        item_neighbors=item_neighbors,
+        als=als,
+    )
@@ -0,0 +1,238 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+from content_index import ContentSimilarityIndex
+from item_neighbors import ItemNeighborIndex
+from als import ImplicitALS
+from ann_index import IVFIndex
+from model_snapshot import ModelSnapshot
+from user_item_matrix import UserItemMatrix
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+LATEST_NAME = 'LATEST'
+
+
+def _csr_arrays(prefix: str, matrix: sparse.csr_matrix) -> Dict[str, np.ndarray]:
+    return {
+        f'{prefix}_data': matrix.data,
+        f'{prefix}_indices': matrix.indices,
+        f'{prefix}_indptr': matrix.indptr,
+    }
+
+
+def _csr_from_arrays(prefix: str, arrays: Dict[str, np.ndarray], shape) -> sparse.csr_matrix:
+    # Passing (data, indices, indptr) with matching dtypes keeps the arrays as-is
+    return sparse.csr_matrix(
+        (arrays[f'{prefix}_data'], arrays[f'{prefix}_indices'], arrays[f'{prefix}_indptr']),
+        shape=shape
+    )
+
+
+def snapshot_to_arrays(snapshot: ModelSnapshot) -> Dict[str, np.ndarray]:
+    """Flatten every model in a snapshot into named NumPy arrays"""
+    arrays: Dict[str, np.ndarray] = {}
+    if snapshot.content_index is not None:
+        arrays['content_product_ids'] = snapshot.content_index.product_ids
+        arrays['content_neighbors'] = snapshot.content_index.neighbors
+        arrays['content_similarities'] = snapshot.content_index.similarities
+    if snapshot.user_item_matrix is not None:
+        matrix = snapshot.user_item_matrix
+        arrays['uim_user_ids'] = matrix.user_ids
+        arrays['uim_product_ids'] = matrix.product_ids
+        arrays['uim_user_item_counts'] = matrix.user_item_counts
+        arrays.update(_csr_arrays('uim_weights', matrix.weights))
+        arrays.update(_csr_arrays('uim_item_users', matrix.item_users))
+    if snapshot.item_neighbors is not None:
+        arrays.update({f'iin_{name}': array for name, array in snapshot.item_neighbors.to_arrays().items()})
+    if snapshot.als is not None:
+        arrays['als_product_ids'] = snapshot.als.product_ids
+        arrays['als_item_factors'] = snapshot.als.item_factors
+        arrays['als_gram'] = snapshot.als.gram
+        if snapshot.als.ann is not None:
+            arrays.update({f'alsann_{name}': array for name, array in snapshot.als.ann.to_arrays().items()})
+    return arrays
+
+
+def snapshot_metadata(snapshot: ModelSnapshot) -> Dict:
+    """Scalar fields of a snapshot plus what is needed to rebuild its models"""
+    metadata = {
+        'version': snapshot.version,
+        'built_at': snapshot.built_at,
+        'max_interaction_id': snapshot.max_interaction_id,
+    }
+    if snapshot.item_neighbors is not None:
+        metadata['item_neighbors'] = {
+            'neighbors_per_item': snapshot.item_neighbors.neighbors_per_item,
+            'max_user_history': snapshot.item_neighbors.max_user_history,
+        }
+    if snapshot.als is not None:
+        metadata['als'] = {
+            'regularization': snapshot.als.regularization,
+            'alpha': snapshot.als.alpha,
+        }
+        if snapshot.als.ann is not None:
+            metadata['als_ann'] = {'nprobe': snapshot.als.ann.nprobe}
+    return metadata
+
+
+def snapshot_from_arrays(metadata: Dict, arrays: Dict[str, np.ndarray]) -> ModelSnapshot:
+    """Reassemble a snapshot from ``snapshot_metadata`` and ``snapshot_to_arrays`` output"""
+    content_index = None
+    if 'content_product_ids' in arrays:
+        content_index = ContentSimilarityIndex(
+            arrays['content_product_ids'], arrays['content_neighbors'], arrays['content_similarities']
+        )
+
+    user_item_matrix = None
+    if 'uim_user_ids' in arrays:
+        n_users, n_products = len(arrays['uim_user_ids']), len(arrays['uim_product_ids'])
+        user_item_matrix = UserItemMatrix(
+            arrays['uim_user_ids'],
+            arrays['uim_product_ids'],
+            _csr_from_arrays('uim_weights', arrays, (n_users, n_products)),
+            item_users=_csr_from_arrays('uim_item_users', arrays, (n_products, n_users)),
+            user_item_counts=arrays['uim_user_item_counts'],
+        )
+
+    item_neighbors = None
+    if 'item_neighbors' in metadata:
+        item_neighbors = ItemNeighborIndex.from_arrays(
+            {name[len('iin_'):]: array for name, array in arrays.items() if name.startswith('iin_')},
+            **metadata['item_neighbors']
+        )
+
+    als = None
+    if 'als' in metadata:
+        ann = None
+        if 'als_ann' in metadata:
+            ann = IVFIndex.from_arrays(
+                {name[len('alsann_'):]: array for name, array in arrays.items() if name.startswith('alsann_')},
+                **metadata['als_ann']
+            )
+        als = ImplicitALS(arrays['als_product_ids'], arrays['als_item_factors'], arrays['als_gram'],
+                          ann=ann, **metadata['als'])
+
+    return ModelSnapshot(
+        version=metadata['version'],
+        built_at=metadata['built_at'],
+        max_interaction_id=metadata['max_interaction_id'],
+        content_index=content_index,
+        user_item_matrix=user_item_matrix,
+        item_neighbors=item_neighbors,
+        als=als,
+    )
+
+
+class ModelStore:
+    """Versioned on-disk model snapshots: one directory of ``.npy`` files per version.
+
+    Each version directory holds one flat array per file plus a small JSON
+    manifest, and ``LATEST`` names the newest complete version. Loading uses
+    ``np.load(mmap_mode='r')``, so every worker process maps the same files and
+    shares one page-cache copy instead of holding its own heap copy. The
+    engine keeps interactions tracked later beside the mapped user-item
+    matrix rather than copying it; an item_item index is only partly shared,
+    since loading it builds per-worker neighbor lists and user histories.
+    """
+
+    def __init__(self, directory: str, keep: int = 3):
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, snapshot: ModelSnapshot) -> str:
+        """Write a snapshot and point LATEST at it; returns the version directory"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'v{snapshot.version:08d}'
+        target = os.path.join(self.directory, name)
+        if os.path.exists(target):
+            # Another process already published this version
+            return target
+
+        # Write into a scratch directory and rename, so readers never see a partial version
+        scratch = tempfile.mkdtemp(prefix=f'.{name}-', dir=self.directory)
+        try:
+            arrays = snapshot_to_arrays(snapshot)
+            for array_name, array in arrays.items():
+                np.save(os.path.join(scratch, f'{array_name}.npy'), np.ascontiguousarray(array))
+            manifest = {
+                'format': FORMAT_VERSION,
+                'snapshot': snapshot_metadata(snapshot),
+                'arrays': {
+                    array_name: {'dtype': str(array.dtype), 'shape': list(array.shape)}
+                    for array_name, array in arrays.items()
+                },
+            }
+            with open(os.path.join(scratch, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+                json.dump(manifest, file, indent=2)
+            os.rename(scratch, target)
+        except OSError:
+            shutil.rmtree(scratch, ignore_errors=True)
+            if os.path.exists(target):
+                return target
+            raise
+
+        self._write_latest(name)
+        self._prune()
+        return target
+
+    def versions(self) -> List[int]:
+        """Complete versions on disk, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            int(entry[1:]) for entry in os.listdir(self.directory)
+            if entry.startswith('v') and entry[1:].isdigit()
+            and os.path.exists(os.path.join(self.directory, entry, MANIFEST_NAME))
+        )
+
+    def latest_version(self) -> Optional[int]:
+        """Version named by LATEST, or None if nothing has been published"""
+        try:
+            with open(os.path.join(self.directory, LATEST_NAME), encoding='utf-8') as file:
+                return int(file.read().strip()[1:])
+        except (OSError, ValueError):
+            return None
+
+    def load(self, version: int, mmap: bool = True) -> ModelSnapshot:
+        """Load one version; arrays are memory-mapped read-only unless ``mmap`` is False"""
+        path = os.path.join(self.directory, f'v{version:08d}')
+        with open(os.path.join(path, MANIFEST_NAME), encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format in {path}: {manifest.get('format')}")
+
+        mmap_mode = 'r' if mmap else None
+        arrays = {
+            array_name: np.load(os.path.join(path, f'{array_name}.npy'), mmap_mode=mmap_mode)
+            for array_name in manifest['arrays']
+        }
+        return snapshot_from_arrays(manifest['snapshot'], arrays)
+
+    def load_latest(self, mmap: bool = True) -> Optional[ModelSnapshot]:
+        """Load the newest published version, or None if there is none"""
+        version = self.latest_version()
+        if version is None:
+            return None
+        return self.load(version, mmap=mmap)
+
+    def _write_latest(self, name: str):
+        """Atomically point LATEST at a version, never moving it backwards"""
+        current = self.latest_version()
+        if current is not None and current >= int(name[1:]):
+            return
+        fd, scratch = tempfile.mkstemp(prefix='.LATEST-', dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(name)
+        os.replace(scratch, os.path.join(self.directory, LATEST_NAME))
+
+    def _prune(self):
+        """Remove all but the newest ``keep`` versions"""
+        for version in self.versions()[:-self.keep]:
+            shutil.rmtree(os.path.join(self.directory, f'v{version:08d}'), ignore_errors=True)
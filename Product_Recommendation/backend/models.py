@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey, Text, Enum, Index, false
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -24,6 +24,10 @@ class User(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Keyset pagination within a category
+        Index("ix_products_category_id", "category", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
@@ -40,6 +44,12 @@ class Product(Base):
 
 class UserInteraction(Base):
     __tablename__ = "user_interactions"
+    __table_args__ = (
+        # A user's history, "has this user seen product X", and per-user time windows
+        Index("ix_user_interactions_user_product_created", "user_id", "product_id", "created_at"),
+        # Per-product counts and decay windows
+        Index("ix_user_interactions_product_created", "product_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -54,10 +64,24 @@ class UserInteraction(Base):
 
 class Recommendation(Base):
     __tablename__ = "recommendations"
+    __table_args__ = (
+        # Cached results of a user that are still within the TTL
+        Index("ix_recommendations_user_created", "user_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     score = Column(Float, nullable=False)
-    algorithm_type = Column(String, nullable=False)  # 'collaborative' or 'content_based'
-    created_at = Column(DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    algorithm_type = Column(String, nullable=False)  # 'collaborative', 'content_based', 'matrix_factorization' or 'hybrid'
+    # Written by the precompute job, which has its own freshness window
+    precomputed = Column(Boolean, nullable=False, default=False, server_default=false())
+    created_at = Column(DateTime, default=datetime.utcnow) 
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+    
+    # A single row, bumped in the same transaction as every catalog write
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
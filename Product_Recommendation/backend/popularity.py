@@ -0,0 +1,149 @@
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Product, UserInteraction, InteractionType
+from user_item_matrix import interaction_weight
+
+# Rescale stored scores before exp() of the decay exponent gets anywhere near overflow
+MAX_DECAY_EXPONENT = 50.0
+
+
+class _Leaderboard:
+    """Products ordered by score, kept sorted as scores change"""
+
+    def __init__(self):
+        self.scores: Dict[int, float] = {}
+        # (-score, product_id), ascending, so the best product comes first
+        self.order: List[Tuple[float, int]] = []
+
+    def set(self, product_id: int, score: float):
+        old = self.scores.get(product_id)
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, product_id))]
+        self.scores[product_id] = score
+        insort(self.order, (-score, product_id))
+
+    def top(self, limit: int) -> List[Tuple[int, float]]:
+        return [(product_id, -key) for key, product_id in self.order[:limit]]
+
+    def rescale(self, factor: float):
+        self.scores = {product_id: score * factor for product_id, score in self.scores.items()}
+        self.order = [(key * factor, product_id) for key, product_id in self.order]
+
+
+class PopularityCounter:
+    """Time-decayed, weighted interaction counts per product, overall and per category.
+
+    Each interaction adds its weight (the collaborative PURCHASE/LIKE/VIEW
+    weights scaled by rating), decaying exponentially with the given half-life.
+    Scores are kept with forward decay: weights are scaled up by
+    ``exp((t - landmark) / tau)`` when they arrive, so decay never reorders
+    stored scores and a leaderboard read is a slice of an already sorted list.
+
+    The counter is loaded once from the interactions table and then updated
+    per tracked interaction; interactions the load already read (by id) are
+    skipped.
+    """
+
+    def __init__(self, half_life: float = 7 * 24 * 3600):
+        self.half_life = half_life
+        self._tau = half_life / math.log(2)
+        self._landmark = time.time()
+        self._overall = _Leaderboard()
+        self._by_category: Dict[str, _Leaderboard] = {}
+        self._categories: Dict[int, str] = {}
+        self.max_interaction_id: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.max_interaction_id is not None
+
+    def ensure_loaded(self, db: Session, batch_size: int = 50000):
+        """Load counts from the database the first time they are needed"""
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            self._categories = dict(db.query(Product.id, Product.category))
+            max_interaction_id = 0
+            scores: Dict[int, float] = {}
+            query = db.query(
+                UserInteraction.id,
+                UserInteraction.product_id,
+                UserInteraction.interaction_type,
+                UserInteraction.rating,
+                UserInteraction.created_at
+            )
+            for interaction_id, product_id, interaction_type, rating, created_at in query.yield_per(batch_size):
+                max_interaction_id = max(max_interaction_id, interaction_id)
+                timestamp = created_at.replace(tzinfo=timezone.utc).timestamp() if created_at else time.time()
+                scores[product_id] = scores.get(product_id, 0.0) + self._forward_weight(
+                    interaction_weight(interaction_type, rating), timestamp
+                )
+            for product_id, score in scores.items():
+                self._set(product_id, score)
+            self.max_interaction_id = max_interaction_id
+
+    def add(self, product_id: int, interaction_type: InteractionType, rating: Optional[float] = None,
+            category: Optional[str] = None, interaction_id: Optional[int] = None,
+            timestamp: Optional[float] = None):
+        """Count a newly tracked interaction"""
+        with self._lock:
+            if not self.loaded:
+                # The initial load will read it from the database
+                return
+            if interaction_id is not None and interaction_id <= self.max_interaction_id:
+                return
+            if category is not None:
+                self._categories[product_id] = category
+            timestamp = time.time() if timestamp is None else timestamp
+            if (timestamp - self._landmark) / self._tau > MAX_DECAY_EXPONENT:
+                self._move_landmark(timestamp)
+            score = self._overall.scores.get(product_id, 0.0) + self._forward_weight(
+                interaction_weight(interaction_type, rating), timestamp
+            )
+            self._set(product_id, score)
+
+    def top(self, limit: int, category: Optional[str] = None,
+            now: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Most popular (product_id, decayed score) pairs, overall or within a category"""
+        now = time.time() if now is None else now
+        with self._lock:
+            decay = math.exp(-(now - self._landmark) / self._tau)
+            board = self._overall if category is None else self._by_category.get(category)
+            if board is None:
+                return []
+            return [(product_id, score * decay) for product_id, score in board.top(limit)]
+
+    def clear(self):
+        """Forget every count; the next use reloads them from the database"""
+        with self._lock:
+            self._overall = _Leaderboard()
+            self._by_category = {}
+            self._categories = {}
+            self.max_interaction_id = None
+
+    def _forward_weight(self, weight: float, timestamp: float) -> float:
+        return weight * math.exp((timestamp - self._landmark) / self._tau)
+
+    def _set(self, product_id: int, score: float):
+        self._overall.set(product_id, score)
+        category = self._categories.get(product_id)
+        if category is not None:
+            self._by_category.setdefault(category, _Leaderboard()).set(product_id, score)
+
+    def _move_landmark(self, landmark: float):
+        """Rescale every stored score to a later landmark; order is unchanged"""
+        factor = math.exp(-(landmark - self._landmark) / self._tau)
+        self._overall.rescale(factor)
+        for board in self._by_category.values():
+            board.rescale(factor)
+        self._landmark = landmark
@@ -0,0 +1,162 @@
+"""Nightly batch precompute of every user's recommendations.
+
+Builds (or reuses) one model snapshot, publishes it to a ModelStore and fans
+users out over a ``multiprocessing`` pool. Each worker memory-maps the same
+read-only snapshot, and the parent writes each chunk of results to the
+``recommendations`` table with one delete and one bulk insert. The rows are
+marked as precomputed, and the API serves them through RecommendationCache
+while they are younger than PRECOMPUTED_RECOMMENDATION_TTL (26 hours by
+default), so set it to cover the precompute interval.
+
+    python precompute_recommendations.py --workers 4 --shard-index 0 --shard-count 2
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import DATABASE_URL, create_tables
+from models import User
+from model_store import ModelStore
+from recommendation_cache import store_many_recommendations
+from recommendation_engine import RecommendationEngine, COLLABORATIVE_MODES
+from schemas import RecommendationResponse
+
+# Per-process state set up by _init_worker
+_worker_engine: Optional[RecommendationEngine] = None
+_worker_sessions: Optional[sessionmaker] = None
+_worker_limit = 20
+
+
+def _init_worker(database_url: str, model_dir: str, version: int, collaborative_mode: str, limit: int,
+                 als_weight: float = 0.0):
+    """Open a database engine of this process's own and map the shared snapshot"""
+    global _worker_engine, _worker_sessions, _worker_limit
+    _worker_sessions = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(database_url))
+    # Never rebuild: every worker serves the one snapshot the job was started with
+    _worker_engine = RecommendationEngine(collaborative_mode=collaborative_mode, refresh_interval=float('inf'),
+                                          als_weight=als_weight)
+    _worker_engine.use_snapshot(ModelStore(model_dir).load(version))
+    _worker_limit = limit
+
+
+def _compute_chunk(user_ids: List[int]) -> Dict[int, List[RecommendationResponse]]:
+    """Recommendations for a chunk of users, computed in a worker"""
+    db = _worker_sessions()
+    try:
+        return {
+            user_id: _worker_engine.get_recommendations(user_id, db, limit=_worker_limit)
+            for user_id in user_ids
+        }
+    finally:
+        db.close()
+
+
+def _shard_user_ids(db: Session, shard_index: int, shard_count: int) -> List[int]:
+    """Ids of the users in one shard (user id modulo shard count)"""
+    query = db.query(User.id)
+    if shard_count > 1:
+        query = query.filter(User.id % shard_count == shard_index)
+    return [user_id for user_id, in query.order_by(User.id)]
+
+
+def precompute_recommendations(database_url: str = DATABASE_URL, workers: int = 0,
+                               shard_index: int = 0, shard_count: int = 1, limit: int = 20,
+                               collaborative_mode: str = 'jaccard', model_dir: Optional[str] = None,
+                               rebuild: bool = False, chunk_size: int = 500, als_weight: float = 0.0,
+                               max_age: float = float('inf')) -> int:
+    """Compute and store recommendations for one shard of users; returns the number of users.
+
+    ``workers`` of 0 uses one process per CPU. The newest snapshot in
+    ``model_dir`` is reused unless ``rebuild`` is set, there is none or it was
+    built more than ``max_age`` seconds ago; without a ``model_dir`` a
+    snapshot is built into a temporary directory.
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} is outside 0..{shard_count - 1}")
+    workers = workers or os.cpu_count() or 1
+
+    sessions = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(database_url))
+    scratch = None
+    if model_dir is None:
+        scratch = tempfile.TemporaryDirectory(prefix='recommendation-models-')
+        model_dir = scratch.name
+
+    db = sessions()
+    try:
+        # The coordinator's engine only builds or loads the snapshot
+        engine = RecommendationEngine(collaborative_mode=collaborative_mode, model_store=ModelStore(model_dir),
+                                      als_weight=als_weight)
+        snapshot = engine.snapshot
+        if snapshot is None or rebuild or time.time() - snapshot.built_at > max_age:
+            snapshot = engine.rebuild(db)
+
+        user_ids = _shard_user_ids(db, shard_index, shard_count)
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+        init_args = (database_url, model_dir, snapshot.version, collaborative_mode, limit, als_weight)
+
+        if workers == 1:
+            _init_worker(*init_args)
+            results = map(_compute_chunk, chunks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=init_args)
+            results = pool.imap_unordered(_compute_chunk, chunks)
+
+        try:
+            for recommendations_by_user in results:
+                store_many_recommendations(db, recommendations_by_user, precomputed=True)
+                db.commit()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return len(user_ids)
+    finally:
+        db.close()
+        if scratch is not None:
+            scratch.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute recommendations for every user")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: one per CPU)")
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument("--shard-count", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=20, help="recommendations stored per user")
+    parser.add_argument("--chunk-size", type=int, default=500, help="users per worker task and bulk insert")
+    parser.add_argument("--collaborative-mode", choices=COLLABORATIVE_MODES,
+                        default=os.getenv("COLLABORATIVE_MODE", "jaccard"))
+    parser.add_argument("--model-dir", default=os.getenv("MODEL_DIR"))
+    parser.add_argument("--als-weight", type=float, default=float(os.getenv("ALS_WEIGHT", "0")),
+                        help="blend weight of the matrix-factorization signal (0 disables it)")
+    parser.add_argument("--rebuild", action="store_true", help="build a new snapshot even if one is stored")
+    # API workers with ALS leave rebuilding to this job, so a stored snapshot only lives this long
+    parser.add_argument("--max-age", type=float, default=float(os.getenv("MODEL_REFRESH_INTERVAL", "3600")),
+                        help="seconds after which the stored snapshot is rebuilt instead of reused")
+    args = parser.parse_args()
+
+    create_tables()
+    started = time.time()
+    count = precompute_recommendations(
+        workers=args.workers,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        limit=args.limit,
+        collaborative_mode=args.collaborative_mode,
+        model_dir=args.model_dir,
+        rebuild=args.rebuild,
+        chunk_size=args.chunk_size,
+        als_weight=args.als_weight,
+        max_age=args.max_age
+    )
+    print(f"Precomputed recommendations for {count} users in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from catalog import CatalogState, CatalogVersionCache
+from models import Product
+from schemas import ProductResponse
+
+
+class ProductCache:
+    """In-process LRU cache of serialized products keyed by id.
+
+    Misses are loaded with a single ``IN`` query per call, so hydrating a
+    whole recommendation list costs at most one round trip. Each entry also
+    keeps the product's JSON bytes, so endpoints can answer without pydantic.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        # product_id -> (ProductResponse, loaded_at, JSON bytes)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, product_ids: Iterable[int], db: Session) -> Dict[int, ProductResponse]:
+        """Return cached products for the given ids, loading the misses in one query"""
+        return {product_id: entry[0] for product_id, entry in self._lookup(product_ids, db).items()}
+
+    def get_many_json(self, product_ids: Iterable[int], db: Session) -> Dict[int, bytes]:
+        """Pre-serialized JSON of the given products, loading the misses in one query"""
+        return {product_id: entry[2] for product_id, entry in self._lookup(product_ids, db).items()}
+
+    def _lookup(self, product_ids: Iterable[int], db: Session) -> Dict[int, tuple]:
+        now = time.time()
+        found: Dict[int, tuple] = {}
+        missing = []
+
+        with self._lock:
+            for product_id in dict.fromkeys(product_ids):
+                entry = self._entries.get(product_id)
+                if entry is not None and now - entry[1] <= self.ttl:
+                    self._entries.move_to_end(product_id)
+                    found[product_id] = entry
+                else:
+                    missing.append(product_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            products = db.query(Product).filter(Product.id.in_(missing)).all()
+            loaded = {}
+            for product in products:
+                response = ProductResponse.from_orm(product)
+                loaded[product.id] = (response, now, response.model_dump_json().encode())
+            with self._lock:
+                for product_id, entry in loaded.items():
+                    self._entries[product_id] = entry
+                    self._entries.move_to_end(product_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            found.update(loaded)
+
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        """Lookup counters (per product id) and current size"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def invalidate(self, product_ids: Optional[Iterable[int]] = None):
+        """Drop the given products, or everything when no ids are given"""
+        with self._lock:
+            if product_ids is None:
+                self._entries.clear()
+            else:
+                for product_id in product_ids:
+                    self._entries.pop(product_id, None)
+
+
+class CatalogCache(ProductCache):
+    """ProductCache that also holds the category list and serves catalog pages.
+
+    Everything is keyed by the catalog version: the first lookup that sees a
+    new version drops all entries, so a product write is reflected as soon as
+    the version is re-read (see CatalogVersionCache). A page's ids always come
+    from an indexed keyset query, so its cost does not grow with the catalog;
+    product bodies are served from the LRU.
+    """
+
+    def __init__(self, catalog_version: CatalogVersionCache, max_size: int = 10000, ttl: float = 300):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.catalog_version = catalog_version
+        self._version: Optional[int] = None
+        self._categories: Optional[bytes] = None
+
+    def state(self, db: Session) -> CatalogState:
+        """The current catalog version, dropping every entry built for an older one"""
+        state = self.catalog_version.current(db)
+        if state.version != self._version:
+            self.invalidate()
+            with self._lock:
+                self._version = state.version
+        return state
+
+    def _lookup(self, product_ids: Iterable[int], db: Session) -> Dict[int, tuple]:
+        self.state(db)
+        return super()._lookup(product_ids, db)
+
+    def product_json(self, product_id: int, db: Session) -> Optional[bytes]:
+        """One product's JSON, or None if it does not exist"""
+        return self.get_many_json([product_id], db).get(product_id)
+
+    def categories_json(self, db: Session) -> bytes:
+        """JSON list of the distinct non-empty categories"""
+        self.state(db)
+        categories = self._categories
+        if categories is None:
+            rows = db.query(Product.category).distinct().all()
+            categories = json.dumps([row[0] for row in rows if row[0]]).encode()
+            with self._lock:
+                self._categories = categories
+        return categories
+
+    def page_ids(self, db: Session, category: Optional[str] = None, cursor: Optional[int] = None,
+                 skip: int = 0, limit: int = 50) -> List[int]:
+        """Ids of one page ordered by id: a keyset seek past ``cursor``, else ``skip`` rows"""
+        query = db.query(Product.id)
+        if category:
+            query = query.filter(Product.category == category)
+        if cursor is not None:
+            query = query.filter(Product.id > cursor)
+        query = query.order_by(Product.id)
+        if cursor is None and skip > 0:
+            query = query.offset(skip)
+        return [product_id for product_id, in query.limit(max(limit, 0))]
+
+    def page_json(self, db: Session, category: Optional[str] = None, cursor: Optional[int] = None,
+                  skip: int = 0, limit: int = 50) -> Tuple[bytes, Optional[int]]:
+        """A page of products ordered by id as a JSON array, and the next cursor if the page is full"""
+        # Ids come from the (category, id) index at constant cost per page; only bodies are cached
+        page = self.page_ids(db, category, cursor, skip, limit)
+        products = self.get_many_json(page, db)
+        body = b'[' + b','.join(products[product_id] for product_id in page if product_id in products) + b']'
+        next_cursor = page[-1] if page and len(page) == limit else None
+        return body, next_cursor
+
+    def invalidate(self, product_ids: Optional[Iterable[int]] = None):
+        """Drop the given products, or everything (including the category list) when no ids are given"""
+        super().invalidate(product_ids)
+        if product_ids is None:
+            with self._lock:
+                self._categories = None
+
+
+class ProductIdSet:
+    """Cached set of existing product ids for validating incoming interactions.
+
+    Reloaded with one column-only query after ``ttl`` seconds, or sooner when
+    an unknown id shows up (at most once per ``min_reload_interval``).
+    """
+
+    def __init__(self, ttl: float = 60, min_reload_interval: float = 1.0):
+        self.ttl = ttl
+        self.min_reload_interval = min_reload_interval
+        self._ids: Set[int] = set()
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def missing(self, product_ids: Iterable[int], db: Session) -> Set[int]:
+        """The given ids that are not existing products"""
+        product_ids = set(product_ids)
+        with self._lock:
+            now = time.time()
+            age = now - self._loaded_at if self._loaded_at is not None else None
+            missing = product_ids - self._ids
+            if age is None or age > self.ttl or (missing and age > self.min_reload_interval):
+                self._ids = {product_id for product_id, in db.query(Product.id)}
+                self._loaded_at = now
+                missing = product_ids - self._ids
+            return missing
+
+    def invalidate(self):
+        """Reload on next use"""
+        with self._lock:
+            self._loaded_at = None
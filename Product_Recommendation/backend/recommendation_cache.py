@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, insert, or_
+from sqlalchemy.orm import Session
+
+from models import Product, Recommendation
+from schemas import ProductResponse, RecommendationResponse
+
+
+def store_recommendations(db: Session, user_id: int, recommendations: List[RecommendationResponse],
+                          created_at: Optional[datetime] = None):
+    """Replace a user's rows in the recommendations table (caller commits)"""
+    store_many_recommendations(db, {user_id: recommendations}, created_at)
+
+
+def store_many_recommendations(db: Session, recommendations_by_user: Dict[int, List[RecommendationResponse]],
+                               created_at: Optional[datetime] = None, precomputed: bool = False):
+    """Replace several users' rows with one delete and one bulk insert (caller commits).
+
+    ``precomputed`` marks rows written by the batch job, which stay fresh for
+    RecommendationCache's ``precomputed_ttl`` instead of its ``ttl``.
+    """
+    if not recommendations_by_user:
+        return
+    created_at = created_at or datetime.utcnow()
+    db.query(Recommendation).filter(
+        Recommendation.user_id.in_(list(recommendations_by_user))
+    ).delete(synchronize_session=False)
+    rows = [
+        {
+            'user_id': user_id,
+            'product_id': rec.product.id,
+            'score': rec.score,
+            'algorithm_type': rec.algorithm_type,
+            'precomputed': precomputed,
+            'created_at': created_at,
+        }
+        for user_id, recommendations in recommendations_by_user.items()
+        for rec in recommendations
+    ]
+    if rows:
+        db.execute(insert(Recommendation), rows)
+
+
+def load_recommendations(db: Session, user_id: int, ttl: float, precomputed_ttl: Optional[float] = None,
+                         now: Optional[datetime] = None) -> Tuple[List[RecommendationResponse], Optional[datetime]]:
+    """A user's stored recommendations that are still fresh, best first, in one query.
+
+    Rows are fresh for ``ttl`` seconds after they were stored, or for
+    ``precomputed_ttl`` (default ``ttl``) if the batch job wrote them. Also
+    returns when the first of them goes stale.
+    """
+    now = now or datetime.utcnow()
+    precomputed_ttl = ttl if precomputed_ttl is None else precomputed_ttl
+    rows = db.query(
+        Recommendation.score, Recommendation.algorithm_type, Recommendation.precomputed, Recommendation.created_at,
+        Product
+    ).join(
+        Product, Product.id == Recommendation.product_id
+    ).filter(
+        Recommendation.user_id == user_id,
+        or_(
+            and_(Recommendation.precomputed.is_(False),
+                 Recommendation.created_at >= now - timedelta(seconds=ttl)),
+            and_(Recommendation.precomputed.is_(True),
+                 Recommendation.created_at >= now - timedelta(seconds=precomputed_ttl)),
+        )
+    ).order_by(
+        Recommendation.score.desc()
+    ).all()
+    recommendations = [
+        RecommendationResponse(
+            product=ProductResponse.from_orm(product),
+            score=score,
+            algorithm_type=algorithm_type
+        )
+        for score, algorithm_type, _, _, product in rows
+    ]
+    expires_at = min((
+        created_at + timedelta(seconds=precomputed_ttl if precomputed else ttl)
+        for _, _, precomputed, created_at, _ in rows
+    ), default=None)
+    return recommendations, expires_at
+
+
+class RecommendationCache:
+    """Per-user recommendation results: in-process LRU in front of the recommendations table.
+
+    Results are always computed ``depth`` deep (or deeper if a request asks
+    for more), so any smaller limit is served by slicing. Entries expire
+    after ``ttl`` seconds and are invalidated when the user records a new
+    interaction. Other workers' LRU entries are only bounded by the TTL.
+
+    Rows from the precompute job are served for ``precomputed_ttl`` seconds,
+    long enough to last until the next run, but still sit in memory for at
+    most ``ttl``: a new interaction deletes them from the table, and the
+    other workers must notice within the usual bound.
+    """
+
+    def __init__(self, ttl: float = 900, max_size: int = 10000, depth: int = 20,
+                 precomputed_ttl: float = 26 * 3600):
+        self.ttl = ttl
+        self.precomputed_ttl = precomputed_ttl
+        self.max_size = max_size
+        self.depth = depth
+        # user_id -> (expires_at, depth computed for, recommendations)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # Lookups served from memory, from the table, or not at all
+        self.memory_hits = 0
+        self.table_hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, limit: int, db: Session) -> Optional[List[RecommendationResponse]]:
+        """Cached recommendations for a user, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, depth, recommendations = entry
+                if now < expires_at and (limit <= depth or len(recommendations) >= limit):
+                    self._entries.move_to_end(user_id)
+                    self.memory_hits += 1
+                    return recommendations[:limit]
+                if now >= expires_at:
+                    del self._entries[user_id]
+
+        utcnow = datetime.utcnow()
+        recommendations, expires_at = load_recommendations(db, user_id, self.ttl, self.precomputed_ttl, utcnow)
+        if not recommendations or (limit > self.depth and len(recommendations) < limit):
+            with self._lock:
+                self.misses += 1
+            return None
+        # Keep table rows in memory for the rest of their window, but never longer than the TTL
+        remaining = min((expires_at - utcnow).total_seconds(), self.ttl)
+        self._remember(user_id, max(self.depth, len(recommendations)), recommendations, now + remaining)
+        with self._lock:
+            self.table_hits += 1
+        return recommendations[:limit]
+
+    def put(self, user_id: int, recommendations: List[RecommendationResponse], depth: int, db: Session):
+        """Store freshly computed recommendations in memory and in the table"""
+        store_recommendations(db, user_id, recommendations)
+        db.commit()
+        self._remember(user_id, depth, recommendations, time.time() + self.ttl)
+
+    def invalidate(self, user_id: int, db: Session):
+        """Forget a user's cached results, in memory and in the table (caller commits)"""
+        self.invalidate_many([user_id], db)
+
+    def invalidate_many(self, user_ids: Iterable[int], db: Session):
+        """Forget several users' cached results with one delete (caller commits)"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+        db.query(Recommendation).filter(Recommendation.user_id.in_(user_ids)).delete(synchronize_session=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Lookup counters and current in-memory size"""
+        return {
+            'memory_hits': self.memory_hits,
+            'table_hits': self.table_hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+        }
+
+    def clear(self):
+        """Drop every in-memory entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, user_id: int, depth: int, recommendations: List[RecommendationResponse],
+                  expires_at: float):
+        with self._lock:
+            self._entries[user_id] = (expires_at, depth, recommendations)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
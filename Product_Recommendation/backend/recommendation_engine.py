@@ -1,28 +1,255 @@
-import numpy as np
-import pandas as pd
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Dict, Tuple
-from models import User, Product, UserInteraction, InteractionType
-from schemas import RecommendationResponse, ProductResponse
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import pickle
-import os
+from typing import List, Dict, Tuple, Optional, Union
+from models import UserInteraction, InteractionType
+from schemas import ProductResponse, RecommendationResponse
+from concurrent.futures import Future, ThreadPoolExecutor
+from user_item_matrix import interaction_weight
+from product_cache import ProductCache
+from model_snapshot import ModelSnapshot, build_snapshot
+from model_store import ModelStore
+from shared_model_store import SharedModelStore
+from popularity import PopularityCounter
+from metrics import stage_timer
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 'jaccard' scans interactions per request, 'sparse' keeps a CSR user x product matrix,
+# 'item_item' serves from a precomputed item co-occurrence neighbor index
+COLLABORATIVE_MODES = ('jaccard', 'sparse', 'item_item')
 
 class RecommendationEngine:
-    def __init__(self):
-        self.content_vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
-        self.content_similarity_matrix = None
-        self.last_update = None
+    """Hybrid recommender serving from an immutable ModelSnapshot.
+
+    Models are rebuilt on a single background worker and swapped in
+    atomically; requests never wait for a rebuild. Until the first snapshot
+    is ready, content-based results are empty and collaborative results fall
+    back to the per-request Jaccard scan.
+    
+    With a ``model_store`` the newest snapshot on disk is memory-mapped at
+    startup, and a worker whose snapshot goes stale first picks up a fresher
+    one published by another process before rebuilding (and publishing) its own.
+    With ``rebuild_locally=False`` the engine never builds: it serves whatever
+    version the store holds and switches as soon as a newer one is published,
+    e.g. by the builder process of a SharedModelStore. ALS training is a long
+    CPU-bound loop, so serving processes pass ``train_als=False`` and load its
+    factors from snapshots that the builder or precompute job published.
+
+    A snapshot's arrays are never copied after the build: interactions
+    tracked since then go into a small DeltaUserItemMatrix beside the sparse
+    matrix, which keeps merges cheap and lets workers share a stored matrix
+    in place; the next full rebuild compacts them. The item_item index cannot be shared
+    that way, as loading it turns its neighbor lists and user histories into
+    per-worker Python structures that tracked interactions update in place.
+    A ModelStore still persists it, but a SharedModelStore refuses it.
+    """
+    
+    def __init__(self, collaborative_mode: str = 'jaccard', content_neighbors: int = 100,
+                 refresh_interval: float = 3600, model_store: Optional[Union[ModelStore, SharedModelStore]] = None,
+                 popularity_half_life: float = 7 * 24 * 3600, als_weight: float = 0.0, als_factors: int = 32,
+                 ann_min_items: Optional[int] = 50000, ann_nprobe: int = 8,
+                 product_cache: Optional[ProductCache] = None, rebuild_locally: bool = True,
+                 train_als: bool = True):
+        if collaborative_mode not in COLLABORATIVE_MODES:
+            raise ValueError(f"Unknown collaborative mode: {collaborative_mode}")
+        if not rebuild_locally and model_store is None:
+            raise ValueError("rebuild_locally=False needs a model_store to follow")
+        if collaborative_mode == 'item_item' and isinstance(model_store, SharedModelStore):
+            raise ValueError("item_item neighbor indexes are loaded into per-worker memory; "
+                             "share 'sparse' models through a SharedModelStore instead")
+        self.collaborative_mode = collaborative_mode
+        self.content_neighbors = content_neighbors
+        self.refresh_interval = refresh_interval
+        self.model_store = model_store
+        self.rebuild_locally = rebuild_locally
+        # Blend weight of the matrix-factorization signal; 0 skips training it
+        self.als_weight = als_weight
+        self.als_factors = als_factors
+        # Whether rebuild() trains ALS itself rather than leaving it to an offline builder
+        self.train_als = train_als
+        # Catalog size from which neighbor search goes through an IVF index, and its recall knob
+        self.ann_min_items = ann_min_items
+        self.ann_nprobe = ann_nprobe
+        # Shared with the catalog endpoints when given, so hydration reuses their entries
+        self.product_cache = product_cache if product_cache is not None else ProductCache()
+        # Cold-start ranking, updated per tracked interaction in every mode
+        self.popularity = PopularityCounter(half_life=popularity_half_life)
+        
+        self.snapshot: Optional[ModelSnapshot] = None
+        # Interactions tracked since the current snapshot was built:
+        # (interaction_id, user_id, product_id, interaction_type, rating)
+        self._pending_interactions: List[Tuple] = []
+        self._lock = threading.Lock()
+        # Serializes snapshot swaps, which replay interactions outside _lock
+        self._install_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-rebuild')
+        self._rebuild_future: Optional[Future] = None
         
+        if model_store is not None:
+            self._load_from_store()
+    
+    def record_interaction(self, user_id: int, product_id: int,
+                           interaction_type: InteractionType, rating: Optional[float] = None,
+                           interaction_id: Optional[int] = None, category: Optional[str] = None):
+        """Feed a newly tracked interaction into the in-memory models"""
+        self.popularity.add(product_id, interaction_type, rating, category=category, interaction_id=interaction_id)
+        if self.collaborative_mode == 'jaccard':
+            # Nothing cached; the Jaccard scan reads interactions per request
+            return
+        with self._lock:
+            self._pending_interactions.append((interaction_id, user_id, product_id, interaction_type, rating))
+            if self.snapshot is not None and self.snapshot.item_neighbors is not None:
+                self.snapshot.item_neighbors.add_interaction(user_id, product_id, interaction_type, rating)
+    
+    def rebuild(self, db: Session) -> ModelSnapshot:
+        """Build a new snapshot from the database, swap it in and publish it"""
+        versions = [self.snapshot.version if self.snapshot is not None else 0]
+        if self.model_store is not None:
+            versions.append(self.model_store.latest_version() or 0)
+        with stage_timer('rebuild'):
+            snapshot = build_snapshot(db, max(versions) + 1, self.collaborative_mode, self.content_neighbors,
+                                      als_factors=self.als_factors if self.als_weight > 0 and self.train_als else 0,
+                                      ann_min_items=self.ann_min_items, ann_nprobe=self.ann_nprobe)
+        
+        # Publish exactly what was read from the database, before any replay
+        if self.model_store is not None:
+            self.model_store.save(snapshot)
+        return self._install(snapshot)
+    
+    def use_snapshot(self, snapshot: ModelSnapshot) -> ModelSnapshot:
+        """Serve from a snapshot built elsewhere, e.g. one loaded from a ModelStore"""
+        return self._install(snapshot)
+    
+    def _install(self, snapshot: ModelSnapshot) -> ModelSnapshot:
+        """Swap in a snapshot after replaying interactions it does not reflect"""
+        with self._install_lock:
+            with self._lock:
+                pending, self._pending_interactions = self._pending_interactions, []
+            # Replay interactions the build did not read without holding up record_interaction
+            replay = [
+                event for event in pending
+                if event[0] is None or event[0] > snapshot.max_interaction_id
+            ]
+            if snapshot.user_item_matrix is not None:
+                snapshot = snapshot._replace(
+                    user_item_matrix=snapshot.user_item_matrix.with_delta(event[1:] for event in replay)
+                )
+            if snapshot.item_neighbors is not None:
+                for event in replay:
+                    snapshot.item_neighbors.add_interaction(*event[1:])
+            with self._lock:
+                # Events tracked during the replay went to the old snapshot; carry them over
+                arrived = self._pending_interactions
+                if snapshot.item_neighbors is not None:
+                    for event in arrived:
+                        snapshot.item_neighbors.add_interaction(*event[1:])
+                self._pending_interactions = arrived if snapshot.user_item_matrix is not None else []
+                self.snapshot = snapshot
+        return snapshot
+    
+    def schedule_rebuild(self, db: Session, full: bool = True) -> Future:
+        """Start a background rebuild unless one is already running"""
+        with self._lock:
+            if self._rebuild_future is None or self._rebuild_future.done():
+                job = self._run_rebuild if full else self._run_merge
+                self._rebuild_future = self._executor.submit(job, db.get_bind())
+            return self._rebuild_future
+    
+    def wait_for_rebuild(self, timeout: Optional[float] = None):
+        """Block until the running background rebuild (if any) finishes"""
+        future = self._rebuild_future
+        if future is not None:
+            future.result(timeout)
+    
+    def _refresh_in_background(self, db: Session):
+        """Schedule a rebuild when the snapshot is missing, stale or behind on interactions"""
+        snapshot = self.snapshot
+        if not self.rebuild_locally:
+            # Checking the store's version is cheap; only a newer one is worth a background load
+            latest = self.model_store.latest_version()
+            if latest is not None and (snapshot is None or latest > snapshot.version):
+                self.schedule_rebuild(db)
+            elif snapshot is not None and snapshot.user_item_matrix is not None and self._pending_interactions:
+                self.schedule_rebuild(db, full=False)
+        elif snapshot is None or time.time() - snapshot.built_at > self.refresh_interval:
+            self.schedule_rebuild(db)
+        elif snapshot.user_item_matrix is not None and self._pending_interactions:
+            self.schedule_rebuild(db, full=False)
+    
+    def _load_from_store(self) -> bool:
+        """Install the newest stored snapshot if it is newer than ours and usable"""
+        try:
+            snapshot = self.model_store.load_latest()
+        except (OSError, ValueError, KeyError):
+            logger.exception("Could not load recommendation model snapshot")
+            return False
+        if snapshot is None or (self.snapshot is not None and snapshot.version <= self.snapshot.version):
+            return False
+        if (self.collaborative_mode == 'sparse') != (snapshot.user_item_matrix is not None) or \
+                (self.collaborative_mode == 'item_item') != (snapshot.item_neighbors is not None) or \
+                (self.als_weight > 0 and snapshot.als is None):
+            # Built for another collaborative mode, or without the ALS model
+            return False
+        self._install(snapshot)
+        return True
+    
+    def _run_rebuild(self, bind):
+        """Background job: full rebuild on a session of its own"""
+        if not self.rebuild_locally:
+            self._load_from_store()
+            return
+        if (self.model_store is not None and self._load_from_store() and
+                time.time() - self.snapshot.built_at <= self.refresh_interval):
+            # Another process already published a fresh snapshot
+            return
+        db = Session(bind=bind)
+        try:
+            self.rebuild(db)
+        except Exception:
+            logger.exception("Recommendation model rebuild failed")
+        finally:
+            db.close()
+    
+    def _run_merge(self, bind):
+        """Background job: add pending interactions to the user-item matrix's delta"""
+        with self._lock:
+            snapshot = self.snapshot
+            pending, self._pending_interactions = self._pending_interactions, []
+        matrix = snapshot.user_item_matrix.with_delta(event[1:] for event in pending)
+        with self._lock:
+            if self.snapshot is snapshot:
+                self.snapshot = snapshot._replace(user_item_matrix=matrix)
+            else:
+                # A full rebuild won the race; keep the events for its successor
+                self._pending_interactions = pending + self._pending_interactions
+    
     def get_recommendations(self, user_id: int, db: Session, limit: int = 10) -> List[RecommendationResponse]:
         """Get recommendations using hybrid approach (collaborative + content-based)"""
+        self._refresh_in_background(db)
+        # Every stage of this request reads the same model version
+        snapshot = self.snapshot
+        
+        # Load the user's history once and share it between both stages
+        with stage_timer('user_interactions'):
+            user_interactions = db.query(UserInteraction).filter(
+                UserInteraction.user_id == user_id
+            ).all()
+        
         # Get collaborative filtering recommendations
-        collaborative_recs = self._get_collaborative_recommendations(user_id, db, limit // 2)
+        with stage_timer('collaborative'):
+            collaborative_recs = self._get_collaborative_recommendations(user_id, db, limit // 2, user_interactions, snapshot)
         
         # Get content-based recommendations
-        content_recs = self._get_content_based_recommendations(user_id, db, limit // 2)
+        with stage_timer('content_based'):
+            content_recs = self._get_content_based_recommendations(user_id, db, limit // 2, user_interactions, snapshot)
+        
+        # Get matrix-factorization recommendations
+        als_recs = []
+        if self.als_weight > 0:
+            with stage_timer('matrix_factorization'):
+                als_recs = self._get_als_recommendations(user_id, db, limit // 2, user_interactions, snapshot)
         
         # Combine and deduplicate recommendations
         all_recs = {}
@@ -30,7 +257,7 @@ class RecommendationEngine:
         # Add collaborative recommendations with higher weight
         for rec in collaborative_recs:
             all_recs[rec['product_id']] = {
-                'product': rec['product'],
+                'product_id': rec['product_id'],
                 'score': rec['score'] * 0.7,  # Weight collaborative filtering higher
                 'algorithm_type': 'collaborative'
             }
@@ -43,29 +270,60 @@ class RecommendationEngine:
                 all_recs[rec['product_id']]['algorithm_type'] = 'hybrid'
             else:
                 all_recs[rec['product_id']] = {
-                    'product': rec['product'],
+                    'product_id': rec['product_id'],
                     'score': rec['score'] * 0.3,
                     'algorithm_type': 'content_based'
                 }
         
+        # Add matrix-factorization recommendations
+        for rec in als_recs:
+            if rec['product_id'] in all_recs:
+                all_recs[rec['product_id']]['score'] += rec['score'] * self.als_weight
+                all_recs[rec['product_id']]['algorithm_type'] = 'hybrid'
+            else:
+                all_recs[rec['product_id']] = {
+                    'product_id': rec['product_id'],
+                    'score': rec['score'] * self.als_weight,
+                    'algorithm_type': 'matrix_factorization'
+                }
+        
         # Sort by score and return top recommendations
         sorted_recs = sorted(all_recs.values(), key=lambda x: x['score'], reverse=True)[:limit]
         
+        # Hydrate every recommended product with a single batched lookup
+        with stage_timer('hydration'):
+            products = self.product_cache.get_many([rec['product_id'] for rec in sorted_recs], db)
+        
         return [
             RecommendationResponse(
-                product=rec['product'],
+                product=products[rec['product_id']],
                 score=rec['score'],
                 algorithm_type=rec['algorithm_type']
             )
             for rec in sorted_recs
+            if rec['product_id'] in products
         ]
     
-    def _get_collaborative_recommendations(self, user_id: int, db: Session, limit: int) -> List[Dict]:
+    def get_popular_products(self, db: Session, limit: int = 10, category: Optional[str] = None) -> List[ProductResponse]:
+        """Trending products, overall or within a category"""
+        popular = self._get_popular_products(db, limit, category)
+        products = self.product_cache.get_many([rec['product_id'] for rec in popular], db)
+        return [products[rec['product_id']] for rec in popular if rec['product_id'] in products]
+    
+    def _get_collaborative_recommendations(self, user_id: int, db: Session, limit: int,
+                                           user_interactions: Optional[List[UserInteraction]] = None,
+                                           snapshot: Optional[ModelSnapshot] = None) -> List[Dict]:
         """Collaborative filtering based on user similarities"""
+        if snapshot is None:
+            snapshot = self.snapshot
+        user_item_matrix = snapshot.user_item_matrix if snapshot is not None else None
+        item_neighbors = snapshot.item_neighbors if snapshot is not None else None
+        
         # Get user's interactions
-        user_interactions = db.query(UserInteraction).filter(
-            UserInteraction.user_id == user_id
-        ).all()
+        if user_interactions is None:
+            user_interactions = db.query(UserInteraction).filter(
+                UserInteraction.user_id == user_id
+            ).all()
         
         if not user_interactions:
             # New user - return popular products
@@ -74,13 +332,42 @@ class RecommendationEngine:
         # Get products the user has interacted with
         user_products = {interaction.product_id for interaction in user_interactions}
         
-        # Find similar users based on common product interactions
-        similar_users = self._find_similar_users(user_id, user_products, db)
+        if item_neighbors is not None:
+            # Merge precomputed neighbors of the user's recent items
+            recent_items = self._recent_item_weights(user_interactions, item_neighbors.max_user_history)
+            recommendations = item_neighbors.recommend(recent_items, user_products)
+        elif user_item_matrix is not None:
+            # One sparse product against the snapshot matrix instead of a table scan
+            similar_users = user_item_matrix.similar_users(user_id, user_products, top_k=10)
+            recommendations = user_item_matrix.score_products(similar_users, user_products)
+        else:
+            # Find similar users based on common product interactions
+            similar_users = self._find_similar_users(user_id, user_products, db)
+            
+            # Get recommendations from similar users
+            recommendations = self._score_similar_user_products(similar_users[:10], user_products, db)
         
-        # Get recommendations from similar users
+        # Products are hydrated once by get_recommendations
+        return [
+            {'product_id': product_id, 'score': score}
+            for product_id, score in sorted(recommendations.items(), key=lambda x: x[1], reverse=True)[:limit]
+        ]
+    
+    def _recent_item_weights(self, user_interactions: List[UserInteraction], max_items: int) -> List[Tuple[int, float]]:
+        """Summed interaction weight per product for the user's most recent products"""
+        weights = {}
+        for interaction in sorted(user_interactions, key=lambda i: i.id, reverse=True):
+            if interaction.product_id not in weights and len(weights) >= max_items:
+                continue
+            weight = interaction_weight(interaction.interaction_type, interaction.rating)
+            weights[interaction.product_id] = weights.get(interaction.product_id, 0.0) + weight
+        return list(weights.items())
+    
+    def _score_similar_user_products(self, similar_users: List[Tuple[int, float]], user_products: set, db: Session) -> Dict[int, float]:
+        """Score products interacted with by similar users, one query per similar user"""
         recommendations = {}
         
-        for similar_user_id, similarity_score in similar_users[:10]:  # Top 10 similar users
+        for similar_user_id, similarity_score in similar_users:
             similar_user_interactions = db.query(UserInteraction).filter(
                 UserInteraction.user_id == similar_user_id,
                 UserInteraction.product_id.notin_(user_products)  # Exclude products user already knows
@@ -106,18 +393,7 @@ class RecommendationEngine:
                 else:
                     recommendations[product_id] = base_score
         
-        # Get product details and format recommendations
-        product_recs = []
-        for product_id, score in sorted(recommendations.items(), key=lambda x: x[1], reverse=True)[:limit]:
-            product = db.query(Product).filter(Product.id == product_id).first()
-            if product:
-                product_recs.append({
-                    'product_id': product_id,
-                    'product': ProductResponse.from_orm(product),
-                    'score': score
-                })
-        
-        return product_recs
+        return recommendations
     
     def _find_similar_users(self, user_id: int, user_products: set, db: Session) -> List[Tuple[int, float]]:
         """Find users with similar product interactions"""
@@ -146,118 +422,76 @@ class RecommendationEngine:
         
         return sorted(similarities, key=lambda x: x[1], reverse=True)
     
-    def _get_content_based_recommendations(self, user_id: int, db: Session, limit: int) -> List[Dict]:
+    def _get_content_based_recommendations(self, user_id: int, db: Session, limit: int,
+                                           user_interactions: Optional[List[UserInteraction]] = None,
+                                           snapshot: Optional[ModelSnapshot] = None) -> List[Dict]:
         """Content-based filtering using product features"""
+        if snapshot is None:
+            snapshot = self.snapshot
+        if snapshot is None or snapshot.content_index is None:
+            # Models not built yet; a background rebuild is on its way
+            return []
+        
         # Get user's interaction history
-        user_interactions = db.query(UserInteraction).filter(
-            UserInteraction.user_id == user_id
-        ).all()
+        if user_interactions is None:
+            user_interactions = db.query(UserInteraction).filter(
+                UserInteraction.user_id == user_id
+            ).all()
         
         if not user_interactions:
             return []
         
         # Get liked/purchased products
-        liked_products = []
-        for interaction in user_interactions:
-            if interaction.interaction_type in [InteractionType.LIKE, InteractionType.PURCHASE]:
-                product = db.query(Product).filter(Product.id == interaction.product_id).first()
-                if product:
-                    liked_products.append(product)
+        liked_product_ids = {
+            interaction.product_id for interaction in user_interactions
+            if interaction.interaction_type in [InteractionType.LIKE, InteractionType.PURCHASE]
+        }
         
-        if not liked_products:
+        if not liked_product_ids:
             return []
         
-        # Build or update content similarity matrix
-        self._update_content_similarity_matrix(db)
-        
-        # Get all products
-        all_products = db.query(Product).all()
-        product_id_to_index = {product.id: idx for idx, product in enumerate(all_products)}
-        
-        # Calculate content-based scores
-        recommendations = {}
+        # Max similarity to any liked product, excluding products already interacted with
         interacted_product_ids = {interaction.product_id for interaction in user_interactions}
+        recommendations = snapshot.content_index.top_similar(liked_product_ids, interacted_product_ids, limit)
         
-        for liked_product in liked_products:
-            if liked_product.id in product_id_to_index:
-                liked_idx = product_id_to_index[liked_product.id]
-                
-                # Get similar products based on content
-                similarities = self.content_similarity_matrix[liked_idx]
-                
-                for idx, similarity in enumerate(similarities):
-                    product = all_products[idx]
-                    
-                    # Skip products user already interacted with
-                    if product.id in interacted_product_ids:
-                        continue
-                    
-                    if similarity > 0.1:  # Minimum similarity threshold
-                        if product.id in recommendations:
-                            recommendations[product.id] = max(recommendations[product.id], similarity)
-                        else:
-                            recommendations[product.id] = similarity
-        
-        # Format recommendations
-        product_recs = []
-        for product_id, score in sorted(recommendations.items(), key=lambda x: x[1], reverse=True)[:limit]:
-            product = db.query(Product).filter(Product.id == product_id).first()
-            if product:
-                product_recs.append({
-                    'product_id': product_id,
-                    'product': ProductResponse.from_orm(product),
-                    'score': score
-                })
-        
-        return product_recs
+        # Products are hydrated once by get_recommendations
+        return [
+            {'product_id': product_id, 'score': score}
+            for product_id, score in recommendations
+        ]
     
-    def _update_content_similarity_matrix(self, db: Session):
-        """Update content similarity matrix if needed"""
-        # Check if we need to update (simple time-based check)
-        import time
-        current_time = time.time()
-        
-        if (self.last_update is None or 
-            current_time - self.last_update > 3600 or  # Update every hour
-            self.content_similarity_matrix is None):
-            
-            # Get all products
-            products = db.query(Product).all()
-            
-            # Create content features (category + description)
-            content_features = []
-            for product in products:
-                feature_text = f"{product.category} {product.description or ''}"
-                content_features.append(feature_text)
-            
-            # Calculate TF-IDF and similarity matrix
-            if content_features:
-                tfidf_matrix = self.content_vectorizer.fit_transform(content_features)
-                self.content_similarity_matrix = cosine_similarity(tfidf_matrix)
-                self.last_update = current_time
+    def _get_als_recommendations(self, user_id: int, db: Session, limit: int,
+                                 user_interactions: Optional[List[UserInteraction]] = None,
+                                 snapshot: Optional[ModelSnapshot] = None) -> List[Dict]:
+        """Matrix-factorization scores from the user's folded-in factor vector"""
+        if snapshot is None:
+            snapshot = self.snapshot
+        if snapshot is None or snapshot.als is None:
+            return []
+        
+        if user_interactions is None:
+            user_interactions = db.query(UserInteraction).filter(
+                UserInteraction.user_id == user_id
+            ).all()
+        
+        product_weights = {}
+        for interaction in user_interactions:
+            weight = interaction_weight(interaction.interaction_type, interaction.rating)
+            product_weights[interaction.product_id] = product_weights.get(interaction.product_id, 0.0) + weight
+        
+        # Products are hydrated once by get_recommendations
+        return [
+            {'product_id': product_id, 'score': score}
+            for product_id, score in snapshot.als.recommend(product_weights, set(product_weights), limit)
+        ]
     
-    def _get_popular_products(self, db: Session, limit: int) -> List[Dict]:
+    def _get_popular_products(self, db: Session, limit: int, category: Optional[str] = None) -> List[Dict]:
         """Get popular products for new users"""
-        # Get products with most interactions
-        popular_products = db.query(
-            Product.id,
-            func.count(UserInteraction.id).label('interaction_count')
-        ).join(
-            UserInteraction, Product.id == UserInteraction.product_id
-        ).group_by(
-            Product.id
-        ).order_by(
-            func.count(UserInteraction.id).desc()
-        ).limit(limit).all()
-        
-        product_recs = []
-        for product_id, interaction_count in popular_products:
-            product = db.query(Product).filter(Product.id == product_id).first()
-            if product:
-                product_recs.append({
-                    'product_id': product_id,
-                    'product': ProductResponse.from_orm(product),
-                    'score': float(interaction_count)
-                })
-        
-        return product_recs 
\ No newline at end of file
+        # Time-decayed counts maintained per interaction; only the first call scans the table
+        self.popularity.ensure_loaded(db)
+        
+        # Products are hydrated once by get_recommendations
+        return [
+            {'product_id': product_id, 'score': score}
+            for product_id, score in self.popularity.top(limit, category)
+        ]
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from models import InteractionType
 
 # User schemas
@@ -47,6 +47,9 @@ class InteractionCreate(BaseModel):
     interaction_type: InteractionType
     rating: Optional[float] = None
 
+class InteractionBatch(BaseModel):
+    interactions: List[InteractionCreate]
+
 # Recommendation schemas
 class RecommendationResponse(BaseModel):
     product: ProductResponse
@@ -1,38 +1,23 @@
-from sqlalchemy.orm import Session
 from database import SessionLocal, create_tables
-from models import Product
-from data_utils import get_products_data
+from catalog_import import import_catalog_file
+from data_utils import MOCK_DATA_PATH
 
-def seed_database():
-    """Seed the database with sample products from JSON file"""
+def seed_database(path: str = MOCK_DATA_PATH):
+    """Seed the database with products from a catalog file (mock_data.json by default)"""
     # Create tables
     create_tables()
-    
-    # Load mock data
-    products_data = get_products_data()
-    if not products_data:
-        print("Failed to load mock data. Exiting.")
-        return
-    
+
     # Create database session
     db = SessionLocal()
-    
+
     try:
-        # Check if products already exist
-        existing_products = db.query(Product).count()
-        if existing_products > 0:
-            print(f"Database already has {existing_products} products. Skipping seed.")
-            return
-        
-        # Add products to database
-        
-        for product_data in products_data:
-            product = Product(**product_data)
-            db.add(product)
-        
-        db.commit()
-        print(f"Successfully seeded database with {len(products_data)} products!")
-        
+        # Streamed and upserted by name, so re-seeding only writes what changed
+        stats = import_catalog_file(db, path)
+        print(f"Seeded {stats['read']} products in {stats['seconds']:.1f}s: {stats['inserted']} inserted, "
+              f"{stats['updated']} updated, {stats['unchanged']} unchanged, {stats['rejected']} rejected")
+
+    except FileNotFoundError:
+        print(f"Catalog not found at {path}. Exiting.")
     except Exception as e:
         print(f"Error seeding database: {e}")
         db.rollback()
@@ -40,4 +25,4 @@ def seed_database():
         db.close()
 
 if __name__ == "__main__":
-    seed_database() 
\ No newline at end of file
+    seed_database()
@@ -0,0 +1,53 @@
+"""Fast JSON paths for product and recommendation lists.
+
+Returning models through ``response_model`` validates them a second time,
+runs ``jsonable_encoder`` and then ``json.dumps``. These helpers instead
+splice the per-product JSON bytes kept by the product cache into the
+response body, and the routes return it as a JSONBytesResponse, which
+FastAPI sends as-is.
+"""
+import json
+import math
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import Response
+
+from schemas import ProductResponse, RecommendationResponse
+
+
+class JSONBytesResponse(Response):
+    """A response whose body is already encoded JSON"""
+    media_type = "application/json"
+
+
+_algorithm_json: Dict[str, bytes] = {}
+
+
+def _product_bytes(product: ProductResponse, product_json: Dict[int, bytes]) -> bytes:
+    encoded = product_json.get(product.id)
+    return encoded if encoded is not None else product.model_dump_json().encode()
+
+
+def _number(value: float) -> bytes:
+    return repr(float(value)).encode() if math.isfinite(value) else b'null'
+
+
+def products_json(products: Iterable[ProductResponse], product_json: Optional[Dict[int, bytes]] = None) -> bytes:
+    """JSON array of products, reusing pre-serialized bytes where available"""
+    product_json = product_json or {}
+    return b'[' + b','.join(_product_bytes(product, product_json) for product in products) + b']'
+
+
+def recommendations_json(recommendations: List[RecommendationResponse],
+                         product_json: Optional[Dict[int, bytes]] = None) -> bytes:
+    """JSON array of recommendations, reusing pre-serialized product bytes where available"""
+    product_json = product_json or {}
+    parts = []
+    for rec in recommendations:
+        algorithm = _algorithm_json.get(rec.algorithm_type)
+        if algorithm is None:
+            algorithm = _algorithm_json[rec.algorithm_type] = json.dumps(rec.algorithm_type).encode()
+        parts.append(b'{"product":%s,"score":%s,"algorithm_type":%s}' % (
+            _product_bytes(rec.product, product_json), _number(rec.score), algorithm
+        ))
+    return b'[' + b','.join(parts) + b']'
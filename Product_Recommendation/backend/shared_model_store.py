@@ -0,0 +1,288 @@
+"""Model snapshots published in shared memory for every worker on a host.
+
+One builder process rebuilds the models and publishes each version as a
+single ``multiprocessing.shared_memory`` segment; a small stamp segment holds
+the newest complete version. Serving workers map the segment and use NumPy
+views over it, so all of them read one copy of the arrays without loading or
+deserializing anything, and they switch to a new version by comparing the
+stamp on each request. The builder is also where ALS is trained
+(``--als-weight``); serving workers only load its factors.
+
+    python shared_model_store.py --name recs --interval 600
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from model_snapshot import ModelSnapshot
+from model_store import FORMAT_VERSION, snapshot_from_arrays, snapshot_metadata, snapshot_to_arrays
+
+# Array offsets are aligned to a cache line
+ALIGNMENT = 64
+# Leading bytes of a version segment holding the manifest length
+HEADER_SIZE = 8
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class _Segment(shared_memory.SharedMemory):
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            # Arrays still view the mapping; it is unmapped along with the last of them
+            pass
+
+
+def _open(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """Open a segment whose lifetime this process does not own.
+
+    Python's resource tracker unlinks every segment a process created or
+    attached to when it exits, which would pull published models away from
+    the other workers; segments are only removed through ``SharedModelStore``.
+    """
+    try:
+        return _Segment(name=name, create=create, size=size, track=False)
+    except TypeError:
+        # Before Python 3.13 tracking cannot be turned off up front
+        segment = _Segment(name=name, create=create, size=size)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def _unlink(name: str) -> bool:
+    try:
+        # Tracked on attach, so unlink() below leaves the resource tracker balanced
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    segment.close()
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class SharedModelStore:
+    """Versioned model snapshots in shared memory, a drop-in for ModelStore.
+
+    Version ``n`` lives in the segment ``<name>_v<n>``: an 8-byte manifest
+    length, the JSON manifest, then every array at a 64-byte aligned offset.
+    ``<name>_latest`` holds the newest complete version as one int64, written
+    only after the version's segment is filled, so readers never see a
+    partial snapshot. Loaded arrays are read-only views of the segment, and
+    serving engines keep tracked interactions beside them. Only models that
+    are served from their arrays can be shared, so item_item is refused.
+    """
+
+    def __init__(self, name: str, keep: int = 3):
+        self.name = name
+        self.keep = keep
+        self._stamp: Optional[np.ndarray] = None
+        self._stamp_segment: Optional[shared_memory.SharedMemory] = None
+        # version -> segment mapped by this process; kept open while its arrays may be in use
+        self._attached: Dict[int, shared_memory.SharedMemory] = {}
+        # Superseded segments whose arrays were still referenced when last released
+        self._retired: List[shared_memory.SharedMemory] = []
+        self._lock = threading.Lock()
+
+    def segment_name(self, version: int) -> str:
+        return f'{self.name}_v{version:08d}'
+
+    def save(self, snapshot: ModelSnapshot) -> str:
+        """Publish a snapshot and advance the version stamp; returns the segment name"""
+        name = self.segment_name(snapshot.version)
+        arrays = {array_name: np.ascontiguousarray(array)
+                  for array_name, array in snapshot_to_arrays(snapshot).items()}
+
+        # Offsets are relative to the data area that follows the manifest
+        layout, offset = {}, 0
+        for array_name, array in arrays.items():
+            offset = _aligned(offset)
+            layout[array_name] = {'dtype': str(array.dtype), 'shape': list(array.shape), 'offset': offset}
+            offset += array.nbytes
+        manifest = json.dumps({
+            'format': FORMAT_VERSION,
+            'snapshot': snapshot_metadata(snapshot),
+            'arrays': layout,
+        }).encode('utf-8')
+        data_start = _aligned(HEADER_SIZE + len(manifest))
+
+        try:
+            segment = _open(name, create=True, size=data_start + offset)
+        except FileExistsError:
+            # Another process already published this version
+            return name
+        try:
+            segment.buf[:HEADER_SIZE] = len(manifest).to_bytes(HEADER_SIZE, 'little')
+            segment.buf[HEADER_SIZE:HEADER_SIZE + len(manifest)] = manifest
+            for array_name, array in arrays.items():
+                start = data_start + layout[array_name]['offset']
+                segment.buf[start:start + array.nbytes] = array.reshape(-1).view(np.uint8)
+        finally:
+            segment.close()
+
+        self._write_latest(snapshot.version)
+        self._prune(snapshot.version)
+        return name
+
+    def latest_version(self) -> Optional[int]:
+        """Version in the stamp, or None if nothing has been published"""
+        stamp = self._stamp_view(create=False)
+        if stamp is None:
+            return None
+        version = int(stamp[0])
+        return version or None
+
+    def load(self, version: int, mmap: bool = True) -> ModelSnapshot:
+        """Attach to one version; arrays are read-only views of shared memory unless ``mmap`` is False"""
+        with self._lock:
+            segment = self._attached.get(version)
+            if segment is None:
+                segment = self._attached[version] = _open(self.segment_name(version))
+            self._release_unused(keep=version)
+
+        length = int.from_bytes(segment.buf[:HEADER_SIZE], 'little')
+        manifest = json.loads(bytes(segment.buf[HEADER_SIZE:HEADER_SIZE + length]))
+        if manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format in {segment.name}: {manifest.get('format')}")
+
+        data_start = _aligned(HEADER_SIZE + length)
+        arrays = {}
+        for array_name, spec in manifest['arrays'].items():
+            dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+            # frombuffer holds a buffer export, so the segment cannot be unmapped under a live view
+            array = np.frombuffer(segment.buf, dtype=dtype, count=int(np.prod(shape)),
+                                  offset=data_start + spec['offset']).reshape(shape)
+            if mmap:
+                array.flags.writeable = False
+            else:
+                array = array.copy()
+            arrays[array_name] = array
+        return snapshot_from_arrays(manifest['snapshot'], arrays)
+
+    def load_latest(self, mmap: bool = True) -> Optional[ModelSnapshot]:
+        """Attach to the newest published version, or None if there is none"""
+        version = self.latest_version()
+        if version is None:
+            return None
+        return self.load(version, mmap=mmap)
+
+    def close(self):
+        """Unmap the stamp and every attached segment whose arrays are no longer referenced"""
+        with self._lock:
+            self._release_unused()
+            if self._stamp_segment is not None:
+                self._stamp = None
+                self._stamp_segment.close()
+                self._stamp_segment = None
+
+    def unlink(self):
+        """Remove the stamp and every published version from the system"""
+        latest = self.latest_version()
+        self.close()
+        if latest is not None:
+            for version in range(latest, 0, -1):
+                _unlink(self.segment_name(version))
+        _unlink(f'{self.name}_latest')
+
+    def _stamp_view(self, create: bool) -> Optional[np.ndarray]:
+        if self._stamp is not None:
+            return self._stamp
+        with self._lock:
+            if self._stamp is None:
+                try:
+                    segment = _open(f'{self.name}_latest')
+                except FileNotFoundError:
+                    if not create:
+                        return None
+                    try:
+                        # A fresh segment is zero-filled, i.e. no version yet
+                        segment = _open(f'{self.name}_latest', create=True, size=HEADER_SIZE)
+                    except FileExistsError:
+                        segment = _open(f'{self.name}_latest')
+                self._stamp_segment = segment
+                self._stamp = np.frombuffer(segment.buf, dtype=np.int64, count=1)
+            return self._stamp
+
+    def _write_latest(self, version: int):
+        """Point the stamp at a version, never moving it backwards"""
+        stamp = self._stamp_view(create=True)
+        with self._lock:
+            if int(stamp[0]) < version:
+                # One aligned 8-byte store, so readers see the old or the new version
+                stamp[0] = version
+
+    def _prune(self, newest: int):
+        """Remove all but the newest ``keep`` versions; workers still mapping one keep their copy"""
+        for version in range(newest - self.keep, 0, -1):
+            if not _unlink(self.segment_name(version)):
+                # Older versions were pruned by an earlier publish
+                break
+
+    def _release_unused(self, keep: Optional[int] = None):
+        """Unmap superseded segments once no snapshot built on them is referenced"""
+        for version in [version for version in self._attached if version != keep]:
+            self._retired.append(self._attached.pop(version))
+        still_used = []
+        for segment in self._retired:
+            try:
+                segment.close()
+            except BufferError:
+                # In-flight requests may still read the old snapshot
+                still_used.append(segment)
+        self._retired = still_used
+
+
+def main(argv: Optional[list] = None):
+    from database import SessionLocal, create_tables
+    from recommendation_engine import COLLABORATIVE_MODES, RecommendationEngine
+
+    parser = argparse.ArgumentParser(description="Rebuild recommendation models and publish them to shared memory")
+    parser.add_argument("--name", default=os.getenv("SHARED_MODEL_NAME", "recommendation_models"),
+                        help="shared memory name prefix the serving workers attach to")
+    parser.add_argument("--interval", type=float, default=float(os.getenv("MODEL_REFRESH_INTERVAL", "3600")),
+                        help="seconds between rebuilds")
+    parser.add_argument("--keep", type=int, default=3, help="published versions kept for workers still reading them")
+    # item_item indexes are loaded into per-worker structures, so there is nothing to share
+    parser.add_argument("--collaborative-mode", choices=[mode for mode in COLLABORATIVE_MODES if mode != 'item_item'],
+                        default=os.getenv("COLLABORATIVE_MODE", "jaccard"))
+    parser.add_argument("--als-weight", type=float, default=float(os.getenv("ALS_WEIGHT", "0")),
+                        help="blend weight of the matrix-factorization signal (0 disables it)")
+    parser.add_argument("--once", action="store_true", help="publish one version and exit")
+    args = parser.parse_args(argv)
+
+    create_tables()
+    store = SharedModelStore(args.name, keep=args.keep)
+    engine = RecommendationEngine(
+        collaborative_mode=args.collaborative_mode,
+        model_store=store,
+        als_weight=args.als_weight,
+        als_factors=int(os.getenv("ALS_FACTORS", "32")),
+        ann_min_items=int(os.getenv("ANN_MIN_ITEMS", "50000")),
+        ann_nprobe=int(os.getenv("ANN_NPROBE", "8")),
+    )
+    while True:
+        started = time.time()
+        db = SessionLocal()
+        try:
+            snapshot = engine.rebuild(db)
+        finally:
+            db.close()
+        print(f"Published {store.segment_name(snapshot.version)} in {time.time() - started:.1f}s", flush=True)
+        if args.once:
+            return
+        time.sleep(max(0.0, args.interval - (time.time() - started)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Synthetic catalog, users and interactions at configurable scale.
+
+Product popularity and user activity both follow power laws (Zipf-like
+``1 / rank ** exponent``), which is what makes neighbor lists, popular items and
+heavy users behave like production data. Descriptions are drawn from the
+vocabulary of mock_data.json per category, so TF-IDF has real structure.
+
+    python synthetic_data.py --users 10000 --products 50000 --interactions 1000000
+"""
+import argparse
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from catalog import bump_catalog_version
+from data_utils import get_products_data
+from models import User, Product, UserInteraction, InteractionType
+
+# Share of each interaction type in generated traffic
+INTERACTION_MIX = {
+    InteractionType.VIEW: 0.70,
+    InteractionType.LIKE: 0.15,
+    InteractionType.SEARCH: 0.05,
+    InteractionType.PURCHASE: 0.10,
+}
+
+
+def power_law_weights(n: int, exponent: float) -> np.ndarray:
+    """Probabilities proportional to 1 / rank ** exponent for ranks 1..n"""
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    return weights / weights.sum()
+
+
+def _category_vocabulary() -> Dict[str, list]:
+    """Description words per category from the mock catalog"""
+    vocabulary: Dict[str, set] = {}
+    for product in get_products_data():
+        words = re.findall(r"[a-z]+", f"{product['name']} {product.get('description') or ''}".lower())
+        vocabulary.setdefault(product['category'], set()).update(word for word in words if len(word) > 2)
+    if not vocabulary:
+        vocabulary = {"General": {"quality", "product", "durable", "compact", "premium"}}
+    return {category: sorted(words) for category, words in vocabulary.items()}
+
+
+def _bulk_insert(db: Session, model, rows, batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(model), rows[start:start + batch_size])
+
+
+def generate_synthetic_data(db: Session, n_users: int = 1000, n_products: int = 5000,
+                            n_interactions: int = 100000, popularity_exponent: float = 1.1,
+                            activity_exponent: float = 1.0, days: int = 90, seed: int = 0,
+                            batch_size: int = 10000) -> Dict[str, int]:
+    """Insert users, products and interactions with bulk inserts; returns the counts"""
+    rng = np.random.default_rng(seed)
+    vocabulary = _category_vocabulary()
+    categories = sorted(vocabulary)
+    all_words = sorted({word for words in vocabulary.values() for word in words})
+    now = datetime.utcnow()
+
+    first_user_id = (db.query(User.id).order_by(User.id.desc()).limit(1).scalar() or 0) + 1
+    first_product_id = (db.query(Product.id).order_by(Product.id.desc()).limit(1).scalar() or 0) + 1
+
+    product_categories = rng.integers(0, len(categories), n_products)
+    products = []
+    for offset, category_index in enumerate(product_categories):
+        category = categories[category_index]
+        words = list(rng.choice(vocabulary[category], 8)) + list(rng.choice(all_words, 2))
+        products.append({
+            'id': first_product_id + offset,
+            'name': f"{category} item {first_product_id + offset}",
+            'category': category,
+            'price': round(float(rng.uniform(5, 500)), 2),
+            'description': " ".join(words),
+            'rating': round(float(rng.uniform(1, 5)), 1),
+            'rating_count': int(rng.integers(0, 1000)),
+            'image_url': None,
+            'created_at': now,
+        })
+    _bulk_insert(db, Product, products, batch_size)
+    # Bulk inserts bypass the session hook that versions the catalog
+    bump_catalog_version(db)
+
+    users = [
+        {
+            'id': first_user_id + offset,
+            'email': f"synthetic{first_user_id + offset}@example.com",
+            'username': f"synthetic{first_user_id + offset}",
+            # Not a valid hash: benchmark clients authenticate with minted tokens
+            'hashed_password': "synthetic",
+            'created_at': now,
+        }
+        for offset in range(n_users)
+    ]
+    _bulk_insert(db, User, users, batch_size)
+
+    # Popularity rank and activity rank are shuffled so ids carry no order
+    product_pick = rng.choice(n_products, n_interactions, p=power_law_weights(n_products, popularity_exponent))
+    user_pick = rng.choice(n_users, n_interactions, p=power_law_weights(n_users, activity_exponent))
+    product_ids = rng.permutation(n_products)[product_pick] + first_product_id
+    user_ids = rng.permutation(n_users)[user_pick] + first_user_id
+    types = list(INTERACTION_MIX)
+    type_pick = rng.choice(len(types), n_interactions, p=list(INTERACTION_MIX.values()))
+    ages = np.sort(rng.uniform(0, days * 24 * 3600, n_interactions))[::-1]
+
+    for start in range(0, n_interactions, batch_size):
+        rows = []
+        for i in range(start, min(start + batch_size, n_interactions)):
+            interaction_type = types[type_pick[i]]
+            rows.append({
+                'user_id': int(user_ids[i]),
+                'product_id': int(product_ids[i]),
+                'interaction_type': interaction_type,
+                'rating': float(rng.integers(1, 6)) if interaction_type == InteractionType.PURCHASE else None,
+                'created_at': now - timedelta(seconds=float(ages[i])),
+            })
+        db.execute(insert(UserInteraction), rows)
+    db.commit()
+    return {'users': n_users, 'products': n_products, 'interactions': n_interactions}
+
+
+def main(argv: Optional[list] = None):
+    from database import SessionLocal, create_tables
+
+    parser = argparse.ArgumentParser(description="Generate synthetic users, products and interactions")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--interactions", type=int, default=100000)
+    parser.add_argument("--popularity-exponent", type=float, default=1.1)
+    parser.add_argument("--activity-exponent", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        counts = generate_synthetic_data(
+            db, args.users, args.products, args.interactions,
+            popularity_exponent=args.popularity_exponent,
+            activity_exponent=args.activity_exponent,
+            seed=args.seed
+        )
+    finally:
+        db.close()
+    print(f"Generated {counts['users']} users, {counts['products']} products "
+          f"and {counts['interactions']} interactions")
+
+
+if __name__ == "__main__":
+    main()
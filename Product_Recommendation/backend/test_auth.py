@@ -3,7 +3,7 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from database import Base, get_db
-from main import app
+from main import app, user_cache
 from models import User
 from auth import get_password_hash
 
@@ -27,6 +27,8 @@ def client():
     with TestClient(app) as c:
         yield c
     Base.metadata.drop_all(bind=engine)
+    # User ids are reused by the next test's fresh tables
+    user_cache.clear()
 
 @pytest.fixture
 def test_user():
@@ -112,4 +114,95 @@ def test_protected_endpoint_with_token(client, test_user):
     # Access protected endpoint
     headers = {"Authorization": f"Bearer {token}"}
     response = client.get("/recommendations", headers=headers)
-    assert response.status_code == 200 
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_authenticated_user_is_cached_until_user_changes(client, test_user):
+    """Repeat requests with a token skip the user lookup until the user row changes"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    client.post("/auth/register", json=test_user)
+    token = client.post("/auth/login", json={
+        "email": test_user["email"],
+        "password": test_user["password"]
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/recommendations", headers=headers).status_code == 200
+
+    user_queries = []
+    def count_user_queries(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            user_queries.append(statement)
+    event.listen(Engine, "before_cursor_execute", count_user_queries)
+    try:
+        assert client.get("/recommendations", headers=headers).status_code == 200
+        assert user_queries == []
+
+        db = TestingSessionLocal()
+        user = db.query(User).filter(User.email == test_user["email"]).first()
+        user.username = "renamed"
+        db.commit()
+        db.delete(user)
+        db.commit()
+        db.close()
+        user_queries.clear()
+
+        response = client.get("/recommendations", headers=headers)
+        assert response.status_code == 401
+        assert len(user_queries) == 1
+    finally:
+        event.remove(Engine, "before_cursor_execute", count_user_queries)
+
+def test_user_cache_entries_end_at_token_expiry():
+    """An entry never outlives the token it was verified for"""
+    import time
+    from schemas import UserResponse
+    from user_cache import AuthenticatedUserCache
+
+    cache = AuthenticatedUserCache(ttl=300, max_size=2)
+    user = UserResponse(id=1, email="a@example.com", username="a", created_at="2024-01-01T00:00:00")
+    cache.put("expired", user, token_expires_at=time.time() - 1)
+    cache.put("valid", user, token_expires_at=time.time() + 60)
+    assert cache.get("expired") is None
+    assert cache.get("valid") == user
+
+    cache.put("other", UserResponse(id=2, email="b@example.com", username="b", created_at="2024-01-01T00:00:00"))
+    cache.put("newest", user)
+    assert cache.get("valid") is None  # evicted as least recently used
+    cache.invalidate_user(1)
+    assert cache.get("newest") is None and cache.get("other") is not None
+
+def test_login_is_rejected_fast_when_hashing_is_saturated(client, test_user, monkeypatch):
+    """A full bcrypt pool answers 503 instead of queueing behind other logins"""
+    import threading
+    import main
+    from auth import PasswordHasher
+
+    client.post("/auth/register", json=test_user)
+    hasher = PasswordHasher(workers=1, max_pending=0)
+    monkeypatch.setattr(main, "password_hasher", hasher)
+
+    started, release = threading.Event(), threading.Event()
+    def hold():
+        started.set()
+        release.wait(5)
+    holder = threading.Thread(target=hasher.run, args=(hold,))
+    holder.start()
+    started.wait(5)
+    try:
+        response = client.post("/auth/login", json={
+            "email": test_user["email"],
+            "password": test_user["password"]
+        })
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+    finally:
+        release.set()
+        holder.join()
+
+    response = client.post("/auth/login", json={
+        "email": test_user["email"],
+        "password": test_user["password"]
+    })
+    assert response.status_code == 200
+    assert hasher.stats() == {'in_flight': 0, 'capacity': 1, 'admitted': 2, 'rejected': 1}
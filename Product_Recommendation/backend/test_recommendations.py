@@ -1,12 +1,20 @@
+import re
+import threading
+import time
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func
 from sqlalchemy.orm import sessionmaker
 from database import Base, get_db
-from main import app
+from main import (
+    app, recommendation_cache, recommendation_engine, interaction_queue, product_ids, user_cache, catalog_version
+)
 from models import User, Product, UserInteraction, InteractionType
 from auth import get_password_hash
 from recommendation_engine import RecommendationEngine
+from content_index import ContentSimilarityIndex
+from item_neighbors import ItemNeighborIndex
+from recommendation_cache import RecommendationCache
 from data_utils import get_products_data
 
 # Use in-memory SQLite for testing
@@ -29,6 +37,13 @@ def client():
     with TestClient(app) as c:
         yield c
     Base.metadata.drop_all(bind=engine)
+    # User and product ids are reused by the next test's fresh tables
+    recommendation_cache.clear()
+    recommendation_engine.popularity.clear()
+    recommendation_engine.product_cache.invalidate()
+    product_ids.invalidate()
+    user_cache.clear()
+    catalog_version.invalidate()
 
 @pytest.fixture
 def auth_headers(client):
@@ -229,4 +244,1228 @@ def test_invalid_product_interaction(client, auth_headers):
     
     response = client.post("/interactions", json=interaction_data, headers=auth_headers)
     assert response.status_code == 404
-    assert "Product not found" in response.json()["detail"] 
\ No newline at end of file
+    assert "Product not found" in response.json()["detail"]
+
+def _seed_interactions(db, sample_products, interactions):
+    """Add sample products and (username, product index, type, rating) interactions"""
+    products = [Product(**product_data) for product_data in sample_products]
+    db.add_all(products)
+    users = {}
+    for username, _, _, _ in interactions:
+        if username not in users:
+            users[username] = User(
+                email=f"{username}@example.com",
+                username=username,
+                hashed_password="not-a-real-hash"
+            )
+    db.add_all(users.values())
+    db.commit()
+    for username, product_idx, interaction_type, rating in interactions:
+        db.add(UserInteraction(
+            user_id=users[username].id,
+            product_id=products[product_idx].id,
+            interaction_type=interaction_type,
+            rating=rating
+        ))
+    db.commit()
+    return users, products
+
+def test_sparse_collaborative_matches_jaccard(client, sample_products):
+    """Sparse user-item matrix gives the same similar users and scores as the table scan"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.PURCHASE, 5.0),
+        ("alice", 1, InteractionType.VIEW, None),
+        ("bob", 0, InteractionType.LIKE, 4.0),
+        ("bob", 1, InteractionType.VIEW, None),
+        ("bob", 2, InteractionType.PURCHASE, 3.0),
+        ("bob", 2, InteractionType.VIEW, None),
+        ("carol", 0, InteractionType.VIEW, None),
+        ("carol", 2, InteractionType.LIKE, None),
+        ("dave", 2, InteractionType.VIEW, None),
+    ])
+    alice_id = users["alice"].id
+    alice_products = {products[0].id, products[1].id}
+
+    jaccard_engine = RecommendationEngine()
+    sparse_engine = RecommendationEngine(collaborative_mode='sparse')
+    sparse_engine.rebuild(db)
+
+    expected = jaccard_engine._find_similar_users(alice_id, alice_products, db)
+    actual = sparse_engine.snapshot.user_item_matrix.similar_users(alice_id, alice_products)
+    assert len(expected) == 2
+    assert [uid for uid, _ in actual] == [uid for uid, _ in expected]
+    assert [sim for _, sim in actual] == pytest.approx([sim for _, sim in expected])
+
+    expected_recs = jaccard_engine._get_collaborative_recommendations(alice_id, db, 5)
+    actual_recs = sparse_engine._get_collaborative_recommendations(alice_id, db, 5)
+    assert [rec['product_id'] for rec in actual_recs] == [rec['product_id'] for rec in expected_recs]
+    assert [rec['score'] for rec in actual_recs] == pytest.approx([rec['score'] for rec in expected_recs])
+    db.close()
+
+def test_sparse_collaborative_picks_up_new_interactions(client, sample_products):
+    """Interactions recorded after the matrix is built are merged in the background"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.VIEW, None),
+        ("bob", 1, InteractionType.VIEW, None),
+    ])
+    engine = RecommendationEngine(collaborative_mode='sparse')
+    alice_id, bob_id = users["alice"].id, users["bob"].id
+    engine.rebuild(db)
+    built = engine.snapshot
+
+    assert built.user_item_matrix.similar_users(alice_id, {products[0].id}) == []
+
+    interaction = UserInteraction(user_id=bob_id, product_id=products[0].id, interaction_type=InteractionType.LIKE)
+    db.add(interaction)
+    db.commit()
+    engine.record_interaction(bob_id, products[0].id, InteractionType.LIKE, interaction_id=interaction.id)
+
+    engine.get_recommendations(alice_id, db)
+    engine.wait_for_rebuild(timeout=10)
+    # The merge produced a new matrix instead of modifying the one in use
+    assert built.user_item_matrix.similar_users(alice_id, {products[0].id}) == []
+    assert engine.snapshot.version == built.version
+
+    similar = engine.snapshot.user_item_matrix.similar_users(alice_id, {products[0].id})
+    assert [uid for uid, _ in similar] == [bob_id]
+    assert similar[0][1] == pytest.approx(0.5)
+    db.close()
+
+def test_item_neighbor_index_incremental_matches_rebuild(client, sample_products):
+    """Neighbor lists updated per interaction equal a full rebuild from the table"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.PURCHASE, 5.0),
+        ("alice", 1, InteractionType.VIEW, None),
+        ("bob", 0, InteractionType.LIKE, 4.0),
+        ("bob", 2, InteractionType.VIEW, None),
+    ])
+    engine = RecommendationEngine(collaborative_mode='item_item')
+    index = engine.rebuild(db).item_neighbors
+    p0, p1, p2 = (product.id for product in products)
+
+    # alice: 3.0 * 1.0 on (p0, p1); bob: 1.6 * 1.0 on (p0, p2)
+    assert [n for n, _ in index.neighbors[p0]] == [p1, p2]
+    assert index.neighbors[p0][1][1] == pytest.approx(1.6)
+
+    new_interactions = [
+        ("bob", 1, InteractionType.PURCHASE, None),
+        ("alice", 2, InteractionType.LIKE, 5.0),
+    ]
+    for username, product_idx, interaction_type, rating in new_interactions:
+        interaction = UserInteraction(
+            user_id=users[username].id,
+            product_id=products[product_idx].id,
+            interaction_type=interaction_type,
+            rating=rating
+        )
+        db.add(interaction)
+        db.commit()
+        engine.record_interaction(users[username].id, products[product_idx].id, interaction_type, rating,
+                                  interaction_id=interaction.id)
+
+    rebuilt = ItemNeighborIndex.from_database(db)
+    for product_id in (p0, p1, p2):
+        assert [n for n, _ in index.neighbors[product_id]] == [n for n, _ in rebuilt.neighbors[product_id]]
+        assert [w for _, w in index.neighbors[product_id]] == pytest.approx(
+            [w for _, w in rebuilt.neighbors[product_id]])
+    db.close()
+
+def test_item_item_collaborative_recommendations(client, sample_products):
+    """Item-item mode recommends neighbors of the user's items it has not seen"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.PURCHASE, 5.0),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 2, InteractionType.PURCHASE, None),
+    ])
+    engine = RecommendationEngine(collaborative_mode='item_item')
+    engine.rebuild(db)
+    recs = engine._get_collaborative_recommendations(users["alice"].id, db, 5)
+    assert [rec['product_id'] for rec in recs] == [products[2].id]
+    # alice's weight on p0 (3.0) times co-occurrence of (p0, p2) (2.0 * 3.0)
+    assert recs[0]['score'] == pytest.approx(18.0)
+    db.close()
+
+class QueryCounter:
+    """Count SQL statements executed on the test engine"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self)
+
+def test_recommendations_hydrate_products_in_one_query(client, sample_products):
+    """Products are looked up once per request, not once per candidate"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.LIKE, None),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 1, InteractionType.PURCHASE, None),
+        ("bob", 2, InteractionType.VIEW, None),
+    ])
+    alice_id = users["alice"].id
+    engine = RecommendationEngine(collaborative_mode='sparse')
+    engine.rebuild(db)
+    db.expire_all()
+
+    with QueryCounter() as counter:
+        recs = engine.get_recommendations(alice_id, db, limit=10)
+    assert {rec.product.id for rec in recs} == {products[1].id, products[2].id}
+    # user interactions, product hydration
+    assert counter.count == 2
+
+    with QueryCounter() as counter:
+        assert engine.get_recommendations(alice_id, db, limit=10) == recs
+    # only the user's interactions; models and products are cached
+    assert counter.count == 1
+    db.close()
+
+def test_content_index_matches_dense_top_k():
+    """Chunked top-K index keeps the K largest cosine similarities of each row"""
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    products = get_products_data()
+    texts = [f"{p['category']} {p.get('description') or ''}" for p in products]
+    tfidf = TfidfVectorizer(stop_words='english').fit_transform(texts)
+    dense = cosine_similarity(tfidf)
+    np.fill_diagonal(dense, -1.0)
+    product_ids = list(range(100, 100 + len(products)))
+
+    k = 5
+    # Force several chunks of a few rows each
+    index = ContentSimilarityIndex.build(product_ids, tfidf, k=k, max_chunk_bytes=4 * len(products) * 3)
+    assert index.neighbors.shape == (len(products), k)
+    assert index.neighbors.dtype == np.int32
+    assert index.similarities.dtype == np.float32
+
+    for row in range(len(products)):
+        expected = np.sort(dense[row])[::-1][:k]
+        expected = expected[expected > 0]
+        actual = [sim for _, sim in index.neighbors_of(product_ids[row])]
+        assert actual == pytest.approx(expected.tolist(), abs=1e-6)
+        for neighbor_id, sim in index.neighbors_of(product_ids[row]):
+            assert dense[row, neighbor_id - 100] == pytest.approx(sim, abs=1e-6)
+
+def _dense_content_reference(db, user_id, limit):
+    """Content-based scores computed with the full dense cosine matrix and Python loops"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    interactions = db.query(UserInteraction).filter(UserInteraction.user_id == user_id).all()
+    all_products = db.query(Product).all()
+    texts = [f"{product.category} {product.description or ''}" for product in all_products]
+    matrix = cosine_similarity(
+        TfidfVectorizer(stop_words='english', max_features=1000).fit_transform(texts)
+    )
+    index = {product.id: idx for idx, product in enumerate(all_products)}
+    interacted = {interaction.product_id for interaction in interactions}
+
+    recommendations = {}
+    for interaction in interactions:
+        if interaction.interaction_type not in [InteractionType.LIKE, InteractionType.PURCHASE]:
+            continue
+        for idx, similarity in enumerate(matrix[index[interaction.product_id]]):
+            product_id = all_products[idx].id
+            if product_id not in interacted and similarity > 0.1:
+                recommendations[product_id] = max(recommendations.get(product_id, 0.0), similarity)
+    return sorted(recommendations.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+@pytest.mark.parametrize("product_count,liked", [
+    (3, [0]),
+    (None, [0, 5, 12, 20, 33]),
+])
+def test_vectorized_content_scores_match_reference(client, product_count, liked):
+    """Vectorized content scoring returns the same products and scores as the loop version"""
+    products_data = get_products_data()[:product_count]
+    interactions = [("alice", idx, InteractionType.LIKE, None) for idx in liked]
+    interactions.append(("alice", 1, InteractionType.VIEW, None))
+    db = next(override_get_db())
+    users, _ = _seed_interactions(db, products_data, interactions)
+    alice_id = users["alice"].id
+
+    engine = RecommendationEngine()
+    engine.rebuild(db)
+    all_scores = dict(_dense_content_reference(db, alice_id, None))
+    for limit in (1, 5, 50):
+        expected = _dense_content_reference(db, alice_id, limit)
+        actual = engine._get_content_based_recommendations(alice_id, db, limit)
+        assert [rec['score'] for rec in actual] == pytest.approx([score for _, score in expected], abs=1e-6)
+        # Products tied at the cut-off may be swapped, but every score must match
+        for rec in actual:
+            assert rec['score'] == pytest.approx(all_scores[rec['product_id']], abs=1e-6)
+    db.close()
+
+def test_requests_do_not_block_on_model_rebuild(client, sample_products):
+    """The first request schedules a background build instead of running it inline"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.LIKE, None),
+    ])
+    engine = RecommendationEngine(collaborative_mode='sparse')
+    # Hold the rebuild worker so the build cannot finish while the request runs
+    release = threading.Event()
+    engine._executor.submit(release.wait)
+
+    # No snapshot yet: content results are empty, collaborative falls back to the scan
+    assert engine.get_recommendations(users["alice"].id, db) == []
+    assert engine.snapshot is None
+    release.set()
+    engine.wait_for_rebuild(timeout=10)
+    assert engine.snapshot is not None
+    assert engine.snapshot.content_index is not None
+    db.close()
+
+def test_rebuild_replays_interactions_it_did_not_read(client, sample_products):
+    """Interactions tracked while a snapshot is built are applied before the swap"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.VIEW, None),
+        ("bob", 1, InteractionType.VIEW, None),
+    ])
+    alice_id, bob_id = users["alice"].id, users["bob"].id
+    engine = RecommendationEngine(collaborative_mode='sparse')
+    already_read = db.query(UserInteraction).filter(UserInteraction.user_id == alice_id).first()
+
+    # One event the build will read from the table, one it will not
+    engine.record_interaction(alice_id, products[0].id, InteractionType.VIEW, interaction_id=already_read.id)
+    engine.record_interaction(bob_id, products[0].id, InteractionType.VIEW, interaction_id=already_read.id + 100)
+    snapshot = engine.rebuild(db)
+
+    # The build read alice's event; bob's is replayed into the delta beside it
+    base, delta = snapshot.user_item_matrix.base, snapshot.user_item_matrix.delta
+    assert base.weights[base.user_row(alice_id), base.product_column(products[0].id)] == 1.0
+    assert base.weights[base.user_row(bob_id), base.product_column(products[0].id)] == 0.0
+    assert delta.weights[delta.user_row(bob_id), delta.product_column(products[0].id)] == 1.0
+    assert delta.user_row(alice_id) is None
+    assert engine._pending_interactions == []
+    db.close()
+
+def test_install_replays_without_blocking_tracked_interactions(client, sample_products, monkeypatch):
+    """Interactions can be tracked while a new snapshot is being replayed, and stay pending"""
+    from user_item_matrix import UserItemMatrix
+
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [("alice", 0, InteractionType.VIEW, None)])
+    alice_id = users["alice"].id
+    engine = RecommendationEngine(collaborative_mode='sparse')
+    engine.record_interaction(alice_id, products[1].id, InteractionType.VIEW)
+
+    with_delta = UserItemMatrix.with_delta
+    def replay_while_tracking(matrix, interactions):
+        assert engine._lock.acquire(blocking=False)
+        engine._lock.release()
+        engine.record_interaction(alice_id, products[2].id, InteractionType.LIKE)
+        return with_delta(matrix, interactions)
+    monkeypatch.setattr(UserItemMatrix, "with_delta", replay_while_tracking)
+
+    snapshot = engine.rebuild(db)
+    assert snapshot.user_item_matrix.delta.product_ids.tolist() == [products[1].id]
+    assert [event[2] for event in engine._pending_interactions] == [products[2].id]
+    db.close()
+
+@pytest.mark.parametrize("collaborative_mode", ['sparse', 'item_item'])
+def test_model_snapshot_round_trips_through_disk(client, sample_products, tmp_path, collaborative_mode):
+    """A worker starting with the same model directory serves the published snapshot"""
+    import numpy as np
+    from model_store import ModelStore
+
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.PURCHASE, 5.0),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 2, InteractionType.PURCHASE, None),
+        ("carol", 1, InteractionType.LIKE, None),
+    ])
+    builder = RecommendationEngine(collaborative_mode=collaborative_mode, model_store=ModelStore(str(tmp_path)))
+    built = builder.rebuild(db)
+    assert ModelStore(str(tmp_path)).latest_version() == built.version
+
+    worker = RecommendationEngine(collaborative_mode=collaborative_mode, model_store=ModelStore(str(tmp_path)))
+    loaded = worker.snapshot
+    assert loaded.version == built.version
+    assert loaded.max_interaction_id == built.max_interaction_id
+    assert isinstance(loaded.content_index.neighbors, np.memmap)
+    np.testing.assert_array_equal(loaded.content_index.neighbors, built.content_index.neighbors)
+
+    alice_id = users["alice"].id
+    assert worker.get_recommendations(alice_id, db) == builder.get_recommendations(alice_id, db)
+    # The loaded snapshot is fresh, so the worker did not rebuild it
+    assert worker.snapshot is loaded
+    db.close()
+
+def test_model_store_keeps_latest_versions(client, sample_products, tmp_path):
+    """Publishing prunes old versions and never moves LATEST backwards"""
+    from model_store import ModelStore
+
+    db = next(override_get_db())
+    _seed_interactions(db, sample_products, [("alice", 0, InteractionType.LIKE, None)])
+    store = ModelStore(str(tmp_path), keep=2)
+    engine = RecommendationEngine(model_store=store)
+    for _ in range(3):
+        engine.rebuild(db)
+    assert store.versions() == [2, 3]
+    assert store.latest_version() == 3
+
+    stale = engine.snapshot._replace(version=1)
+    store.save(stale)
+    assert store.latest_version() == 3
+    db.close()
+
+def test_shared_model_store_workers_follow_published_versions(client, sample_products):
+    """Workers attach to models published in shared memory and switch to newer versions"""
+    import uuid
+    from shared_model_store import SharedModelStore
+
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.PURCHASE, 5.0),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 2, InteractionType.PURCHASE, None),
+    ])
+    name = f"test_models_{uuid.uuid4().hex[:8]}"
+    publisher = SharedModelStore(name, keep=1)
+    try:
+        builder = RecommendationEngine(collaborative_mode='sparse', model_store=publisher)
+        built = builder.rebuild(db)
+
+        worker = RecommendationEngine(collaborative_mode='sparse', model_store=SharedModelStore(name),
+                                      rebuild_locally=False)
+        loaded = worker.snapshot
+        assert loaded.version == built.version
+        neighbors = loaded.content_index.neighbors
+        assert not neighbors.flags.owndata and not neighbors.flags.writeable
+        alice_id = users["alice"].id
+        assert worker.get_recommendations(alice_id, db) == builder.get_recommendations(alice_id, db)
+
+        # A newer version is picked up without restarting, and the old one is pruned
+        newer = builder.rebuild(db)
+        worker.get_recommendations(alice_id, db)
+        worker.wait_for_rebuild(timeout=5)
+        assert worker.snapshot.version == newer.version
+        assert publisher.latest_version() == newer.version
+        with pytest.raises(FileNotFoundError):
+            SharedModelStore(name).load(built.version)
+        worker.model_store.close()
+    finally:
+        publisher.unlink()
+        db.close()
+
+def test_shared_model_workers_track_interactions_beside_the_shared_matrix(client, sample_products):
+    """Tracked interactions go into a per-worker delta; the shared matrix is never copied"""
+    import uuid
+    from shared_model_store import SharedModelStore
+    from user_item_matrix import DeltaUserItemMatrix
+
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.PURCHASE, 5.0),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 2, InteractionType.PURCHASE, None),
+        ("carol", 1, InteractionType.VIEW, None),
+    ])
+    name = f"test_models_{uuid.uuid4().hex[:8]}"
+    publisher = SharedModelStore(name, keep=1)
+    try:
+        built = RecommendationEngine(collaborative_mode='sparse', model_store=publisher).rebuild(db)
+        worker = RecommendationEngine(collaborative_mode='sparse', model_store=SharedModelStore(name),
+                                      rebuild_locally=False)
+        # The same events merged into a private copy of the matrix
+        reference = RecommendationEngine(collaborative_mode='sparse')
+
+        alice_id, bob_id, carol_id = users["alice"].id, users["bob"].id, users["carol"].id
+        events = [
+            (carol_id, products[0].id, InteractionType.PURCHASE, None),
+            (carol_id, products[2].id, InteractionType.LIKE, None),
+            (bob_id, products[1].id, InteractionType.VIEW, None),
+            (12345, products[0].id, InteractionType.VIEW, None),
+        ]
+        reference.use_snapshot(built._replace(user_item_matrix=built.user_item_matrix.with_interactions(events)))
+        for user_id, product_id, interaction_type, rating in events:
+            worker.record_interaction(user_id, product_id, interaction_type, rating)
+        worker.schedule_rebuild(db, full=False)
+        worker.wait_for_rebuild(timeout=5)
+
+        matrix = worker.snapshot.user_item_matrix
+        assert isinstance(matrix, DeltaUserItemMatrix)
+        for array in (matrix.base.weights.data, matrix.base.weights.indices, matrix.base.user_ids):
+            assert not array.flags.owndata and not array.flags.writeable
+        merged = reference.snapshot.user_item_matrix
+
+        alice_products = {products[0].id}
+        similar = matrix.similar_users(alice_id, alice_products, min_similarity=0.0)
+        expected = merged.similar_users(alice_id, alice_products, min_similarity=0.0)
+        assert [uid for uid, _ in similar] == [uid for uid, _ in expected]
+        assert [sim for _, sim in similar] == pytest.approx([sim for _, sim in expected])
+        assert matrix.score_products(similar, alice_products) == \
+            pytest.approx(merged.score_products(expected, alice_products))
+        served, expected = worker.get_recommendations(alice_id, db), reference.get_recommendations(alice_id, db)
+        assert [rec.product.id for rec in served] == [rec.product.id for rec in expected]
+        assert [rec.score for rec in served] == pytest.approx([rec.score for rec in expected])
+        worker.model_store.close()
+    finally:
+        publisher.unlink()
+        db.close()
+
+def test_item_item_models_are_not_shared(client):
+    """item_item indexes load into per-worker structures, so shared memory refuses them"""
+    from shared_model_store import SharedModelStore
+
+    with pytest.raises(ValueError):
+        RecommendationEngine(collaborative_mode='item_item', model_store=SharedModelStore("unused_models"),
+                             rebuild_locally=False)
+
+def test_recommendation_cache_serves_repeat_reads(client, sample_products):
+    """Cached results come from memory, then from one indexed read of the table"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.LIKE, None),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 1, InteractionType.PURCHASE, None),
+        ("bob", 2, InteractionType.VIEW, None),
+    ])
+    alice_id = users["alice"].id
+    engine = RecommendationEngine(collaborative_mode='sparse')
+    cache = RecommendationCache(depth=5)
+    assert cache.get(alice_id, 5, db) is None
+
+    recs = engine.get_recommendations(alice_id, db, limit=5)
+    cache.put(alice_id, recs, 5, db)
+
+    with QueryCounter() as counter:
+        assert cache.get(alice_id, 1, db) == recs[:1]
+    assert counter.count == 0
+
+    # Another worker, or this one after eviction, reads the stored rows once
+    cache.clear()
+    with QueryCounter() as counter:
+        assert cache.get(alice_id, 5, db) == recs
+    assert counter.count == 1
+
+    cache.invalidate(alice_id, db)
+    db.commit()
+    cache.clear()
+    assert cache.get(alice_id, 5, db) is None
+    db.close()
+
+def test_precomputed_recommendations_have_their_own_freshness_window(client, sample_products):
+    """Batch rows outlive the interactive TTL in the table but not in memory"""
+    from datetime import datetime, timedelta
+    from recommendation_cache import store_many_recommendations
+
+    db = next(override_get_db())
+    users, _ = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.LIKE, None),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 1, InteractionType.PURCHASE, None),
+    ])
+    alice_id, bob_id = users["alice"].id, users["bob"].id
+    engine = RecommendationEngine(collaborative_mode='sparse')
+    recs = {user_id: engine.get_recommendations(user_id, db, limit=5) for user_id in (alice_id, bob_id)}
+    two_hours_ago = datetime.utcnow() - timedelta(hours=2)
+    store_many_recommendations(db, {alice_id: recs[alice_id]}, two_hours_ago, precomputed=True)
+    store_many_recommendations(db, {bob_id: recs[bob_id]}, two_hours_ago)
+    db.commit()
+
+    cache = RecommendationCache(ttl=900, depth=5, precomputed_ttl=26 * 3600)
+    assert cache.get(alice_id, 5, db) == recs[alice_id]
+    assert cache.get(bob_id, 5, db) is None
+    # Held in memory for the interactive TTL only, then re-read from the table
+    expires_at = cache._entries[alice_id][0]
+    assert expires_at <= time.time() + 900
+    db.close()
+
+def test_interaction_invalidates_cached_recommendations(client, auth_headers, sample_products):
+    """Tracking an interaction drops only that user's cached recommendations"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 1, InteractionType.PURCHASE, None),
+    ])
+    bob_id = users["bob"].id
+    user_id = db.query(User).filter(User.username == "testuser").first().id
+    recommendation_cache.put(bob_id, [], recommendation_cache.depth, db)
+    # Results are only cached once the models are built
+    recommendation_engine.rebuild(db)
+
+    assert client.get("/recommendations", headers=auth_headers).status_code == 200
+    assert recommendation_cache.get(user_id, 10, db) is not None
+
+    response = client.post("/interactions", json={
+        "product_id": products[0].id,
+        "interaction_type": "like"
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    assert recommendation_cache.get(user_id, 10, db) is None
+    assert recommendation_cache.get(bob_id, 10, db) == []
+
+    response = client.get("/recommendations", headers=auth_headers)
+    assert products[1].id in {rec["product"]["id"] for rec in response.json()}
+    db.close()
+
+def test_recommendations_before_the_first_build_are_not_cached(client, auth_headers, sample_products, monkeypatch):
+    """Fallback results served while no snapshot is installed are not kept for a TTL"""
+    from models import Recommendation
+
+    db = next(override_get_db())
+    user_id = db.query(User).filter(User.username == "testuser").first().id
+    monkeypatch.setattr(recommendation_engine, "snapshot", None)
+    # Keep the background build from installing one mid-test
+    monkeypatch.setattr(recommendation_engine, "_refresh_in_background", lambda db: None)
+
+    assert client.get("/recommendations", headers=auth_headers).status_code == 200
+    assert recommendation_cache.get(user_id, 10, db) is None
+    assert db.query(Recommendation).count() == 0
+    db.close()
+
+def test_precompute_stores_recommendations_per_shard(client, sample_products, tmp_path):
+    """The batch job writes the same results the engine serves, one shard at a time"""
+    from precompute_recommendations import precompute_recommendations
+    from recommendation_cache import load_recommendations
+
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.LIKE, None),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 1, InteractionType.PURCHASE, None),
+        ("carol", 1, InteractionType.LIKE, None),
+        ("carol", 2, InteractionType.VIEW, None),
+    ])
+    assert precompute_recommendations(SQLALCHEMY_DATABASE_URL, workers=2, shard_index=0, shard_count=2,
+                                      collaborative_mode='sparse', model_dir=str(tmp_path)) == 1
+    assert precompute_recommendations(SQLALCHEMY_DATABASE_URL, workers=1, shard_index=1, shard_count=2,
+                                      collaborative_mode='sparse', model_dir=str(tmp_path)) == 2
+
+    # Both shards served from the one published snapshot
+    from model_store import ModelStore
+    assert ModelStore(str(tmp_path)).versions() == [1]
+    engine = RecommendationEngine(collaborative_mode='sparse', model_store=ModelStore(str(tmp_path)))
+    for user in users.values():
+        # Only rows marked as precomputed are fresh with a zero interactive TTL
+        stored, _ = load_recommendations(db, user.id, ttl=0, precomputed_ttl=300)
+        assert stored == engine.get_recommendations(user.id, db, limit=20)
+
+    # A stored snapshot older than max_age is rebuilt rather than reused
+    assert precompute_recommendations(SQLALCHEMY_DATABASE_URL, workers=1, collaborative_mode='sparse',
+                                      model_dir=str(tmp_path), max_age=0) == 3
+    assert ModelStore(str(tmp_path)).versions() == [1, 2]
+    db.close()
+
+def test_popularity_counter_decays_and_weights_interactions():
+    """Recent, heavier interactions outrank older or lighter ones"""
+    from popularity import PopularityCounter
+
+    day = 24 * 3600
+    counter = PopularityCounter(half_life=day)
+    counter.max_interaction_id = 0  # nothing to load
+    now = counter._landmark
+    counter.add(1, InteractionType.VIEW, category="Books", timestamp=now)
+    counter.add(2, InteractionType.PURCHASE, category="Electronics", timestamp=now - day)
+    counter.add(3, InteractionType.VIEW, category="Books", timestamp=now - 2 * day)
+    counter.add(3, InteractionType.VIEW, interaction_id=0, timestamp=now)  # already loaded
+
+    top = counter.top(3, now=now)
+    assert [product_id for product_id, _ in top] == [2, 1, 3]
+    assert [score for _, score in top] == pytest.approx([1.5, 1.0, 0.25])
+    books = counter.top(5, category="Books", now=now + day)
+    assert [product_id for product_id, _ in books] == [1, 3]
+    assert [score for _, score in books] == pytest.approx([0.5, 0.125])
+    assert counter.top(5, category="Toys") == []
+
+    # Moving the landmark keeps scores and order
+    counter.add(1, InteractionType.LIKE, timestamp=now + 60 * day)
+    (product_id, score), = counter.top(1, now=now + 60 * day)
+    assert product_id == 1 and score == pytest.approx(2.0)
+
+def test_cold_start_reads_maintained_popularity(client, auth_headers, sample_products):
+    """Popular products are loaded once, then kept current by tracked interactions"""
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("bob", 0, InteractionType.VIEW, None),
+        ("carol", 1, InteractionType.PURCHASE, None),
+    ])
+    engine = RecommendationEngine()
+    assert [p.id for p in engine.get_popular_products(db, 3)] == [products[1].id, products[0].id]
+
+    for _ in range(2):
+        engine.record_interaction(users["bob"].id, products[0].id, InteractionType.PURCHASE,
+                                  interaction_id=100, category=products[0].category)
+    with QueryCounter() as counter:
+        popular = engine._get_popular_products(db, 3)
+    assert counter.count == 0
+    assert [rec['product_id'] for rec in popular] == [products[0].id, products[1].id]
+
+    response = client.get("/products/popular", params={"category": "Electronics"})
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == [products[1].id, products[0].id]
+    assert client.get("/products/popular", params={"category": "Books"}).json() == []
+    db.close()
+
+def test_batch_interactions_are_written_behind(client, auth_headers, sample_products):
+    """Queued interactions are bulk inserted and reach the engine and result cache"""
+    db = next(override_get_db())
+    _, products = _seed_interactions(db, sample_products, [])
+    user_id = db.query(User).filter(User.username == "testuser").first().id
+    recommendation_cache.put(user_id, [], recommendation_cache.depth, db)
+
+    response = client.post("/interactions/batch", json={"interactions": [
+        {"product_id": products[0].id, "interaction_type": "view"},
+        {"product_id": products[1].id, "interaction_type": "view"},
+        {"product_id": products[1].id, "interaction_type": "purchase", "rating": 4.0},
+    ]}, headers=auth_headers)
+    assert response.status_code == 202
+    assert response.json()["accepted"] == 3
+    assert interaction_queue.flush(timeout=5)
+
+    rows = db.query(UserInteraction).filter(UserInteraction.user_id == user_id).order_by(UserInteraction.id).all()
+    assert [(r.product_id, r.interaction_type, r.rating) for r in rows] == [
+        (products[0].id, InteractionType.VIEW, None),
+        (products[1].id, InteractionType.VIEW, None),
+        (products[1].id, InteractionType.PURCHASE, 4.0),
+    ]
+    assert recommendation_cache.get(user_id, 10, db) is None
+    stats = client.get("/interactions/stats").json()
+    assert stats["depth"] == 0 and stats["flushed"] >= 3
+
+    response = client.post("/interactions/batch", json={"interactions": [
+        {"product_id": products[0].id, "interaction_type": "view"},
+        {"product_id": 99999, "interaction_type": "view"},
+    ]}, headers=auth_headers)
+    assert response.status_code == 404
+
+    # A batch that cannot fit even in an empty queue is refused for good, not "retry later"
+    max_size = interaction_queue.max_size
+    interaction_queue.max_size = 2
+    try:
+        response = client.post("/interactions/batch", json={"interactions": [
+            {"product_id": products[0].id, "interaction_type": "view"},
+        ] * 3}, headers=auth_headers)
+    finally:
+        interaction_queue.max_size = max_size
+    assert response.status_code == 413
+    db.close()
+
+def test_interaction_queue_is_bounded_and_flushes_on_size(client, sample_products):
+    """A full queue rejects whole batches; a full batch is written without waiting"""
+    from interaction_queue import BatchTooLarge, InteractionWriteQueue, QueueFull
+
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [("alice", 0, InteractionType.VIEW, None)])
+    flushed = []
+    queue = InteractionWriteQueue(max_size=4, batch_size=2, flush_interval=3600,
+                                  on_flush=lambda session, interactions: flushed.extend(interactions))
+    events = [(products[1].id, InteractionType.VIEW, None)] * 3
+    # Larger than the whole queue: never accepted, so not a retryable rejection
+    with pytest.raises(BatchTooLarge):
+        queue.submit(users["alice"].id, events * 2, db)
+
+    queue.submit(users["alice"].id, events, db)
+    deadline = time.time() + 5
+    while len(flushed) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    # One full batch went out on size; the remainder waits for the interval
+    assert len(flushed) == 2
+    assert queue.stats()["depth"] == 1
+    with pytest.raises(QueueFull):
+        queue.submit(users["alice"].id, events + events[:1], db)
+    queue.close(timeout=5)
+    assert len(flushed) == 3
+    assert queue.stats()["rejected"] == 4
+    assert [event[1:3] for event in flushed] == [(users["alice"].id, products[1].id)] * 3
+    db.close()
+
+def _async_app(monkeypatch):
+    """An app serving the async router on the test database through get_async_sessionmaker"""
+    import database
+    from fastapi import FastAPI
+    from async_routes import create_async_router
+
+    # The async engine is built from DATABASE_URL with the same options as in production
+    monkeypatch.setattr(database, "DATABASE_URL", SQLALCHEMY_DATABASE_URL)
+    monkeypatch.setattr(database, "_async_sessions", None)
+    async_app = FastAPI()
+    # A fresh engine, so its popularity counts are not loaded yet
+    async_app.include_router(create_async_router(RecommendationEngine(), RecommendationCache()))
+    async_app.dependency_overrides[get_db] = override_get_db
+    return async_app
+
+def test_async_read_endpoints_match_sync(client, auth_headers, sample_products, monkeypatch):
+    """The AsyncSession routes return what the sync routes do"""
+    async_app = _async_app(monkeypatch)
+
+    db = next(override_get_db())
+    _, products = _seed_interactions(db, sample_products, [("bob", 0, InteractionType.LIKE, None)])
+    product_ids = [product.id for product in products]
+    db.close()
+    client.post("/interactions", json={"product_id": product_ids[0], "interaction_type": "like"},
+                headers=auth_headers)
+
+    with TestClient(async_app) as async_client:
+        for path in ["/products", "/products?category=Electronics&limit=2", f"/products/{product_ids[1]}",
+                     "/categories", "/products/popular"]:
+            assert async_client.get(path).json() == client.get(path).json()
+        assert async_client.get("/products/99999").status_code == 404
+        assert async_client.get("/recommendations").status_code == 403
+
+        first = async_client.get("/recommendations", headers=auth_headers)
+        assert first.status_code == 200
+        assert first.json() == client.get("/recommendations", headers=auth_headers).json()
+        # Served from the result cache on the event loop
+        assert async_client.get("/recommendations", headers=auth_headers).json() == first.json()
+
+def test_async_popular_products_concurrent_cold_start(client, sample_products, monkeypatch):
+    """Concurrent first reads of /products/popular do not stall the event loop"""
+    import asyncio
+    import httpx
+
+    async_app = _async_app(monkeypatch)
+
+    async def fetch_concurrently():
+        async with httpx.AsyncClient(app=async_app, base_url="http://test") as async_client:
+            return await asyncio.gather(*(async_client.get("/products/popular") for _ in range(4)))
+
+    # A blocked loop cannot time itself out, so wait for it from another thread
+    responses = []
+    runner = threading.Thread(target=lambda: responses.extend(asyncio.run(fetch_concurrently())), daemon=True)
+    runner.start()
+    runner.join(timeout=20)
+    assert not runner.is_alive()
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.content for response in responses}) == 1
+
+def test_ensure_indexes_upgrades_existing_database(tmp_path):
+    """Missing columns and indexes are added to existing tables; the indexes serve the engine's queries"""
+    from sqlalchemy import inspect, text
+    from database import configure_engine, ensure_columns, ensure_indexes
+
+    db_engine = configure_engine(create_engine(f"sqlite:///{tmp_path / 'old.db'}"))
+    Base.metadata.create_all(bind=db_engine)
+    with db_engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_user_interactions_user_product_created"))
+        connection.execute(text("DROP INDEX ix_recommendations_user_created"))
+        connection.execute(text("INSERT INTO recommendations (user_id, product_id, score, algorithm_type) "
+                                "VALUES (1, 1, 0.5, 'hybrid')"))
+        connection.execute(text("ALTER TABLE recommendations DROP COLUMN precomputed"))
+
+    assert ensure_columns(db_engine) == ["recommendations.precomputed"]
+    assert ensure_columns(db_engine) == []
+    with db_engine.connect() as connection:
+        assert connection.execute(text("SELECT precomputed FROM recommendations")).scalar() == 0
+
+    assert sorted(ensure_indexes(db_engine)) == [
+        "ix_recommendations_user_created", "ix_user_interactions_user_product_created"
+    ]
+    assert ensure_indexes(db_engine) == []
+    assert "ix_user_interactions_product_created" in {
+        index["name"] for index in inspect(db_engine).get_indexes("user_interactions")
+    }
+
+    with db_engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        plan = connection.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM user_interactions WHERE user_id = 1"
+        )).all()
+    assert "ix_user_interactions_user_product_created" in " ".join(str(row) for row in plan)
+    db_engine.dispose()
+
+def test_als_ranks_products_of_the_same_taste_cluster():
+    """Folded-in users are scored against item factors learned from co-interaction"""
+    import numpy as np
+    from scipy import sparse
+    from als import ImplicitALS
+
+    rng = np.random.default_rng(1)
+    rows, cols = [], []
+    for user in range(20):
+        first_item = 0 if user < 10 else 5
+        for item in rng.choice(5, 3, replace=False):
+            rows.append(user)
+            cols.append(first_item + item)
+    weights = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(20, 10))
+    model = ImplicitALS.train(np.arange(100, 110), weights, factors=2)
+
+    recommended = model.recommend({100: 1.0, 101: 2.0}, {100, 101}, 3)
+    assert {product_id for product_id, _ in recommended} == {102, 103, 104}
+    assert [score for _, score in recommended] == sorted((score for _, score in recommended), reverse=True)
+    assert model.recommend({999: 1.0}, set(), 3) == []
+
+def test_als_is_blended_and_persisted(client, sample_products, tmp_path):
+    """ALS trains in the builder, contributes a weighted signal and reaches workers through the model store"""
+    from model_store import ModelStore
+
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.PURCHASE, 5.0),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 2, InteractionType.PURCHASE, None),
+        ("carol", 1, InteractionType.VIEW, None),
+    ])
+    builder = RecommendationEngine(als_weight=1.0, als_factors=2, model_store=ModelStore(str(tmp_path)))
+    built = builder.rebuild(db)
+    assert built.als is not None
+
+    alice_id = users["alice"].id
+    als_recs = builder._get_als_recommendations(alice_id, db, 5)
+    assert als_recs and products[0].id not in {rec['product_id'] for rec in als_recs}
+    recs = builder.get_recommendations(alice_id, db)
+    assert {rec.algorithm_type for rec in recs} & {'matrix_factorization', 'hybrid'}
+
+    # Serving workers never train ALS; they follow the store for the builder's factors
+    assert RecommendationEngine(als_weight=1.0, als_factors=2, train_als=False).rebuild(db).als is None
+    worker = RecommendationEngine(als_weight=1.0, als_factors=2, model_store=ModelStore(str(tmp_path)),
+                                  rebuild_locally=False, train_als=False)
+    assert worker.snapshot.als is not None
+    assert worker.get_recommendations(alice_id, db) == recs
+    # Without ALS enabled, the signal is left out
+    assert all(rec.algorithm_type != 'matrix_factorization'
+               for rec in RecommendationEngine(model_store=ModelStore(str(tmp_path))).get_recommendations(alice_id, db))
+    db.close()
+
+def test_ivf_index_search_add_and_reload(tmp_path):
+    """Probing every list is exact; fewer lists keep most neighbors; adds and reloads are searchable"""
+    import numpy as np
+    from scipy import sparse
+    from ann_index import IVFIndex
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, 16))
+    vectors = centers[rng.integers(0, 20, 2000)] + 0.1 * rng.standard_normal((2000, 16))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = np.arange(1000, 3000)
+    index = IVFIndex.build(ids, vectors, n_lists=20, nprobe=3)
+    queries = vectors[:50]
+
+    def exact(query, k):
+        top = np.argsort(-(vectors @ query), kind='stable')[:k]
+        return set(ids[top].tolist())
+
+    for query in queries:
+        assert {i for i, _ in index.search(query, 10, nprobe=20)} == exact(query, 10)
+    recall = np.mean([len({i for i, _ in index.search(q, 10)} & exact(q, 10)) / 10 for q in queries])
+    assert recall >= 0.9
+    assert 1000 not in {i for i, _ in index.search(queries[0], 10, exclude=[1000])}
+
+    index.add([5000], queries[:1] * 1.5)
+    assert index.search(queries[0], 1, nprobe=20)[0][0] == 5000
+    index.save(str(tmp_path / "ivf"))
+    loaded = IVFIndex.load(str(tmp_path / "ivf"))
+    assert len(loaded) == 2001 and loaded.nprobe == 3
+    for query in queries[:10]:
+        assert loaded.search(query, 5) == index.search(query, 5)
+
+    sparse_index = IVFIndex.build(ids, sparse.csr_matrix(vectors), n_lists=20)
+    assert {i for i, _ in sparse_index.search(queries[0], 10, nprobe=20)} == exact(queries[0], 10)
+
+def test_approximate_content_index_matches_exact_when_probing_all_lists():
+    """The IVF-based content build returns the exact neighbors at full nprobe"""
+    import numpy as np
+    from scipy import sparse
+    from sklearn.preprocessing import normalize
+
+    vectors = normalize(sparse.random(300, 50, density=0.1, random_state=0, dtype=np.float32, format='csr'))
+    product_ids = np.arange(1, 301)
+    exact = ContentSimilarityIndex.build(product_ids, vectors, k=5)
+    approximate = ContentSimilarityIndex.build_approximate(product_ids, vectors, k=5, n_lists=10, nprobe=10)
+    np.testing.assert_allclose(approximate.similarities, exact.similarities, rtol=1e-5)
+
+    fast = ContentSimilarityIndex.build_approximate(product_ids, vectors, k=5, n_lists=10, nprobe=3)
+    assert fast.neighbors.shape == exact.neighbors.shape
+    assert (fast.similarities <= exact.similarities + 1e-5).all()
+
+def test_engine_generates_candidates_through_ann(client, sample_products, tmp_path):
+    """Above the size threshold, content and ALS candidates come from IVF indexes"""
+    from model_store import ModelStore
+
+    db = next(override_get_db())
+    users, products = _seed_interactions(db, sample_products, [
+        ("alice", 0, InteractionType.PURCHASE, 5.0),
+        ("bob", 0, InteractionType.LIKE, None),
+        ("bob", 2, InteractionType.PURCHASE, None),
+        ("carol", 1, InteractionType.VIEW, None),
+    ])
+    alice_id = users["alice"].id
+    exact = RecommendationEngine(als_weight=1.0, als_factors=2, ann_min_items=None)
+    exact.rebuild(db)
+    store = ModelStore(str(tmp_path))
+    approximate = RecommendationEngine(als_weight=1.0, als_factors=2, ann_min_items=1, ann_nprobe=100,
+                                       model_store=store)
+    built = approximate.rebuild(db)
+    assert built.als.ann is not None
+    assert approximate.get_recommendations(alice_id, db) == exact.get_recommendations(alice_id, db)
+
+    worker = RecommendationEngine(als_weight=1.0, als_factors=2, ann_min_items=1, model_store=store)
+    assert worker.snapshot.als.ann.nprobe == 100
+    assert worker.get_recommendations(alice_id, db) == exact.get_recommendations(alice_id, db)
+    db.close()
+
+def test_synthetic_data_follows_power_law(tmp_path):
+    """A few products draw most interactions"""
+    from synthetic_data import generate_synthetic_data
+
+    db_engine = create_engine(f"sqlite:///{tmp_path / 'synthetic.db'}")
+    Base.metadata.create_all(bind=db_engine)
+    db = sessionmaker(bind=db_engine)()
+    assert generate_synthetic_data(db, n_users=50, n_products=200, n_interactions=5000) == {
+        'users': 50, 'products': 200, 'interactions': 5000
+    }
+    counts = sorted((count for _, count in db.query(
+        UserInteraction.product_id, func.count(UserInteraction.id)).group_by(UserInteraction.product_id)),
+        reverse=True)
+    assert sum(counts[:20]) > 0.5 * sum(counts)
+    assert db.query(Product).filter(Product.description.is_(None)).count() == 0
+    db.close()
+    db_engine.dispose()
+
+def test_benchmark_reports_stage_percentiles(tmp_path):
+    """The benchmark report is JSON with latency percentiles and SQL counts per stage"""
+    import json
+    from benchmark import compare, run_benchmark
+
+    report = run_benchmark(f"sqlite:///{tmp_path / 'bench.db'}", users=30, products=100,
+                           interactions=1000, samples=5)
+    json.dumps(report)
+    stages = report['results']['stages']
+    assert {'collaborative', 'content_based', 'popular', 'get_recommendations'} <= set(stages)
+    for stats in list(stages.values()) + list(report['results']['http'].values()):
+        assert stats['calls'] == 5
+        assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms']
+    assert stages['user_interactions']['sql_per_call'] == 1
+    assert report['results']['http']['recommendations_cached']['sql_per_call'] <= \
+        report['results']['http']['recommendations_computed']['sql_per_call']
+    assert report['meta']['users'] == 30 and report['peak_rss_bytes'] > 0
+    assert set(report['results']['serialization']) == {
+        'recommendations_response_model', 'recommendations_fast', 'products_response_model', 'products_fast'
+    }
+
+    slower = json.loads(json.dumps(report))
+    slower['results']['stages']['collaborative']['p95_ms'] *= 10
+    assert compare(slower, report, tolerance=0.2) == [
+        f"stages.collaborative: p95 {stages['collaborative']['p95_ms']:.2f}ms -> "
+        f"{slower['results']['stages']['collaborative']['p95_ms']:.2f}ms"
+    ]
+
+def test_metrics_report_stages_sql_and_cache_hits(client, auth_headers, sample_products):
+    """/metrics exposes per-stage timings, per-route SQL counts and cache hit rates"""
+    import metrics
+
+    computed_before = metrics.STAGE_SECONDS.count(stage='hydration')
+    client.get("/recommendations", headers=auth_headers)
+    client.get("/recommendations", headers=auth_headers)
+    assert metrics.STAGE_SECONDS.count(stage='hydration') == computed_before + 1
+    assert recommendation_cache.stats()['memory_hits'] >= 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert '# TYPE recommendation_stage_seconds histogram' in body
+    assert 'recommendation_stage_seconds_count{stage="serialization"}' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/recommendations",status="200"}' in body
+    assert 'http_request_db_queries_bucket{route="/recommendations",le="+Inf"}' in body
+    assert 'recommendation_cache_lookups_total{result="memory_hit"}' in body
+    assert 'interaction_queue_depth 0' in body
+
+    # SQL issued during a request is attributed to that request only
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    try:
+        db = TestingSessionLocal()
+        db.query(Product).all()
+        db.close()
+    finally:
+        metrics.current_request.reset(token)
+    assert stats.queries == 1 and stats.db_seconds > 0
+
+    # A failed statement leaves nothing behind on the pooled connection to skew later timings
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM no_such_table"))
+        connection.rollback()
+        time.sleep(0.05)
+        stats = metrics.RequestStats()
+        token = metrics.current_request.set(stats)
+        try:
+            connection.execute(text("SELECT 1"))
+        finally:
+            metrics.current_request.reset(token)
+        assert "query_started" not in connection.info
+    assert stats.queries == 1 and stats.db_seconds < 0.05
+
+def test_products_keyset_pagination_and_conditional_get(client, sample_products):
+    """Cursor pages cover the catalog once; unchanged catalogs answer 304 until a product changes"""
+    db = next(override_get_db())
+    for index in range(7):
+        db.add(Product(**{**sample_products[index % len(sample_products)], "name": f"Product {index}"}))
+    db.commit()
+    db.close()
+    catalog_version.invalidate()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor is not None else {})}
+        response = client.get("/products", params=params)
+        assert response.status_code == 200
+        seen += [product["id"] for product in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+        assert f"cursor={cursor}" in response.headers["link"]
+    assert seen == sorted(seen) and len(seen) == 7
+    assert [p["id"] for p in client.get("/products", params={"skip": 3, "limit": 3}).json()] == seen[3:6]
+
+    response = client.get("/products")
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+    assert client.get("/products", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/categories", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(f"/products/{seen[0]}", headers={"If-None-Match": '"catalog-0"'}).status_code == 200
+
+    db = next(override_get_db())
+    product = db.get(Product, seen[0])
+    product.price += 1
+    db.commit()
+    db.close()
+    response = client.get("/products", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+def test_catalog_reads_are_served_from_versioned_cache(client, sample_products):
+    """Warm catalog reads only query a page's ids, by index; a product write is visible on the next read"""
+    from sqlalchemy.engine import Engine
+
+    db = next(override_get_db())
+    for product_data in sample_products:
+        db.add(Product(**product_data))
+    db.commit()
+    product_id = db.query(Product.id).first()[0]
+    db.close()
+
+    page = f"/products?category=Electronics&cursor={product_id - 1}&limit=2"
+    paths = ["/categories", f"/products/{product_id}", page]
+    first = {path: client.get(path).json() for path in paths}
+    assert first[page]
+    statements = []
+    def count_statements(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+    event.listen(Engine, "before_cursor_execute", count_statements)
+    try:
+        assert {path: client.get(path).json() for path in paths} == first
+    finally:
+        event.remove(Engine, "before_cursor_execute", count_statements)
+    # The page's ids are one keyset seek on (category, id); bodies come from the cache
+    assert len(statements) == 1
+    statement, parameters = statements[0]
+    assert "products.id >" in statement and "LIMIT" in statement
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    # A seek on either category index (SQLite appends the rowid id to ix_products_category)
+    plan = " ".join(str(row) for row in plan)
+    assert re.search(r"SEARCH products USING COVERING INDEX ix_products_category\w* \(category=\? AND (row)?id>\?\)", plan)
+    assert first[f"/products/{product_id}"]["id"] == product_id
+
+    db = next(override_get_db())
+    db.add(Product(**{**sample_products[0], "name": "Garden hose", "category": "Garden"}))
+    db.get(Product, product_id).name = "Renamed"
+    db.commit()
+    db.close()
+    assert "Garden" in client.get("/categories").json()
+    assert client.get(f"/products/{product_id}").json()["name"] == "Renamed"
+    assert len(client.get("/products").json()) == len(sample_products) + 1
+
+def test_fast_serialization_matches_response_model(client, auth_headers, sample_products):
+    """Spliced JSON bytes decode to what response_model serialization produces"""
+    import json
+    from fastapi.encoders import jsonable_encoder
+    from schemas import RecommendationResponse
+    from serialization import products_json, recommendations_json
+
+    db = next(override_get_db())
+    for product_data in sample_products:
+        db.add(Product(**product_data))
+    db.commit()
+    products = list(recommendation_engine.product_cache.get_many([1, 2, 3], db).values())
+    recommendations = [
+        RecommendationResponse(product=products[0], score=0.75, algorithm_type="hybrid"),
+        RecommendationResponse(product=products[1], score=1 / 3, algorithm_type="content_based"),
+    ]
+    cached = recommendation_engine.product_cache.get_many_json([1], db)
+    db.close()
+
+    assert json.loads(recommendations_json(recommendations, cached)) == jsonable_encoder(recommendations)
+    assert json.loads(products_json(products)) == jsonable_encoder(products)
+    assert client.get("/products/popular").headers["content-type"] == "application/json"
+
+def test_catalog_import_streams_and_upserts_by_name(client, tmp_path):
+    """JSON, JSONL and CSV catalogs are upserted by name; re-imports only write changes"""
+    import csv
+    import json
+    from catalog_import import import_catalog_file
+
+    products = [
+        {"name": f"Item {i}", "category": "Books" if i % 2 else "Garden", "price": 10 + i,
+         "description": f"Item number {i}", "rating": 4.0, "rating_count": i}
+        for i in range(25)
+    ]
+    (tmp_path / "catalog.json").write_text(json.dumps({"categories": ["Books", "Garden"], "products": products}))
+    db = next(override_get_db())
+    stats = import_catalog_file(db, str(tmp_path / "catalog.json"), chunk_size=10)
+    assert (stats['read'], stats['inserted'], stats['updated']) == (25, 25, 0)
+    assert stats['rows_per_second'] > 0
+
+    changed = [{**products[0], "price": 99.5}, products[1], {"name": "Item 25", "category": "Books", "price": 1},
+               {"name": "no price", "category": "Books"}]
+    (tmp_path / "update.jsonl").write_text("\n".join(json.dumps(record) for record in changed) + "\n")
+    stats = import_catalog_file(db, str(tmp_path / "update.jsonl"))
+    assert (stats['inserted'], stats['updated'], stats['unchanged'], stats['rejected']) == (1, 1, 1, 1)
+
+    with open(tmp_path / "update.csv", "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(products[0]) + ["image_url"])
+        writer.writeheader()
+        writer.writerow({**products[2], "description": "Line one,\nline two", "image_url": ""})
+    stats = import_catalog_file(db, str(tmp_path / "update.csv"))
+    assert (stats['inserted'], stats['updated']) == (0, 1)
+
+    assert db.query(Product).count() == 26
+    assert db.query(Product).filter(Product.name == "Item 0").one().price == 99.5
+    assert db.query(Product).filter(Product.name == "Item 2").one().description == "Line one,\nline two"
+    db.close()
+    assert "Garden" in client.get("/categories").json()
+
+def test_data_utils_parses_once_and_reloads_on_change(tmp_path, monkeypatch):
+    """Mock data is parsed once, indexed by name and category, and re-read when the file changes"""
+    import json
+    import os
+    import data_utils
+
+    path = tmp_path / "mock_data.json"
+    products = [{"name": "Lamp", "category": "Home"}, {"name": "Mug", "category": "Home"},
+                {"name": "Novel", "category": "Books"}]
+    path.write_text(json.dumps({"categories": ["Home", "Books"], "products": products}))
+    monkeypatch.setattr(data_utils, "MOCK_DATA_PATH", str(path))
+    loads = []
+    real_load = json.load
+    monkeypatch.setattr(data_utils.json, "load", lambda file: loads.append(1) or real_load(file))
+
+    assert data_utils.get_product_by_name("Mug") == products[1]
+    assert [p["name"] for p in data_utils.get_products_by_category("Home")] == ["Lamp", "Mug"]
+    assert data_utils.get_categories_data() == ["Home", "Books"]
+    assert len(data_utils.get_products_data()) == 3
+    assert len(loads) == 1
+
+    path.write_text(json.dumps({"categories": ["Books"], "products": products[2:]}))
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+    assert data_utils.get_product_by_name("Mug") is None
+    assert len(loads) == 2
+    assert [p["name"] for p in data_utils.iter_products(str(path))] == ["Novel"]
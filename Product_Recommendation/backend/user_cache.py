@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from sqlalchemy import event
+
+from schemas import UserResponse
+
+
+class AuthenticatedUserCache:
+    """In-process LRU cache of verified bearer token -> user identity.
+
+    A hit skips both JWT verification and the user lookup. Entries live for
+    at most ``ttl`` seconds and never past the token's own ``exp``, so an
+    expired token is always rejected. ``watch`` drops a user's tokens when
+    the user row is updated or deleted through the ORM; bulk ``UPDATE`` /
+    ``DELETE`` statements bypass mapper events and are only bounded by the TTL.
+    """
+
+    def __init__(self, ttl: float = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        # token -> (expires_at, user)
+        self._entries: OrderedDict = OrderedDict()
+        # user_id -> tokens cached for that user
+        self._tokens: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[UserResponse]:
+        """The cached user for a token, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                expires_at, user = entry
+                if now < expires_at:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return user
+                self._forget(token)
+            self.misses += 1
+            return None
+
+    def put(self, token: str, user: UserResponse, token_expires_at: Optional[float] = None):
+        """Remember a user verified for a token until the TTL or the token's expiry, whichever is first"""
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._forget(token)
+            self._entries[token] = (expires_at, user)
+            self._tokens.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._forget(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached token of a user"""
+        with self._lock:
+            for token in list(self._tokens.get(user_id, ())):
+                self._forget(token)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._tokens.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Lookup counters and current size"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def watch(self, model):
+        """Invalidate a user's tokens whenever their ``model`` row is updated or deleted"""
+        def changed(mapper, connection, target):
+            self.invalidate_user(target.id)
+
+        event.listen(model, 'after_update', changed)
+        event.listen(model, 'after_delete', changed)
+
+    def _forget(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens.get(entry[1].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens[entry[1].id]
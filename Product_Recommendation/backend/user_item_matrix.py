@@ -0,0 +1,233 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy.orm import Session
+
+from models import UserInteraction, InteractionType
+from array_utils import rows_for_ids
+
+# Same weights the collaborative scorer applies per interaction
+INTERACTION_WEIGHTS = {
+    InteractionType.PURCHASE: 3.0,
+    InteractionType.LIKE: 2.0,
+    InteractionType.VIEW: 1.0,
+}
+
+
+def interaction_weight(interaction_type: InteractionType, rating: Optional[float]) -> float:
+    """Weight of a single interaction (type weight scaled by rating)"""
+    weight = INTERACTION_WEIGHTS.get(interaction_type, 1.0)
+    if rating:
+        weight *= rating / 5.0
+    return weight
+
+
+class UserItemMatrix:
+    """Sparse user x product interaction matrix for collaborative filtering.
+
+    Built from column-only reads of ``user_interactions`` and kept in CSR form,
+    with rows and columns in ascending user / product id order. Instances are
+    never modified after construction: new interactions are added with
+    ``with_delta`` (or merged by ``with_interactions``), which returns a new
+    matrix, so a reader always sees one consistent version.
+    """
+
+    def __init__(self, user_ids: np.ndarray, product_ids: np.ndarray, weights: sparse.csr_matrix,
+                 item_users: Optional[sparse.csr_matrix] = None,
+                 user_item_counts: Optional[np.ndarray] = None):
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+
+        # users x products, summed interaction weights
+        self.weights = weights
+        if item_users is None or user_item_counts is None:
+            binary = weights.copy()
+            binary.data = np.ones_like(binary.data)
+            item_users = binary.T.tocsr()
+            user_item_counts = np.diff(binary.indptr).astype(np.float32)
+        # products x users, 1.0 where the user interacted with the product
+        self.item_users = item_users
+        # number of distinct products per user
+        self.user_item_counts = user_item_counts
+
+    def user_row(self, user_id: int) -> Optional[int]:
+        """Row of a user, or None if the user has no interactions"""
+        row = rows_for_ids(self.user_ids, [user_id])[0]
+        return int(row) if row >= 0 else None
+
+    def product_column(self, product_id: int) -> Optional[int]:
+        """Column of a product, or None if nobody interacted with it"""
+        col = rows_for_ids(self.product_ids, [product_id])[0]
+        return int(col) if col >= 0 else None
+
+    @classmethod
+    def from_database(cls, db: Session, max_interaction_id: Optional[int] = None,
+                      batch_size: int = 50000) -> 'UserItemMatrix':
+        """Load (user_id, product_id, type, rating) columns and build the CSR matrix"""
+        user_col, product_col, weight_col = [], [], []
+        query = db.query(
+            UserInteraction.user_id,
+            UserInteraction.product_id,
+            UserInteraction.interaction_type,
+            UserInteraction.rating
+        )
+        if max_interaction_id is not None:
+            query = query.filter(UserInteraction.id <= max_interaction_id)
+
+        for user_id, product_id, interaction_type, rating in query.yield_per(batch_size):
+            user_col.append(user_id)
+            product_col.append(product_id)
+            weight_col.append(interaction_weight(interaction_type, rating))
+
+        return cls._from_triples(
+            np.asarray(user_col, dtype=np.int64),
+            np.asarray(product_col, dtype=np.int64),
+            np.asarray(weight_col, dtype=np.float32)
+        )
+
+    @classmethod
+    def _from_triples(cls, user_col: np.ndarray, product_col: np.ndarray,
+                      weight_col: np.ndarray) -> 'UserItemMatrix':
+        """Build from parallel (user_id, product_id, weight) arrays, summing duplicates"""
+        user_ids = np.unique(user_col)
+        product_ids = np.unique(product_col)
+        weights = sparse.csr_matrix(
+            (weight_col, (np.searchsorted(user_ids, user_col), np.searchsorted(product_ids, product_col))),
+            shape=(len(user_ids), len(product_ids))
+        )
+        return cls(user_ids, product_ids, weights)
+
+    def with_interactions(self, interactions: Iterable[Tuple[int, int, InteractionType, Optional[float]]]) -> 'UserItemMatrix':
+        """New matrix with (user_id, product_id, type, rating) interactions added"""
+        interactions = list(interactions)
+        if not interactions:
+            return self
+
+        existing = self.weights.tocoo()
+        return UserItemMatrix._from_triples(
+            np.concatenate([self.user_ids[existing.row],
+                            np.asarray([u for u, _, _, _ in interactions], dtype=np.int64)]),
+            np.concatenate([self.product_ids[existing.col],
+                            np.asarray([p for _, p, _, _ in interactions], dtype=np.int64)]),
+            np.concatenate([existing.data,
+                            np.asarray([interaction_weight(t, r) for _, _, t, r in interactions], dtype=np.float32)])
+        )
+
+    def with_delta(self, interactions: Iterable[Tuple[int, int, InteractionType, Optional[float]]]) -> 'Union[UserItemMatrix, DeltaUserItemMatrix]':
+        """This matrix plus interactions kept beside it, leaving its arrays untouched"""
+        interactions = list(interactions)
+        if not interactions:
+            return self
+        return DeltaUserItemMatrix(self, UserItemMatrix._empty().with_interactions(interactions))
+
+    @classmethod
+    def _empty(cls) -> 'UserItemMatrix':
+        return cls._from_triples(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                                 np.empty(0, dtype=np.float32))
+
+    def similar_users(self, user_id: int, user_products: Set[int],
+                      top_k: int = 10, min_similarity: float = 0.1) -> List[Tuple[int, float]]:
+        """Top-k users by Jaccard similarity to the given product set"""
+        columns = rows_for_ids(self.product_ids, user_products)
+        columns = columns[columns >= 0]
+        if not len(columns) or self.item_users.shape[1] == 0:
+            return []
+
+        # One sparse product gives the intersection size with every user
+        query = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), ([0] * len(columns), columns)),
+            shape=(1, self.item_users.shape[0])
+        )
+        intersection = (query @ self.item_users).toarray().ravel()
+        union = self.user_item_counts + len(user_products) - intersection
+        similarity = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+        own_row = self.user_row(user_id)
+        if own_row is not None:
+            similarity[own_row] = 0.0
+
+        candidates = np.flatnonzero(similarity > min_similarity)
+        if len(candidates) > top_k:
+            top = np.argpartition(-similarity[candidates], top_k - 1)[:top_k]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-similarity[candidates], kind='stable')]
+
+        return [(int(self.user_ids[row]), float(similarity[row])) for row in candidates]
+
+    def score_products(self, similar_users: Iterable[Tuple[int, float]],
+                       exclude_products: Set[int]) -> Dict[int, float]:
+        """Sum of similarity-weighted interactions of similar users per product"""
+        similar_users = list(similar_users)
+        rows = rows_for_ids(self.user_ids, (uid for uid, _ in similar_users))
+        sims = np.asarray([sim for _, sim in similar_users], dtype=np.float32)[rows >= 0]
+        rows = rows[rows >= 0]
+        if not len(rows):
+            return {}
+
+        scores = np.asarray(sims @ self.weights[rows]).ravel()
+
+        excluded = rows_for_ids(self.product_ids, exclude_products)
+        scores[excluded[excluded >= 0]] = 0.0
+
+        nonzero = np.flatnonzero(scores)
+        return {int(self.product_ids[col]): float(scores[col]) for col in nonzero}
+
+
+class DeltaUserItemMatrix:
+    """A read-only UserItemMatrix plus a small one of interactions tracked since it was built.
+
+    Merging with ``with_interactions`` rebuilds the whole CSR matrix, and for
+    snapshots loaded from a model store it would give every worker a private
+    copy of memory-mapped or shared-memory arrays. Instead the base is only
+    read, and the delta is combined with it at query time. Weights add up, so scores match those
+    of the merged matrix; users the delta touched are compared on their
+    combined product sets. The next full rebuild compacts both into a new
+    matrix.
+    """
+
+    def __init__(self, base: UserItemMatrix, delta: UserItemMatrix):
+        self.base = base
+        self.delta = delta
+        # user_id -> products across base and delta, for every user in the delta
+        self._user_products: Dict[int, Set[int]] = {}
+        for row, user_id in enumerate(delta.user_ids.tolist()):
+            start, end = delta.weights.indptr[row], delta.weights.indptr[row + 1]
+            products = set(delta.product_ids[delta.weights.indices[start:end]].tolist())
+            base_row = base.user_row(user_id)
+            if base_row is not None:
+                start, end = base.weights.indptr[base_row], base.weights.indptr[base_row + 1]
+                products.update(base.product_ids[base.weights.indices[start:end]].tolist())
+            self._user_products[user_id] = products
+
+    def with_delta(self, interactions: Iterable[Tuple[int, int, InteractionType, Optional[float]]]) -> 'DeltaUserItemMatrix':
+        """Same base, with interactions added to the delta"""
+        return DeltaUserItemMatrix(self.base, self.delta.with_interactions(interactions))
+
+    def similar_users(self, user_id: int, user_products: Set[int],
+                      top_k: int = 10, min_similarity: float = 0.1) -> List[Tuple[int, float]]:
+        """Top-k users by Jaccard similarity to the given product set"""
+        user_products = set(user_products)
+        # Base scores of users the delta touched are stale; they may take up to that many of the top slots
+        candidates = [
+            (other_id, similarity) for other_id, similarity in
+            self.base.similar_users(user_id, user_products, top_k + len(self._user_products), min_similarity)
+            if other_id not in self._user_products
+        ]
+        for other_id, products in self._user_products.items():
+            if other_id == user_id:
+                continue
+            union = len(user_products | products)
+            similarity = len(user_products & products) / union if union else 0.0
+            if similarity > min_similarity:
+                candidates.append((other_id, similarity))
+        return sorted(candidates, key=lambda candidate: candidate[1], reverse=True)[:top_k]
+
+    def score_products(self, similar_users: Iterable[Tuple[int, float]],
+                       exclude_products: Set[int]) -> Dict[int, float]:
+        """Sum of similarity-weighted interactions of similar users per product"""
+        similar_users = list(similar_users)
+        scores = self.base.score_products(similar_users, exclude_products)
+        for product_id, score in self.delta.score_products(similar_users, exclude_products).items():
+            scores[product_id] = scores.get(product_id, 0.0) + score
+        return scores